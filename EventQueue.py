@@ -0,0 +1,176 @@
+"""
+ EventQueue
+
+ Design:
+
+ The purpose of this file is to decouple the event generators (sendEvent,
+ port callbacks, periodic events) from the statechart thread that
+ dispatches the events.
+  - deque backed, put and get are O(1) regardless of backlog
+  - the consumer waits on a condition rather than spinning on a lock,
+    an idle statechart uses no cpu
+  - an optional bound applies backpressure, producers wait (or are
+    refused) while the queue is full
+  - the consumer drains events in batches, one lock round trip per batch
+
+ ---------------------------------------------
+
+ class EventQueue:
+  functions:
+    put                     - append an event, waits while queue is full
+    put_many                - append a list of events under one lock
+    get_batch               - waits for events, removes up to a batch of them
+    wait_below              - waits until fewer than count events are queued
+    close                   - refuses further events, wakes all waiters
+
+"""
+
+import time
+import threading
+from collections import deque
+
+class EventQueue(object):
+
+  def __init__(self, maxlen=None, batch=64):
+    if (maxlen != None) and (maxlen <= 0):   # 0 in the design file means unbounded
+      maxlen = None
+    self.maxlen    = maxlen                  # None is unbounded
+    self.batch     = batch                   # default events per get_batch
+    self.events    = deque()                 # the queue
+    self.lock      = threading.Lock()        # one lock, two conditions
+    self.not_empty = threading.Condition(self.lock)
+    self.not_full  = threading.Condition(self.lock)
+    self.closed    = False                   # set on shutdown
+    self.refused   = 0                       # events not queued (full or closed)
+  # end __init__
+  #-----------------------------------------------------------------
+  def __len__(self):
+    return len(self.events)
+  # end __len__
+  #-----------------------------------------------------------------
+  def _wait_not_full(self, count, block, timeout):
+    #
+    # called with the lock held, returns False if there is
+    # no room for count events before the timeout
+    #
+    if (self.maxlen == None):
+      return True
+    deadline = None
+    if (timeout != None):
+      deadline = time.time() + timeout
+    while (not self.closed) and (len(self.events) + count > self.maxlen):
+      if (not block):
+        return False
+      if (deadline == None):
+        self.not_full.wait()
+      else:
+        remaining = deadline - time.time()
+        if (remaining <= 0):
+          return False
+        self.not_full.wait(remaining)
+    return True
+  # end _wait_not_full
+  #-----------------------------------------------------------------
+  def put(self, event, block=True, timeout=None):
+    #
+    # returns True if queued, False if refused
+    #
+    self.lock.acquire()
+    try:
+      if (not self._wait_not_full(1, block, timeout)) or self.closed:
+        self.refused += 1
+        return False
+      self.events.append(event)
+      self.not_empty.notify()
+      return True
+    finally:
+      self.lock.release()
+  # end put
+  #-----------------------------------------------------------------
+  def put_many(self, events, block=True, timeout=None):
+    #
+    # all or nothing, a batch larger than the bound is queued
+    # once the queue has drained
+    #
+    events = list(events)
+    count = len(events)
+    if (self.maxlen != None):
+      count = min(count, self.maxlen)
+    self.lock.acquire()
+    try:
+      if (not self._wait_not_full(count, block, timeout)) or self.closed:
+        self.refused += len(events)
+        return False
+      self.events.extend(events)
+      self.not_empty.notify()
+      return True
+    finally:
+      self.lock.release()
+  # end put_many
+  #-----------------------------------------------------------------
+  def get_batch(self, max_items=None, timeout=None):
+    #
+    # waits until at least one event is queued, the timeout expires
+    # or the queue is closed, returns a (possibly empty) list of events
+    #
+    if (max_items == None):
+      max_items = self.batch
+    self.lock.acquire()
+    try:
+      deadline = None
+      if (timeout != None):
+        deadline = time.time() + timeout
+      while (not self.events) and (not self.closed):
+        if (deadline == None):
+          self.not_empty.wait()
+        else:
+          remaining = deadline - time.time()
+          if (remaining <= 0):
+            break
+          self.not_empty.wait(remaining)
+      batch = []
+      popleft = self.events.popleft
+      while self.events and (len(batch) < max_items):
+        batch.append(popleft())
+      if batch:                            # producers and wait_below
+        self.not_full.notify_all()
+      return batch
+    finally:
+      self.lock.release()
+  # end get_batch
+  #-----------------------------------------------------------------
+  def wait_below(self, count, timeout=None):
+    #
+    # flow control for producers that read ahead (e.g. a message consumer),
+    # returns True once fewer than count events are queued
+    #
+    self.lock.acquire()
+    try:
+      deadline = None
+      if (timeout != None):
+        deadline = time.time() + timeout
+      while (not self.closed) and (len(self.events) >= count):
+        if (deadline == None):
+          self.not_full.wait()
+        else:
+          remaining = deadline - time.time()
+          if (remaining <= 0):
+            break
+          self.not_full.wait(remaining)
+      return len(self.events) < count
+    finally:
+      self.lock.release()
+  # end wait_below
+  #-----------------------------------------------------------------
+  def close(self):
+    self.lock.acquire()
+    try:
+      self.closed = True
+      self.not_empty.notify_all()
+      self.not_full.notify_all()
+    finally:
+      self.lock.release()
+  # end close
+
+#end class EventQueue
+#-----------------------------------------------------------------
@@ -3,28 +3,32 @@
 #                         listens to queue for events
 #
 #
-from KThread import *                # killable threads
+from Worker import Worker            # cooperative stop, no tracer
 from scbObjects import *             # converts event id to its name
 import EventLogger as EL             # bespoke instead of python logger
-class StatechartThread(KThread):
+class StatechartThread(Worker):
     def __init__(self, interface):
-        KThread.__init__(self)       # thread init
+        Worker.__init__(self, name="StatechartThread")
         self.interface = interface   # link to statechart 
-        self.running = False
+    def wake(self):
+        self.interface.events.close()  # wakes the blocked get_batch
     def run(self):
         interface = self.interface
-        self.running = True
+        statechart = interface.statechart
         try:
-          while self.running:         # acquire mutex to critical region
-            event = None
-            while (not interface.lock.acquire(False) and self.running):
-              pass
-            if (not self.running):    # someone somewhere sent a shutdown
-              break
-            if len(interface.events):              # if event
-                event = interface.events.pop(0)    # get event
-            interface.lock.release()               # exit mutex
-            if event:
+          while not self.stopping():  # blocks while the queue is empty
+            batch = interface.events.get_batch()
+            for event in batch:
+              if self.stopping():     # someone somewhere sent a shutdown
+                break
+              #
+              #         events no active state has a transition on
+              #         are dropped (counted) before they are logged
+              #
+              if not statechart.relevant(event):
+                statechart.runtime.note_dropped()
+                interface.registry.release(event)
+                continue
               #
               #         printing events is useful for debugging
               #         but high-rate events become noise
@@ -37,21 +41,21 @@ class StatechartThread(KThread):
               #
               # convert the event as integer into event as
               # enumerated type, class and element
-              # (evo = EVent Object, defined in the design file)
+              # (evx = EVent indeX, compiled from the design file events)
               #
-              m_f, evStr = EventObject.idToEvent(interface.evo,event)
+              m_f, evStr = interface.evx.idToEvent(event.id)
               if m_f:
                 info_text = "event dispatch: %s" % (evStr)
               else:
                 info_text = "unrecognized event id: %d" % (event.id)
               self.log(info_text,print_f)
-              interface.statechart.dispatch(event)
-              event = None
+              statechart.dispatch(event)
+              interface.registry.release(event)  # recycled, see EventRegistry
         finally:
           print "Statechart thread stopped"
-    def shutdown(self):
-        self.running = False
-        self.kill()                  # kill defined in KThread
+    def shutdown(self, timeout=5.0):
+        if not Worker.shutdown(self, timeout):
+          print "Statechart thread did not stop within %s seconds" % timeout
     def log(self,datum, print_f):
         interface=self.interface
         if (interface.txtlog != None):
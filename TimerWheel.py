@@ -0,0 +1,361 @@
+"""
+ TimerWheel
+
+ Design:
+
+ The purpose of this file is to schedule timed events (one-shot timeouts
+ and periodic events) for many statecharts from a single thread.
+  - hierarchical timing wheel, each level has 'slots' buckets and covers
+    'slots' times the span of the level below it. Scheduling and
+    cancelling are O(1), a timer is cascaded at most 'levels' times
+  - deadlines are absolute, a periodic timer advances its deadline by
+    its period rather than sleeping for it, so the schedule does not drift
+  - a timer may be owned, e.g. by a state of a statechart runtime; all
+    the timers of an owner are cancelled together (O(1) per timer). A
+    StateTimers listener on a runtime cancels the timers of a state when
+    the state is deactivated
+  - expired timers call their sink, queueSink feeds the event queue of
+    a generated statechart directly
+
+ ---------------------------------------------
+
+ class Timer:                       - one scheduled event, returned by schedule
+ class TimerWheel:
+  functions:
+    schedule                - one-shot or periodic timer, optionally owned
+    cancel                  - cancel a timer
+    cancel_owner            - cancel all the timers of an owner
+    advance                 - fire the timers due by now (loop driven use)
+    start                   - starts the thread that drives the wheel
+    shutdown                - stops the thread
+ class StateTimers:                 - runtime listener, binds timers to states
+ functions:
+    queueSink               - sink that puts events in a statechart queue
+    defaultWheel            - shared, started, wheel
+
+"""
+
+import time
+import threading
+from Worker import Worker
+
+#-----------------------------------------------------------------
+# Timer
+#        purpose: one scheduled event
+#
+class Timer(object):
+
+  __slots__ = ('deadline', 'expiry', 'period', 'count', 'sink',
+               'event_id', 'event_data', 'owner', 'bucket', 'paused')
+
+  def __init__(self, deadline, period, count, sink, event_id, event_data, owner):
+    self.deadline   = deadline      # absolute time of the next expiry
+    self.expiry     = 0             # deadline as a wheel tick
+    self.period     = period        # None for a one-shot timer
+    self.count      = count         # remaining expiries, None is forever
+    self.sink       = sink          # called as sink(event_id, event_data)
+    self.event_id   = event_id
+    self.event_data = event_data
+    self.owner      = owner         # cancelled with its owner
+    self.bucket     = None          # the wheel bucket, None once cancelled
+    self.paused     = False         # paused timers keep time but do not fire
+  # end __init__
+
+  def active(self):
+    return self.bucket != None
+  # end active
+#end class Timer
+#-----------------------------------------------------------------
+#
+# TimerWheel
+#
+class TimerWheel(object):
+
+  def __init__(self, tick=0.01, slots=256, levels=4):
+    assert (slots & (slots - 1)) == 0, "slots must be a power of 2"
+    self.tick_len = tick                     # seconds per tick
+    self.bits     = slots.bit_length() - 1   # index bits per level
+    self.mask     = slots - 1
+    self.levels   = levels
+    self.span     = slots ** levels          # ticks covered by the wheel
+    self.wheel    = [[set() for ii in range(slots)] for jj in range(levels)]
+    self.origin   = time.time()              # time of tick 0
+    self.tick     = 0                        # last processed tick
+    self.count    = 0                        # scheduled timers
+    self.owners   = {}                       # owner -> set of timers
+    self.lock     = threading.Lock()
+    self.wakeup   = threading.Condition(self.lock)
+    self.thread   = None                     # the Worker driving the wheel
+  # end __init__
+  #-----------------------------------------------------------------
+  def __len__(self):
+    return self.count
+  # end __len__
+  #-----------------------------------------------------------------
+  def _now_tick(self, now):
+    return int((now - self.origin) / self.tick_len)
+  # end _now_tick
+  #-----------------------------------------------------------------
+  def _place(self, timer, expiry):
+    #
+    # called with the lock held, expiry must not be before the
+    # tick being processed
+    #
+    delta = expiry - self.tick
+    if (delta >= self.span):                 # beyond the wheel, cascaded
+      expiry = self.tick + self.span - 1     # again on the way down
+      delta = self.span - 1
+    level = 0
+    while (delta >> (self.bits * (level + 1))) > 0:
+      level += 1
+    bucket = self.wheel[level][(expiry >> (self.bits * level)) & self.mask]
+    bucket.add(timer)
+    timer.bucket = bucket
+  # end _place
+  #-----------------------------------------------------------------
+  def _insert(self, timer):
+    ticks = (timer.deadline - self.origin) / self.tick_len
+    expiry = int(ticks)
+    if (expiry < ticks):                     # never fire early
+      expiry += 1
+    timer.expiry = max(expiry, self.tick + 1)
+    self._place(timer, timer.expiry)
+  # end _insert
+  #-----------------------------------------------------------------
+  def _remove(self, timer):
+    if (timer.bucket == None):
+      return False
+    timer.bucket.discard(timer)
+    timer.bucket = None
+    self.count -= 1
+    if (timer.owner != None):
+      owned = self.owners.get(timer.owner)
+      if (owned != None):
+        owned.discard(timer)
+        if (not owned):
+          del self.owners[timer.owner]
+    return True
+  # end _remove
+  #-----------------------------------------------------------------
+  def schedule(self, delay, sink, event_id, event_data=None,
+               period=None, count=None, owner=None, deadline=None):
+    #
+    # fires after delay seconds (or at the absolute deadline), then
+    # every period seconds if a period is given, at most count times
+    #
+    if (deadline == None):
+      deadline = time.time() + delay
+    timer = Timer(deadline, period, count, sink, event_id, event_data, owner)
+    self.lock.acquire()
+    try:
+      if (self.count == 0):                  # idle wheel, skip the gap
+        self.tick = max(self.tick, self._now_tick(time.time()))
+      self._insert(timer)
+      self.count += 1
+      if (owner != None):
+        self.owners.setdefault(owner, set()).add(timer)
+      self.wakeup.notify()
+    finally:
+      self.lock.release()
+    return timer
+  # end schedule
+  #-----------------------------------------------------------------
+  def cancel(self, timer):
+    self.lock.acquire()
+    try:
+      return self._remove(timer)
+    finally:
+      self.lock.release()
+  # end cancel
+  #-----------------------------------------------------------------
+  def cancel_owner(self, owner):
+    self.lock.acquire()
+    try:
+      owned = self.owners.pop(owner, None)
+      if (owned == None):
+        return 0
+      for timer in owned:
+        timer.owner = None                   # already out of owners
+        self._remove(timer)
+      return len(owned)
+    finally:
+      self.lock.release()
+  # end cancel_owner
+  #-----------------------------------------------------------------
+  def _expire(self, tick, expired):
+    #
+    # called with the lock held, processes one tick: cascades the
+    # higher levels whose lower bits wrapped, then takes the bucket
+    #
+    self.tick = tick
+    level = 1
+    while (level < self.levels) and \
+          ((tick & ((1 << (self.bits * level)) - 1)) == 0):
+      index = (tick >> (self.bits * level)) & self.mask
+      bucket = self.wheel[level][index]
+      self.wheel[level][index] = set()
+      for timer in bucket:
+        self._place(timer, timer.expiry)
+      level += 1
+    index = tick & self.mask
+    bucket = self.wheel[0][index]
+    if bucket:
+      self.wheel[0][index] = set()
+      for timer in bucket:
+        timer.bucket = None
+        self.count -= 1
+        expired.append(timer)
+        self._rearm(timer)
+  # end _expire
+  #-----------------------------------------------------------------
+  def _rearm(self, timer):
+    if (timer.period == None) or (timer.paused == False and
+                                  timer.count != None and timer.count <= 1):
+      if (timer.owner != None):              # done, drop the ownership
+        owned = self.owners.get(timer.owner)
+        if (owned != None):
+          owned.discard(timer)
+          if (not owned):
+            del self.owners[timer.owner]
+      return
+    if (timer.count != None) and (not timer.paused):
+      timer.count -= 1
+    timer.deadline += timer.period           # absolute, no drift
+    self._insert(timer)
+    self.count += 1
+  # end _rearm
+  #-----------------------------------------------------------------
+  def advance(self, now=None):
+    #
+    # fires the timers due by now, returns the number fired
+    #
+    if (now == None):
+      now = time.time()
+    expired = []
+    self.lock.acquire()
+    try:
+      target = self._now_tick(now)
+      if (self.count == 0):
+        self.tick = max(self.tick, target)
+      while self.tick < target:
+        self._expire(self.tick + 1, expired)
+    finally:
+      self.lock.release()
+    #
+    # sinks run without the lock, a timer cancelled meanwhile
+    # may still fire this once
+    #
+    fired = 0
+    for timer in expired:
+      if (not timer.paused):
+        timer.sink(timer.event_id, timer.event_data)
+        fired += 1
+    return fired
+  # end advance
+  #-----------------------------------------------------------------
+  def next_deadline(self):
+    #
+    # time of the next tick, None when nothing is scheduled
+    #
+    if (self.count == 0):
+      return None
+    return self.origin + (self.tick + 1) * self.tick_len
+  # end next_deadline
+  #-----------------------------------------------------------------
+  def run(self):
+    thread = self.thread
+    self.lock.acquire()
+    try:
+      while not thread.stopping():
+        deadline = self.next_deadline()
+        if (deadline == None):
+          self.wakeup.wait()
+        else:
+          remaining = deadline - time.time()
+          if (remaining > 0):
+            self.wakeup.wait(remaining)
+        if thread.stopping():
+          break
+        self.lock.release()
+        try:
+          self.advance()
+        finally:
+          self.lock.acquire()
+    finally:
+      self.lock.release()
+  # end run
+  #-----------------------------------------------------------------
+  def wake(self):
+    self.lock.acquire()
+    try:
+      self.wakeup.notify_all()
+    finally:
+      self.lock.release()
+  # end wake
+  #-----------------------------------------------------------------
+  def start(self):
+    self.thread = Worker(name="TimerWheel", target=self.run, wake=self.wake)
+    self.thread.daemon = True
+    self.thread.start()
+  # end start
+  #-----------------------------------------------------------------
+  def shutdown(self, timeout=1.0):
+    if (self.thread != None):
+      return self.thread.shutdown(timeout)
+    return True
+  # end shutdown
+
+#end class TimerWheel
+#-----------------------------------------------------------------
+#
+# StateTimers
+#           purpose: timers that live as long as a state is active,
+#                    added as a listener to a statechart runtime
+#
+class StateTimers(object):
+
+  def __init__(self, wheel, runtime):
+    self.wheel = wheel
+    self.runtime = runtime
+    runtime.add_listener(self)
+  # end __init__
+
+  def schedule(self, state, delay, sink, event_id, event_data=None,
+               period=None, count=None):
+    return self.wheel.schedule(delay, sink, event_id, event_data,
+                               period, count, owner=(self.runtime, state))
+  # end schedule
+
+  def state_deactivated(self, runtime, state):
+    self.wheel.cancel_owner((runtime, state))
+  # end state_deactivated
+#end class StateTimers
+#-----------------------------------------------------------------
+#
+# queueSink
+#          purpose: sink for the timers of a generated statechart, the
+#                   events bypass sendEvent and go straight to the queue
+#
+def queueSink(interface):
+  registry = interface.registry
+  events = interface.events
+  def sink(event_id, event_data):
+    events.put(registry.event(event_id, event_data))
+  return sink
+# end queueSink
+#-----------------------------------------------------------------
+_default_wheel = None
+_default_lock = threading.Lock()
+
+def defaultWheel():
+  global _default_wheel
+  _default_lock.acquire()
+  try:
+    if (_default_wheel == None):
+      _default_wheel = TimerWheel()
+      _default_wheel.start()
+    return _default_wheel
+  finally:
+    _default_lock.release()
+# end defaultWheel
+#-----------------------------------------------------------------
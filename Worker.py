@@ -0,0 +1,105 @@
+"""
+ Worker
+
+ Design:
+
+ The purpose of this file is to stop threads without KThread. KThread
+ kills a thread by installing sys.settrace and checking a flag on every
+ line the thread executes, which slows down all the code of the thread,
+ statechart actions included.
+  - cancellation is cooperative, a worker checks its stop token between
+    work items; a worker blocked in a wait (a queue, a condition) is
+    woken by its wake function when it is stopped
+  - no trace function, no per-line overhead
+  - shutdown joins with a bound, a worker that does not stop in time is
+    reported rather than waited on forever
+
+ ---------------------------------------------
+
+ class StopToken:
+  functions:
+    stop                    - request the stop
+    stopped                 - True once the stop was requested
+    wait                    - waits for the stop, with an optional timeout
+
+ class Worker(threading.Thread):
+  functions:
+    stopping                - True once the stop was requested
+    stop                    - requests the stop and wakes the worker
+    wake                    - unblocks the worker, override or pass wake=
+    shutdown                - stop, then join with a timeout
+    kill                    - same as stop, for former KThread users
+
+"""
+
+import threading
+
+#-----------------------------------------------------------------
+# StopToken
+#           purpose: shared flag a worker checks at its waits
+#
+class StopToken(object):
+
+  def __init__(self):
+    self.event = threading.Event()
+  # end __init__
+
+  def stop(self):
+    self.event.set()
+  # end stop
+
+  def stopped(self):
+    return self.event.is_set()
+  # end stopped
+
+  def wait(self, timeout=None):
+    self.event.wait(timeout)
+    return self.event.is_set()
+  # end wait
+#end class StopToken
+#-----------------------------------------------------------------
+#
+# Worker
+#
+class Worker(threading.Thread):
+
+  def __init__(self, name=None, target=None, args=(), kwargs=None,
+               token=None, wake=None):
+    threading.Thread.__init__(self, name=name, target=target,
+                              args=args, kwargs=kwargs)
+    if (token == None):
+      token = StopToken()
+    self.token = token                 # may be shared by several workers
+    self.wake_function = wake          # unblocks the waits of the worker
+  # end __init__
+  #-----------------------------------------------------------------
+  def stopping(self):
+    return self.token.stopped()
+  # end stopping
+  #-----------------------------------------------------------------
+  def wake(self):
+    if (self.wake_function != None):
+      self.wake_function()
+  # end wake
+  #-----------------------------------------------------------------
+  def stop(self):
+    self.token.stop()
+    self.wake()
+  # end stop
+  #-----------------------------------------------------------------
+  def shutdown(self, timeout=5.0):
+    #
+    # returns True if the worker has stopped
+    #
+    self.stop()
+    if (self.is_alive() and (threading.current_thread() is not self)):
+      self.join(timeout)
+    return not self.is_alive()
+  # end shutdown
+  #-----------------------------------------------------------------
+  def kill(self):
+    self.stop()
+  # end kill
+
+#end class Worker
+#-----------------------------------------------------------------
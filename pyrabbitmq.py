@@ -8,15 +8,30 @@ import string 			# atoi
 import signal 			# os signals
 import time   			# sleep, time
 import os     			# pid
-from KThread import *  		# killable thread
 import re     			# regular expressions
 import uuid   			# for unique users
 import readline     		# command line editing
 from threading import Lock 	# thread Lock
 from threading import Event 	# thread Event
+from threading import Condition # LocalBroker
+import threading                # ChannelPool thread local channels
+from collections import deque   # Consumer buffer, LocalBroker queues
+from TimerWheel import defaultWheel # flush deadlines of BufferedPublisher
+from Worker import Worker       # Consumer and Subscribe threads
+from Worker import StopToken    # Subscribe stop, shared with its Event
 
 import amqplib.client_0_8 as amqp
 
+#
+# channel.wait(timeout) raises amqp.Timeout in the patched amqplib,
+# the socket's timeout otherwise
+#
+try:
+  WaitTimeout = amqp.Timeout
+except AttributeError:
+  import socket
+  WaitTimeout = socket.timeout
+
 #------------------------------------------------------
 #
 #
@@ -31,15 +46,41 @@ import amqplib.client_0_8 as amqp
 #   ConfigureList
 #   SimplePut
 #   Put
+#   _route
+#   PutMany
 #   SimpleGet
 #   _queue2chobj
 #   Get
+#   ConfigureAck
+#   Ack
+#   AckMany
+#   FlushAcks
 #   _mycallback
 #   _SimpleSubscribeThread
 #   _SubscribeThread
 #   SimpleSubscribe
+#   ConfigureQos
+#   Consume
+#   ConfigurePool
 #   SimpleUnsubscribe
 #   SimpleClose
+#  class ChannelPool
+#   channel
+#   publish
+#   invalidate
+#   close
+#  class BufferedPublisher
+#   Put
+#   Flush
+#   Close
+#  class Consumer
+#   start
+#   shutdown
+#  class LocalBroker
+#   channel
+#   bind
+#   close
+#  class LocalChannel
 # ConnectPutGetClose
 #
 
@@ -59,7 +100,11 @@ class ExceptionString(Exception):
 #-----------------------------------------------------------
 
 class CommObject():
-  def __init__(self, host='localhost', userid='guest', password='guest'): 
+  def __init__(self, host='localhost', userid='guest', password='guest',
+               connect=None): 
+    #
+    # connect returns the connection instead of _connect (e.g. a LocalBroker)
+    #
     self.error = False
     self.debug = False
     self.host = host
@@ -67,6 +112,10 @@ class CommObject():
     self.password = password        
     self.configList = []            # scalable config for rabbitmq
     self.chanList = []              # [id,obj] ordered pairs
+    self.chanMap = {}               # channel id -> channel object
+    self.queueMap = {}              # queue -> channel id
+    self.exchangeMap = {}           # exchange -> (channel id, routing key)
+    self.pool = None                # ChannelPool of the publishers, see ConfigurePool
     self.lockObj = Lock()           # used for thread safety
     self.thread_params = list()     # used for passing params into thread
        
@@ -76,11 +125,17 @@ class CommObject():
     self.mykey = 'myq.myx'
     self.running = False
     self.subscribe = None # self.subscribe.start() to start thread for listening on exchange
+    self.routes = {}                # exchange -> (channel object, routing key)
+    self.acks = {}                  # channel id -> [channel, last tag, count, first time]
+    self.ack_every = 1              # deliveries per ack, see ConfigureAck
+    self.ack_interval = 0.0         # seconds, 0 is no deadline
+    self.prefetch_count = 0         # unacked deliveries per consumer, 0 is unlimited
+    self.prefetch_size = 0
  
+    if (connect != None):
+      self._connect = connect
     try:     
-      self.connection = amqp.Connection(userid=self.userid, 
-                           password=self.password, host=self.host,
-                           virtualhost='/', ssl=False)
+      self.connection = self._connect()
     except Exception as eobj:
       print eobj
       print "Is the server running? (sh rabbitmq-server-2.1.1/scripts/rabbitmq-server)"
@@ -90,6 +145,15 @@ class CommObject():
       #
       
   # end __init__ 
+  #-----------------------------------------------------------
+  #
+  # private
+  #
+  def _connect(self):
+    return amqp.Connection(userid=self.userid, 
+                           password=self.password, host=self.host,
+                           virtualhost='/', ssl=False)
+  # end _connect
   #-----------------------------------------------------------   
   def SimpleConfigure(self):  
     try:
@@ -162,17 +226,9 @@ class CommObject():
   def _getChannelObject(self,channelList,chid):
     # channelList format:
     #   [ [<channel-id>, <channelObject>] ]
-    ii = 0
-    while (ii<len(channelList)):
-      chpair = channelList[ii]
-      if (chid == chpair[0]):
-        return chpair[1]
-      
-      ii = ii+1
-      
-      #end while 
-      
-    return None
+    # looked up in self.chanMap, which Configure keeps alongside
+    #
+    return self.chanMap.get(chid)
   #end _getChannelObject
   #-----------------------------------------------------------
  
@@ -262,6 +318,14 @@ class CommObject():
       self.chanList = self.chanList + [ newElement ] # building list of lists
       
       self.configList = self.configList + [ config ] # building list of lists
+      self.routes = {}                               # resolved again on next Put
+      #
+      # keyed lookups of the lists, first configuration wins as in the searches
+      #
+      self.chanMap.setdefault(config[0], chobj)
+      self.exchangeMap.setdefault(config[1], (config[0], config[4]))
+      if (config[3] != None):
+        self.queueMap.setdefault(config[3], config[0])
       
     return err_f
     
@@ -339,46 +403,69 @@ class CommObject():
       routing_key = self.mykey    # routing key is used for 'direct' exchanges
       ch_obj = self.channel
     else:
-       # search the configure list for exchange, match index yields channel id and routing_key
-       # search the channel list for channel id, match yields channel object
-       
-       # there are many ways for this function to fail by
-       # passing in bad parameters
-       try:
-         match_f, e_index = self._searchListOfLists(self.configList,1,exchange)
-       except Exception as eobj:
-          print eobj
-	  err_f = True
-	  return err_f
-	  	 
-       if (not match_f):
-         print "Put(), exchange: %s not found in %s" % (exchange,self.configList)
-	 err_f = True
-	 return err_f
-	 
-       chan_id = self.configList[e_index][0]
-       routing_key = self.configList[e_index][4]
-	 
-       # there are many ways for this function to fail by
-       # passing in bad parameters
-       try:
-         match_f, c_index = self._searchListOfLists(self.chanList,0,chan_id)
-       except Exception as eobj:
-          print eobj
-	  err_f = True
-	  return err_f
-	  
-       if (not match_f):
-         print "Put(), channel %d not found in: %s" % (chan_id,self.chanList)
-	 err_f = True
-	 return err_f
-       
-       ch_obj = self.chanList[c_index][1]
+      err_f, route = self._route(exchange)
+      if (err_f):
+        return err_f
+      ch_obj, routing_key = route
+      if (self.pool != None):        # the channel of this thread
+        return self.pool.publish([msg_in],exchange,routing_key)
    
     ch_obj.basic_publish(amqp.Message(msg_in),exchange,routing_key)
       
     return err_f
   # end Put
+  #-----------------------------------------------------------
+  #
+  # private
+  #
+  def _route(self,exchange):
+    #
+    # the channel object and routing key of an exchange, two keyed
+    # lookups (see Configure), then kept in self.routes
+    #
+    route = self.routes.get(exchange)
+    if (route != None):
+      return False, route
+
+    entry = self.exchangeMap.get(exchange)
+    if (entry == None):
+      print "Put(), exchange: %s not found in %s" % (exchange,self.configList)
+      return True, None
+
+    chan_id, routing_key = entry
+    ch_obj = self.chanMap.get(chan_id)
+    if (ch_obj == None):
+      print "Put(), channel %d not found in: %s" % (chan_id,self.chanList)
+      return True, None
+
+    route = (ch_obj, routing_key)
+    self.routes[exchange] = route
+    return False, route
+  # end _route
+  #-----------------------------------------------------------
+  def PutMany(self,msgs,exchange=None, routing_key=None):
+    #
+    # publishes a list of messages to one exchange, resolved once
+    #
+    err_f = False
+    if (exchange == None):
+      exchange = self.exchange
+      routing_key = self.mykey
+      ch_obj = self.channel
+    else:
+      err_f, route = self._route(exchange)
+      if (err_f):
+        return err_f
+      ch_obj, routing_key = route
+      if (self.pool != None):
+        return self.pool.publish(msgs,exchange,routing_key)
+
+    publish = ch_obj.basic_publish
+    for msg_in in msgs:
+      publish(amqp.Message(msg_in),exchange,routing_key)
+
+    return err_f
+  # end PutMany
   
   #-----------------------------------------------------------  
   def SimpleGet(self):
@@ -390,49 +477,27 @@ class CommObject():
       
     if response is not None:
       print "ch: %d, body = \"%s\"" %(self.channel.channel_id, response.body) 
-      self.channel.basic_ack(response.delivery_tag)
+      self.Ack(self.channel,response.delivery_tag)
     else:
       print "no message" 
        
   # end SimpleGet
   #-----------------------------------------------------------
   def _queue2chobj(self,queue):
-    ch_obj = None
-    err_f = False
     #
-    # given queue, search for channel id
+    # given queue, look up channel id, then channel object
     #
-    try:
-         match_f, q_index = self._searchListOfLists(self.configList,3,queue)
-    except Exception as eobj:
-          print eobj
-	  err_f = True
-      	  
-    if (not err_f):  	 
-        if (not match_f):
-          print "_queue2chobj(), queue %s not found in: %s" % (queue,self.configList)
-	  err_f = True
-	  
-    if (not err_f): 
-        chan_id = self.configList[q_index][0]
-	 
-        # there are many ways for this function to fail by
-        # passing in bad parameters
-        try:
-          match_f, c_index = self._searchListOfLists(self.chanList,0,chan_id)
-        except Exception as eobj:
-          print eobj
-	  err_f = True
-	  
-    if (not err_f):  
-        if (not match_f):
-          print "_queue2chobj(), channel %d not found in: %s" % (chan_id,self.chanList)
-	  err_f = True
-	  
-    if (not err_f):         
-        ch_obj = self.chanList[c_index][1]
-	
-    return err_f, ch_obj
+    chan_id = self.queueMap.get(queue)
+    if (chan_id == None):
+      print "_queue2chobj(), queue %s not found in: %s" % (queue,self.configList)
+      return True, None
+
+    ch_obj = self.chanMap.get(chan_id)
+    if (ch_obj == None):
+      print "_queue2chobj(), channel %d not found in: %s" % (chan_id,self.chanList)
+      return True, None
+
+    return False, ch_obj
   # end _queue2chobj
   #-----------------------------------------------------------  
   def Get(self, queue=None):
@@ -452,7 +517,7 @@ class CommObject():
 	response = None  
         try:
           response = ch_obj.basic_get(queue,no_ack=False)
-        except amqp.Timeout:
+        except WaitTimeout:
 	  pass                 # not an error
 	except: 
          print "queue=", queue
@@ -463,12 +528,59 @@ class CommObject():
         if response is not None:
 	  msg_f = True
           msg = response.body
-          ch_obj.basic_ack(response.delivery_tag)
+          self.Ack(ch_obj,response.delivery_tag)
         else:
           print "no data" 
       
     return err_f, msg_f, msg
   # end Get  
+  #-----------------------------------------------------------
+  def ConfigureAck(self, every=1, interval=0.0):
+    #
+    # acknowledge every N deliveries of a channel with one multiple ack,
+    # or once the oldest unacknowledged delivery is interval seconds old.
+    # every=1 acknowledges each delivery (the default)
+    #
+    self.ack_every = max(every, 1)
+    self.ack_interval = interval
+  # end ConfigureAck
+  #-----------------------------------------------------------
+  def Ack(self, ch_obj, delivery_tag):
+    if (self.ack_every <= 1):
+      ch_obj.basic_ack(delivery_tag)
+      return
+    pending = self.acks.get(ch_obj.channel_id)
+    if (pending == None):
+      pending = [ch_obj, delivery_tag, 0, time.time()]
+      self.acks[ch_obj.channel_id] = pending
+    pending[1] = delivery_tag
+    pending[2] += 1
+    if (pending[2] >= self.ack_every) or \
+       ((self.ack_interval > 0) and (time.time() - pending[3] >= self.ack_interval)):
+      self.AckMany(ch_obj, delivery_tag)
+  # end Ack
+  #-----------------------------------------------------------
+  def AckMany(self, ch_obj, delivery_tag):
+    #
+    # acknowledges all the deliveries of the channel up to delivery_tag
+    #
+    self.acks.pop(ch_obj.channel_id, None)
+    ch_obj.basic_ack(delivery_tag, multiple=True)
+  # end AckMany
+  #-----------------------------------------------------------
+  def FlushAcks(self, ch_obj=None, due_only=False):
+    #
+    # sends the pending acks (of one channel), due_only keeps the ones
+    # younger than the ack interval
+    #
+    now = time.time()
+    for chan_id, pending in self.acks.items():
+      if (ch_obj != None) and (chan_id != ch_obj.channel_id):
+        continue
+      if due_only and (now - pending[3] < self.ack_interval):
+        continue
+      self.AckMany(pending[0], pending[1])
+  # end FlushAcks
   #-----------------------------------------------------------     
   #
   # private
@@ -480,7 +592,7 @@ class CommObject():
     for key,val in msg.delivery_info.items():
       print '> %s: %s' % (key, str(val))
     print 'received <', msg.body, '> from channel #', msg.channel.channel_id
-    msg.channel.basic_ack(msg.delivery_tag)
+    self.Ack(msg.channel,msg.delivery_tag)
   # end __mycallback
   #----------------------------------------------------------- 
   #
@@ -493,12 +605,12 @@ class CommObject():
      #
      self.running = True
      #
-     # loop - need a shared object (event) to determine external stop
+     # loop - SimpleUnsubscribe clears running and stops the worker
      # 
-     while self.running:
+     while self.running and not self.subscribe.stopping():
         try:
            self.channel.wait(timeout = 5)   
-        except amqp.Timeout:
+        except WaitTimeout:
            print "timeout"
       
   # end _SimpleSubscribeThread
@@ -529,6 +641,7 @@ class CommObject():
     if (err_f):
       print "Subscribe failed"
     else:
+      self._qos(ch_obj)
       ch_obj.basic_consume(queue=queue, callback=callback, no_ack=False)
       #
       # init loop
@@ -537,22 +650,82 @@ class CommObject():
       #
       # loop - need a shared object (event) to determine external stop
       # 
-      while not self.ev_obj.is_set():    # while not signaled halt
+      timeout = 5
+      if (self.ack_interval > 0):        # wake up for the ack deadline
+        timeout = min(timeout, self.ack_interval)
+      while not evobj.is_set():          # while not signaled halt
         try:
-           ch_obj.wait(timeout = 5)   
-        except amqp.Timeout:
+           ch_obj.wait(timeout = timeout)   
+        except WaitTimeout:
 	   if (self.debug):
              print "timeout"
+        if (self.acks):
+          self.FlushAcks(ch_obj, due_only=True)
+      self.FlushAcks(ch_obj)
       
   # end _SubscribeThread
   #----------------------------------------------------------- 
   #    
   def SimpleSubscribe(self):
   
-     self.subscribe = KThread(target = self._SimpleSubscribeThread)
+     self.subscribe = Worker(name="SimpleSubscribe",
+                             target = self._SimpleSubscribeThread)
+     self.subscribe.daemon = True
      self.subscribe.start() 
      
   # end SimpleSubscribe
+  #-----------------------------------------------------------
+  def ConfigureQos(self, prefetch_count, prefetch_size=0):
+    #
+    # the broker pushes at most prefetch_count unacknowledged deliveries
+    # per consumer, applied to the channels of later Subscribe/Consume
+    #
+    self.prefetch_count = prefetch_count
+    self.prefetch_size = prefetch_size
+  # end ConfigureQos
+  #-----------------------------------------------------------
+  #
+  # private
+  #
+  def _qos(self, ch_obj, prefetch_count=None):
+    if (prefetch_count == None):
+      prefetch_count = self.prefetch_count
+    if (prefetch_count > 0):
+      ch_obj.basic_qos(self.prefetch_size, prefetch_count, False)
+  # end _qos
+  #-----------------------------------------------------------
+  def Consume(self, queue, sink, prefetch=64, batch=None, backlog=None,
+              high_water=0, low_water=None, ack=True):
+    #
+    # push based consumption of a configured queue, see Consumer,
+    # returns the started Consumer (None on error)
+    #
+    err_f, ch_obj = self._queue2chobj(queue)
+    if (err_f):
+      print "Consume failed"
+      return None
+    consumer = Consumer(self, ch_obj, queue, sink, prefetch, batch,
+                        backlog, high_water, low_water, ack)
+    consumer.start()
+    return consumer
+  # end Consume
+  #-----------------------------------------------------------
+  def ConfigurePool(self, connections=2, connect=None):
+    #
+    # Put and PutMany publish on a channel of the calling thread, taken
+    # from a pool of connections, instead of the configured channel of
+    # the exchange (amqp channels are not thread safe).
+    # Configure still declares the exchanges and queues; 0 connections
+    # publishes on the configured channels again
+    #
+    if (self.pool != None):
+      self.pool.close()
+      self.pool = None
+    if (connections > 0):
+      if (connect == None):
+        connect = self._connect
+      self.pool = ChannelPool(connect, connections)
+  # end ConfigurePool
   
   #----------------------------------------------------------- 
   #    
@@ -577,12 +750,16 @@ class CommObject():
      self.thread_params.append(queue)       # 1
      self.thread_params.append(callback)    # 2
      #
-     # control param for thread
+     # control param for thread, the event of the worker's stop token
+     # (setting it or stopping the worker both end the loop)
      #
-     self.ev_obj = Event()
+     token = StopToken()
+     self.ev_obj = token.event
      self.thread_params.append(self.ev_obj)      # 3 - top of stack
       
-     subscribe = KThread(target = self._SubscribeThread)
+     subscribe = Worker(name="Subscribe_%s" % queue,
+                        target = self._SubscribeThread, token = token)
+     subscribe.daemon = True
      subscribe.start() 
      self.lockObj.release()    
      #
@@ -597,6 +774,7 @@ class CommObject():
      #
      # object may no longer exists, so bound by "try"
      # also, belts and suspenders, i.e. signal before kill
+     # (a cooperative stop, the loop sees it within its wait timeout)
      #
      try: 
        event_object.set()    # signals to stop running
@@ -632,6 +810,8 @@ class CommObject():
   #----------------------------------------------------------- 
   #   
   def CloseAll(self):
+    if (self.pool != None):
+      self.pool.close()
     ii =0
     while (ii < len(self.chanList)):          
       self.Close(self.chanList[ii][1])   # connection close kills socket
@@ -643,6 +823,444 @@ class CommObject():
   #  
 
 # end CommObj    
+#-------------------------------
+#
+# ChannelPool
+#           purpose: channels per thread for parallel publishers.
+#   A thread is given one of the pool's connections (round robin) on
+#   first use and opens its own channel on it, kept in thread local
+#   storage. Threads on different connections publish in parallel, the
+#   threads sharing a connection take turns on its lock (its frames must
+#   not interleave on the socket).
+#   A failed publish closes the connection; the next use, by any thread
+#   of that connection, reconnects and opens a new channel (lazily), the
+#   failed publish is retried once.
+#
+class ChannelPool():
+  def __init__(self, connect, connections=2):
+    self.connect = connect          # returns a new connection
+    self.slots = []                 # [connection, lock, generation] per connection
+    for ii in range(max(connections, 1)):
+      self.slots.append([None, Lock(), 0])
+    self.next = 0                   # round robin slot of the next thread
+    self.lockObj = Lock()
+    self.local = threading.local()  # slot, generation and channel of a thread
+    self.reconnects = 0
+  # end __init__
+  #-----------------------------------------------------------
+  def _slot(self):
+    slot = getattr(self.local, 'slot', None)
+    if (slot == None):
+      self.lockObj.acquire()
+      slot = self.slots[self.next % len(self.slots)]
+      self.next += 1
+      self.lockObj.release()
+      self.local.slot = slot
+      self.local.channel = None
+      self.local.generation = -1
+    return slot
+  # end _slot
+  #-----------------------------------------------------------
+  def channel(self):
+    #
+    # the channel of the calling thread, call with its slot lock held
+    #
+    slot = self._slot()
+    if (slot[0] == None):
+      slot[0] = self.connect()
+      slot[2] += 1
+    if (self.local.channel == None) or (self.local.generation != slot[2]):
+      self.local.channel = None
+      self.local.generation = slot[2]   # a failed open invalidates this connection
+      ch_obj = slot[0].channel()
+      if hasattr(ch_obj, 'access_request'):
+        ch_obj.access_request('/data',active=True,write=True,read=True)
+      self.local.channel = ch_obj
+    return self.local.channel
+  # end channel
+  #-----------------------------------------------------------
+  def invalidate(self):
+    #
+    # drops the connection of the calling thread, call with its slot lock held
+    #
+    slot = self._slot()
+    if (slot[0] != None) and (self.local.generation == slot[2]):
+      try:
+        slot[0].close()
+      except Exception:
+        pass
+      slot[0] = None
+      self.reconnects += 1
+    self.local.channel = None
+  # end invalidate
+  #-----------------------------------------------------------
+  def publish(self, msgs, exchange, routing_key):
+    #
+    # returns err_f like CommObject.Put
+    #
+    slot = self._slot()
+    slot[1].acquire()
+    try:
+      for attempt in (0, 1):
+        try:
+          publish = self.channel().basic_publish
+          for msg_in in msgs:
+            publish(amqp.Message(msg_in),exchange,routing_key)
+          return False
+        except Exception as eobj:
+          print "publish(), %s: %s" % (exchange, eobj)
+          self.invalidate()             # the retry sends the whole batch
+      return True
+    finally:
+      slot[1].release()
+  # end publish
+  #-----------------------------------------------------------
+  def close(self):
+    for slot in self.slots:
+      slot[1].acquire()
+      try:
+        if (slot[0] != None):
+          try:
+            slot[0].close()
+          except Exception as eobj:
+            print eobj
+          slot[0] = None
+          slot[2] += 1
+      finally:
+        slot[1].release()
+  # end close
+
+# end ChannelPool
+#-------------------------------
+#
+# BufferedPublisher
+#           purpose: Put with the signature of CommObject.Put, the messages
+#           are buffered per exchange and published with PutMany once size
+#           messages are buffered or deadline seconds after the first one
+#
+class BufferedPublisher():
+  def __init__(self, comm, size=64, deadline=0.05, wheel=None):
+    self.comm = comm
+    self.size = size
+    self.deadline = deadline        # seconds, 0 flushes on size (and Flush) only
+    self.wheel = wheel              # TimerWheel of the deadline, default shared
+    self.buffers = {}               # (exchange, routing_key) -> [msg, ...]
+    self.timer = None               # deadline timer of the buffered messages
+    self.lockObj = Lock()           # guards buffers and timer
+    self.flushLock = Lock()         # keeps the flushes in order
+  # end __init__
+  #-----------------------------------------------------------
+  def Put(self, msg_in, exchange=None, routing_key=None):
+    key = (exchange, routing_key)
+    self.lockObj.acquire()
+    try:
+      buf = self.buffers.get(key)
+      if (buf == None):
+        buf = []
+        self.buffers[key] = buf
+      buf.append(msg_in)
+      full = (len(buf) >= self.size)
+      if (not full) and (self.timer == None) and (self.deadline > 0):
+        if (self.wheel == None):
+          self.wheel = defaultWheel()
+        self.timer = self.wheel.schedule(self.deadline, self._expired, None)
+    finally:
+      self.lockObj.release()
+    if (full):
+      return self.Flush(key)
+    return False
+  # end Put
+  #-----------------------------------------------------------
+  def _expired(self, event_id, event_data):
+    self.Flush()
+  # end _expired
+  #-----------------------------------------------------------
+  def Flush(self, key=None):
+    #
+    # publishes the messages of one exchange, or of all of them
+    #
+    err_f = False
+    self.flushLock.acquire()
+    try:
+      self.lockObj.acquire()
+      try:
+        if (key == None):
+          batches = self.buffers.items()
+          self.buffers = {}
+        else:
+          batches = [(key, self.buffers.pop(key, []))]
+        if (not self.buffers) and (self.timer != None):
+          self.wheel.cancel(self.timer)
+          self.timer = None
+      finally:
+        self.lockObj.release()
+      for (exchange, routing_key), msgs in batches:
+        if (len(msgs) > 0):
+          err_f = self.comm.PutMany(msgs, exchange, routing_key) or err_f
+    finally:
+      self.flushLock.release()
+    return err_f
+  # end Flush
+  #-----------------------------------------------------------
+  def Close(self):
+    return self.Flush()
+  # end Close
+
+# end BufferedPublisher
+#-------------------------------
+#
+# Consumer
+#           purpose: push based consumption with flow control.
+#   The broker pushes deliveries (basic_consume) up to prefetch unacked
+#   ones (basic_qos). They are buffered locally and handed to the sink
+#   as a list, sink(msgs), once batch of them arrived or the channel went
+#   quiet; the batch is acknowledged with one multiple ack after the sink
+#   returns (ack=False leaves the ack to the sink).
+#   The buffer can not grow past prefetch since nothing is acknowledged
+#   before it is handed over.
+#   With a backlog (anything with a length, e.g. the EventQueue of a
+#   statechart) and a high water mark, a batch is held while the backlog
+#   is at or above high water, until it drains below low water. Holding
+#   the batch holds the acks, so the broker stops pushing and the
+#   messages wait in the broker.
+#
+class Consumer():
+  def __init__(self, comm, ch_obj, queue, sink, prefetch=64, batch=None,
+               backlog=None, high_water=0, low_water=None, ack=True,
+               interval=0.05):
+    if (batch == None) or (batch > prefetch > 0):
+      batch = prefetch
+    if (low_water == None):
+      low_water = high_water // 2
+    self.comm = comm
+    self.ch_obj = ch_obj
+    self.queue = queue
+    self.sink = sink                # called with a list of messages
+    self.prefetch = prefetch
+    self.batch = max(batch, 1)
+    self.backlog = backlog
+    self.high_water = high_water    # 0 is no flow control
+    self.low_water = low_water
+    self.ack = ack
+    self.interval = interval        # seconds without delivery before a drain
+    self.buffer = deque()
+    self.delivered = 0              # messages handed to the sink
+    self.paused = 0                 # batches held by flow control
+    self.tag = None                 # consumer tag
+    self.thread = None
+  # end __init__
+  #-----------------------------------------------------------
+  def _deliver(self, msg):
+    self.buffer.append(msg)
+  # end _deliver
+  #-----------------------------------------------------------
+  def _throttle(self):
+    if (self.backlog == None) or (self.high_water <= 0):
+      return
+    if (len(self.backlog) < self.high_water):
+      return
+    self.paused += 1
+    while (len(self.backlog) > self.low_water) and (not self.thread.stopping()):
+      if hasattr(self.backlog, 'wait_below'):
+        self.backlog.wait_below(self.low_water + 1, self.interval)
+      else:
+        time.sleep(self.interval)
+  # end _throttle
+  #-----------------------------------------------------------
+  def _drain(self):
+    if (len(self.buffer) == 0):
+      return
+    self._throttle()
+    msgs = list(self.buffer)
+    self.buffer.clear()
+    self.sink(msgs)
+    self.delivered += len(msgs)
+    if (self.ack):
+      self.comm.AckMany(self.ch_obj, msgs[-1].delivery_tag)
+  # end _drain
+  #-----------------------------------------------------------
+  def _run(self):
+    self.comm._qos(self.ch_obj, self.prefetch)
+    self.tag = self.ch_obj.basic_consume(queue=self.queue, callback=self._deliver,
+                                         no_ack=False)
+    while not self.thread.stopping():
+      quiet_f = False
+      try:
+        self.ch_obj.wait(timeout = self.interval)
+      except WaitTimeout:
+        quiet_f = True
+      if (len(self.buffer) >= self.batch) or quiet_f:
+        self._drain()
+    self._drain()
+    try:
+      self.ch_obj.basic_cancel(self.tag)
+    except Exception as eobj:
+      print eobj
+  # end _run
+  #-----------------------------------------------------------
+  def start(self):
+    self.thread = Worker(name="Consumer_%s" % self.queue, target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+  # end start
+  #-----------------------------------------------------------
+  def shutdown(self, timeout=5.0):
+    return self.thread.shutdown(timeout)
+  # end shutdown
+
+# end Consumer
+#-------------------------------
+#
+# LocalBroker
+#           purpose: in process stand-in for the server, for testing the
+#   consumers and publishers without rabbitmq. Exchanges fan out to the
+#   queues bound to them, deliveries honour basic_qos prefetch and are
+#   redelivered only by a new consumer (no requeue).
+#
+class LocalBroker():
+  def __init__(self):
+    self.queues = {}                # queue -> deque of bodies
+    self.bindings = {}              # exchange -> [queue, ...]
+    self.lockObj = Lock()
+    self.ready = Condition(self.lockObj)
+    self.channels = 0
+  # end __init__
+  #-----------------------------------------------------------
+  def channel(self):
+    self.channels += 1
+    return LocalChannel(self, self.channels)
+  # end channel
+  #-----------------------------------------------------------
+  def close(self):
+    pass
+  # end close
+  #-----------------------------------------------------------
+  def bind(self, queue, exchange):
+    self.lockObj.acquire()
+    try:
+      self.queues.setdefault(queue, deque())
+      self.bindings.setdefault(exchange, []).append(queue)
+    finally:
+      self.lockObj.release()
+  # end bind
+  #-----------------------------------------------------------
+  def publish(self, body, exchange):
+    self.lockObj.acquire()
+    try:
+      for queue in self.bindings.get(exchange, []):
+        self.queues[queue].append(body)
+      self.ready.notify_all()
+    finally:
+      self.lockObj.release()
+  # end publish
+
+# end LocalBroker
+#-------------------------------
+class LocalChannel():
+  def __init__(self, broker, channel_id):
+    self.broker = broker
+    self.channel_id = channel_id
+    self.prefetch = 0
+    self.consumers = []             # [tag, queue, callback]
+    self.unacked = {}               # delivery tag -> body
+    self.last_tag = 0
+  # end __init__
+
+  def access_request(self, realm, active=False, write=False, read=False):
+    pass
+
+  def exchange_declare(self, exchange, type, durable=False, auto_delete=True):
+    pass
+
+  def queue_declare(self, queue='', durable=False, auto_delete=True):
+    self.broker.lockObj.acquire()
+    try:
+      self.broker.queues.setdefault(queue, deque())
+    finally:
+      self.broker.lockObj.release()
+
+  def queue_bind(self, queue, exchange, routing_key=''):
+    self.broker.bind(queue, exchange)
+
+  def basic_qos(self, prefetch_size, prefetch_count, a_global):
+    self.prefetch = prefetch_count
+
+  def basic_publish(self, msg, exchange='', routing_key=''):
+    self.broker.publish(msg.body, exchange)
+
+  def basic_consume(self, queue='', callback=None, no_ack=False):
+    tag = 'ctag%d' % (len(self.consumers) + 1)
+    self.consumers.append([tag, queue, callback])
+    return tag
+
+  def basic_cancel(self, tag):
+    self.consumers = [c for c in self.consumers if c[0] != tag]
+
+  def _message(self, body):
+    # called with the broker lock held
+    self.last_tag += 1
+    self.unacked[self.last_tag] = body
+    msg = amqp.Message(body)
+    msg.channel = self
+    msg.delivery_tag = self.last_tag
+    return msg
+
+  def basic_get(self, queue='', no_ack=False):
+    self.broker.lockObj.acquire()
+    try:
+      bodies = self.broker.queues.get(queue)
+      if (not bodies):
+        return None
+      return self._message(bodies.popleft())
+    finally:
+      self.broker.lockObj.release()
+
+  def basic_ack(self, delivery_tag, multiple=False):
+    self.broker.lockObj.acquire()
+    try:
+      if (multiple):
+        for tag in [t for t in self.unacked if t <= delivery_tag]:
+          del self.unacked[tag]
+      else:
+        self.unacked.pop(delivery_tag, None)
+      self.broker.ready.notify_all()
+    finally:
+      self.broker.lockObj.release()
+
+  def wait(self, timeout=None):
+    #
+    # one delivery per call, like a server pushing basic_deliver
+    #
+    deadline = None
+    if (timeout != None):
+      deadline = time.time() + timeout
+    self.broker.lockObj.acquire()
+    try:
+      while True:
+        for tag, queue, callback in self.consumers:
+          bodies = self.broker.queues.get(queue)
+          if bodies and ((self.prefetch <= 0) or (len(self.unacked) < self.prefetch)):
+            msg = self._message(bodies.popleft())
+            break
+        else:
+          msg = None
+        if (msg != None):
+          break
+        if (deadline == None):
+          self.broker.ready.wait()
+        else:
+          remaining = deadline - time.time()
+          if (remaining <= 0):
+            raise WaitTimeout()
+          self.broker.ready.wait(remaining)
+    finally:
+      self.broker.lockObj.release()
+    callback(msg)
+
+  def close(self):
+    self.consumers = []
+
+# end LocalChannel
  
 #-------------------------------
 
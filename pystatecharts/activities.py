@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from action import Action
+
+_local = threading.local()
+
+def current_task():
+    """ The ActivityTask running in this thread, None outside of one """
+    return getattr(_local, 'task', None)
+
+class ActivityTask(object):
+
+    """
+        One run of a do-activity. The action is cancelled by setting
+        cancelled, a long action polls current_task().cancelled between
+        its steps (a thread can not be interrupted). error holds the
+        exception the action raised, if any.
+    """
+
+    __slots__ = ('state', 'action', 'param', 'cancelled', 'error')
+
+    def __init__(self, state, action, param):
+        self.state = state
+        self.action = action
+        self.param = param
+        self.cancelled = threading.Event()
+        self.error = None
+
+    def cancel(self):
+        self.cancelled.set()
+
+class DoActivity(Action):
+
+    """ Stands in for the do action of a state, see ActivityRunner.attach """
+
+    def __init__(self, runner, state, action, event_id):
+        self.runner = runner
+        self.state = state
+        self.action = action
+        self.event_id = event_id
+
+    def execute(self, parameter):
+        self.runner.start(self.state, self.action, self.event_id, parameter)
+
+class ActivityRunner(object):
+
+    """
+        Runs the do-activities of the attached states on a thread pool
+        instead of in the dispatching thread. An activity starts when its
+        state is entered and is cancelled when the state is exited (the
+        runner is a listener of the runtime, told by State.deactivate).
+        When an activity completes without being cancelled, post(event_id,
+        task) is called, e.g. the sendEvent of the interface, so the
+        completion is dispatched like any other event. A failed activity
+        posts nothing, it is counted in failed and keeps its exception in
+        task.error. post is called with the runner's lock held, so it is
+        never called for a task its state has exited; it must not wait on
+        the dispatching thread (put the event without blocking, or on an
+        unbounded queue). One runner serves one runtime.
+    """
+
+    def __init__(self, post, workers=4, pool=None):
+        self.post = post
+        self.own_pool = pool is None
+        if self.own_pool:
+            pool = ThreadPool(workers)
+        else:
+            workers = getattr(pool, '_processes', workers)
+
+        self.pool = pool
+        self.workers = workers
+
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def attach(self, state, event_id=None):
+        """ 
+            Run the do action of state asynchronously, event_id is posted 
+            when it completes (None posts nothing)
+        """
+        assert state.do, "State has no do action"
+        state.do = DoActivity(self, state, state.do, event_id)
+
+    def listen(self, runtime):
+        runtime.add_listener(self)
+
+    def start(self, state, action, event_id, param):
+        task = ActivityTask(state, action, param)
+
+        self.lock.acquire()
+        try:
+            previous = self.tasks.get(state)
+            if previous:
+                previous.cancel()
+                self.cancelled += 1
+
+            self.tasks[state] = task
+            self.started += 1
+        finally:
+            self.lock.release()
+
+        self.pool.apply_async(self.run, (task, event_id))
+        return task
+
+    def run(self, task, event_id):
+        if task.cancelled.is_set():
+            return
+
+        _local.task = task
+        try:
+            try:
+                task.action.execute(task.param)
+            except Exception, e:
+                task.error = e
+        finally:
+            _local.task = None
+
+        self.lock.acquire()
+        try:
+            if task.cancelled.is_set():
+                return
+
+            if self.tasks.get(task.state) is task:
+                del self.tasks[task.state]
+
+            if task.error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+            """ Under the lock, an exit can not cancel the task after this """
+            if event_id is not None and task.error is None:
+                self.post(event_id, task)
+        finally:
+            self.lock.release()
+
+    def state_deactivated(self, runtime, state):
+        """ Runtime listener, cancels the activity of the exited state """
+        self.lock.acquire()
+        try:
+            task = self.tasks.pop(state, None)
+            if task:
+                task.cancel()
+                self.cancelled += 1
+        finally:
+            self.lock.release()
+
+    def in_flight(self):
+        return len(self.tasks)
+
+    def stats(self):
+        return {'workers': self.workers, 'in_flight': self.in_flight(),
+                'started': self.started, 'completed': self.completed,
+                'failed': self.failed, 'cancelled': self.cancelled}
+
+    def close(self):
+        """ Cancels the running activities, closes the pool if it owns it """
+        self.lock.acquire()
+        try:
+            for task in self.tasks.values():
+                task.cancel()
+                self.cancelled += 1
+            self.tasks.clear()
+        finally:
+            self.lock.release()
+
+        if self.own_pool:
+            self.pool.close()
+            self.pool.join()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+from states import State
+from states import HierarchicalState
+from states import ConcurrentState
+from states import Transition
+from states import Statechart
+from pseudostates import PseudoState
+from pseudostates import StartState
+from pseudostates import EndState
+from pseudostates import HistoryState
+from array import array
+
+from runtime import CompactRuntimeData
+
+""" State kinds, in the order the classes are looked up in the mro """
+CHART, START, END, HISTORY, PSEUDO, CONCURRENT, HIERARCHICAL, PLAIN = range(8)
+
+STOCK_CLASSES = ((Statechart, CHART),
+                 (StartState, START),
+                 (EndState, END),
+                 (HistoryState, HISTORY),
+                 (PseudoState, PSEUDO),
+                 (ConcurrentState, CONCURRENT),
+                 (HierarchicalState, HIERARCHICAL),
+                 (State, PLAIN))
+
+""" Methods whose behaviour the generated code reproduces """
+STATE_METHODS = ('activate', 'deactivate', 'dispatch',
+                 'dispatch_transitions', 'candidate_transitions')
+CHART_METHODS = ('start_runtime', 'dispatch_runtime', 'dispatch_runtime_many',
+                 'relevant_runtime')
+TRANSITION_METHODS = ('execute', 'fire')
+
+class CompileError(Exception):
+    pass
+
+def _function(cls, name):
+    method = getattr(cls, name)
+    return getattr(method, 'im_func', method)
+
+def _check_methods(obj, base, names):
+    for name in names:
+        if _function(type(obj), name) is not _function(base, name):
+            raise CompileError("%s overrides %s.%s" %
+                                    (type(obj).__name__, base.__name__, name))
+
+def classify_state(state):
+    """
+        Returns the kind of a state, raises CompileError when the state
+        overrides behaviour of its stock class
+    """
+    for cls, kind in STOCK_CLASSES:
+        if isinstance(state, cls):
+            break
+
+    if kind == CHART:
+        _check_methods(state, cls, CHART_METHODS)
+    else:
+        _check_methods(state, cls, STATE_METHODS)
+
+    if kind == CONCURRENT and state.pool is not None:
+        raise CompileError("%s dispatches its regions on a pool" % state)
+
+    if kind in (HIERARCHICAL, CHART) and state.start_state == None:
+        raise CompileError("%s has no start state" % state)
+
+    return kind
+
+def check_transition(transition):
+    _check_methods(transition, Transition, TRANSITION_METHODS)
+
+def compile_statechart(statechart):
+    """
+        Returns the compiled statechart, or the statechart itself (the
+        interpreter) when it uses features the compiler cannot handle
+    """
+    try:
+        return CompiledStatechart(statechart)
+    except CompileError:
+        return statechart
+
+class CompiledStatechart(object):
+
+    """
+        Flat Python dispatcher generated from a finalized statechart. Every
+        state gets an enter, exit and dispatch function and every state gets
+        one function per event it handles, with the exit/action/entry
+        sequence of its transitions inlined. The runtimes are
+        CompactRuntimeData, the current child of a context selects the next
+        dispatch function.
+    """
+
+    def __init__(self, statechart):
+        statechart.finalize()
+        self.statechart = statechart
+        self.param = statechart.param
+        self.runtime = None
+
+        self.kinds = [classify_state(state) for state in
+                        statechart.state_table]
+        for transition in statechart.transition_table:
+            check_transition(transition)
+
+        self.constants = {}
+        self.source = self.generate()
+        self.namespace = self.build_namespace()
+        self.namespace.update(self.constants)
+        exec compile(self.source, "<statechart %s>" %
+                        type(statechart).__name__, "exec") in self.namespace
+
+        self.dispatch_function = self.namespace['dispatch']
+        self.dispatch_table = self.namespace['DISPATCH']
+
+    """ Interface shared with Statechart """
+
+    def finalize(self):
+        pass
+
+    def create_runtime(self):
+        return CompactRuntimeData(self.statechart.state_table,
+                                  self.statechart.history_count,
+                                  self.statechart.event_masks,
+                                  self.statechart.wildcard_mask)
+
+    def start_runtime(self, runtime, param):
+        runtime.reset()
+        runtime.activate(self.statechart)
+        runtime.activate(self.statechart.start_state)
+        self.dispatch_function(runtime, None, param)
+
+    def relevant_runtime(self, runtime, event):
+        return runtime.relevant(event)
+
+    def dispatch_runtime(self, runtime, event, param):
+        if not runtime.relevant(event):
+            runtime.dropped += 1
+            return False
+
+        return self.dispatch_function(runtime, event, param)
+
+    def dispatch_runtime_many(self, runtime, events, param):
+        """ Same results as Statechart.dispatch_runtime_many """
+        results = array('i')
+        append = results.append
+        table = self.dispatch_table
+        dispatch = table[runtime.current[0]]
+        relevant = runtime.relevant
+
+        for event in events:
+            runtime.last_transition = None
+            if not relevant(event):
+                runtime.dropped += 1
+                append(-1)
+                continue
+
+            if event is None:
+                fired = dispatch(runtime, None, None, param)
+            else:
+                fired = dispatch(runtime, event, event.id, param)
+
+            if fired:
+                append(runtime.last_transition.transition_id)
+                dispatch = table[runtime.current[0]]
+            else:
+                append(-1)
+
+        return results
+
+    def start(self):
+        self.runtime = self.create_runtime()
+        self.start_runtime(self.runtime, self.param)
+
+    def dispatch(self, event):
+        return self.dispatch_runtime(self.runtime, event, self.param)
+
+    def dispatch_many(self, events):
+        return self.dispatch_runtime_many(self.runtime, events, self.param)
+
+    def relevant(self, event):
+        return self.relevant_runtime(self.runtime, event)
+
+    def dropped(self):
+        return self.runtime.dropped
+
+    """ Code generation """
+
+    def build_namespace(self):
+        namespace = {}
+
+        for state in self.statechart.state_table:
+            i = state.state_id
+            namespace['S%d' % i] = state
+            if state.entry:
+                namespace['E%d' % i] = state.entry.execute
+            if state.exit:
+                namespace['X%d' % i] = state.exit.execute
+
+        for transition in self.statechart.transition_table:
+            k = transition.transition_id
+            namespace['T%d' % k] = transition
+            if transition.guard:
+                namespace['G%d' % k] = transition.guard.check
+            if transition.action:
+                namespace['A%d' % k] = transition.action.execute
+
+        return namespace
+
+    def generate(self):
+        lines = []
+        for state in self.statechart.state_table[1:]:
+            self.gen_enter(lines, state)
+            self.gen_exit(lines, state)
+            self.gen_dispatch(lines, state)
+            self.gen_groups(lines, state)
+
+        table = range(len(self.statechart.state_table))
+        lines.append("ENTER = [None] + [%s]" % ", ".join(
+                        ["enter_%d" % i for i in table[1:]]))
+        lines.append("EXIT = [None] + [%s]" % ", ".join(
+                        ["exit_%d" % i for i in table[1:]]))
+        lines.append("DISPATCH = [None] + [%s]" % ", ".join(
+                        ["dispatch_%d" % i for i in table[1:]]))
+
+        lines.append("def dispatch(rt, ev, p):")
+        lines.append("    if ev is None:")
+        lines.append("        return DISPATCH[rt.current[0]](rt, ev, None, p)")
+        lines.append("    return DISPATCH[rt.current[0]](rt, ev, ev.id, p)")
+
+        return "\n".join(lines) + "\n"
+
+    def activate_lines(self, state, indent):
+        """ runtime.activate(state) followed by the entry and do actions """
+        i = state.state_id
+        pad = " " * indent
+        lines = [pad + "rt.active |= %d" % (1 << i),
+                 pad + "rt.current[%d] = -1" % i,
+                 pad + "rt.current[%d] = %d" % (state.context.state_id, i)]
+        if state.entry:
+            lines.append(pad + "E%d(p)" % i)
+        if state.do:
+            """ looked up on entry, ActivityRunner.attach may replace it """
+            lines.append(pad + "S%d.do.execute(p)" % i)
+
+        return lines
+
+    def deactivate_lines(self, state, indent):
+        """ State.deactivate """
+        i = state.state_id
+        pad = " " * indent
+        lines = [pad + "if (rt.active >> %d) & 1:" % i]
+        if state.exit:
+            lines.append(pad + "    X%d(p)" % i)
+        lines.append(pad + "    rt.current[%d] = -1" % i)
+        lines.append(pad + "    rt.active &= %d" % ~(1 << i))
+        lines.append(pad + "    for l in rt.listeners:")
+        lines.append(pad + "        l.state_deactivated(rt, S%d)" % i)
+
+        return lines
+
+    def gen_enter(self, lines, state):
+        i = state.state_id
+        kind = self.kinds[i]
+        lines.append("def enter_%d(rt, p):" % i)
+
+        if kind == PLAIN:
+            lines.append("    if (rt.active >> %d) & 1:" % i)
+            lines.append("        return False")
+            lines.extend(self.activate_lines(state, 4))
+            lines.append("    return True")
+
+        elif kind == HIERARCHICAL:
+            lines.append("    if not (rt.active >> %d) & 1:" % i)
+            lines.extend(self.activate_lines(state, 8))
+            lines.append("    t = rt.transition")
+            lines.append("    if t and t.end is S%d:" % i)
+            lines.append("        enter_%d(rt, p)" %
+                            state.start_state.state_id)
+
+        elif kind == CONCURRENT:
+            lines.append("    if (rt.active >> %d) & 1:" % i)
+            lines.append("        return False")
+            lines.extend(self.activate_lines(state, 4))
+            for region in state.regions:
+                lines.append("    enter_%d(rt, p)" % region.state_id)
+                lines.append("    enter_%d(rt, p)" %
+                                region.start_state.state_id)
+            lines.append("    return False")
+
+        elif kind == START:
+            lines.append("    N%d(rt, None, p)" % i)
+
+        elif kind == HISTORY:
+            lines.append("    h = rt.history[%d]" % state.history_id)
+            lines.append("    if h >= 0:")
+            lines.append("        ENTER[h](rt, p)")
+            lines.append("    else:")
+            lines.append("        N%d(rt, None, p)" % i)
+
+        else:
+            """ PseudoState.activate """
+            lines.append("    rt.active |= %d" % (1 << i))
+            lines.append("    rt.current[%d] = -1" % i)
+            lines.append("    rt.current[%d] = %d" %
+                            (state.context.state_id, i))
+            if state.entry:
+                lines.append("    S%d.entry.execute(rt, p)" % i)
+            lines.append("    return True")
+
+    def gen_exit(self, lines, state):
+        i = state.state_id
+        kind = self.kinds[i]
+        lines.append("def exit_%d(rt, p):" % i)
+
+        if kind == HIERARCHICAL:
+            lines.append("    c = rt.current[%d]" % i)
+            if state.history:
+                lines.append("    rt.history[%d] = c" %
+                                state.history.history_id)
+            lines.append("    if c >= 0 and (rt.active >> c) & 1:")
+            lines.append("        EXIT[c](rt, p)")
+
+        elif kind == CONCURRENT:
+            for region in state.regions:
+                r = region.state_id
+                lines.append("    if (rt.active >> %d) & 1:" % r)
+                lines.append("        exit_%d(rt, p)" % r)
+
+        lines.extend(self.deactivate_lines(state, 4))
+
+    def gen_dispatch(self, lines, state):
+        i = state.state_id
+        kind = self.kinds[i]
+        lines.append("def dispatch_%d(rt, ev, eid, p):" % i)
+
+        if kind == HIERARCHICAL:
+            start_id = state.start_state.state_id
+            lines.append("    c = rt.current[%d]" % i)
+            lines.append("    if c < 0:")
+            lines.append("        rt.active |= %d" % (1 << start_id))
+            lines.append("        rt.current[%d] = -1" % start_id)
+            lines.append("        rt.current[%d] = c = %d" % (i, start_id))
+            lines.append("        enter_%d(rt, p)" % start_id)
+            lines.append("    if DISPATCH[c](rt, ev, eid, p):")
+            lines.append("        return True")
+
+        elif kind == CONCURRENT:
+            lines.append("    dispatched = False")
+            for region in state.regions:
+                lines.append("    if dispatch_%d(rt, ev, eid, p):" %
+                                region.state_id)
+                lines.append("        dispatched = True")
+            lines.append("    if dispatched:")
+            lines.append("        return True")
+
+        lines.append("    return R%d.get(eid, N%d)(rt, ev, p)" % (i, i))
+
+    def gen_groups(self, lines, state):
+        """ One function per event id, plus the event-less candidates """
+        i = state.state_id
+        groups = [('N%d' % i, state.eventless_transitions)]
+        keys = []
+        for n, (event_id, transitions) in enumerate(
+                                    state.transition_index.items()):
+            groups.append(('C%d_%d' % (i, n), transitions))
+            keys.append((event_id, 'C%d_%d' % (i, n)))
+
+        for name, transitions in groups:
+            lines.append("def %s(rt, ev, p):" % name)
+            guarded = True
+            for transition in transitions:
+                k = transition.transition_id
+                indent = 4
+                if transition.guard:
+                    lines.append("    if G%d(rt, p):" % k)
+                    indent = 8
+                self.gen_fire(lines, transition, indent)
+                lines.append(" " * indent + "return True")
+
+                if not transition.guard:
+                    guarded = False
+                    break
+
+            if guarded:
+                lines.append("    return False")
+
+        """ Event ids are looked up through constants, not literals """
+        lines.append("R%d = {None: N%d}" % (i, i))
+        for n, (event_id, name) in enumerate(keys):
+            self.constants['K%d_%d' % (i, n)] = event_id
+            lines.append("R%d[K%d_%d] = %s" % (i, i, n, name))
+
+    def gen_fire(self, lines, transition, indent):
+        """ Transition.fire, without the guard check """
+        k = transition.transition_id
+        pad = " " * indent
+        lines.append(pad + "rt.event = ev")
+        lines.append(pad + "rt.transition = T%d" % k)
+
+        for state in transition.deactivate:
+            if self.kinds[state.state_id] == PLAIN:
+                lines.extend(self.deactivate_lines(state, indent))
+            else:
+                lines.append(pad + "exit_%d(rt, p)" % state.state_id)
+
+        if transition.action:
+            lines.append(pad + "A%d(p)" % k)
+
+        for state in transition.activate:
+            if self.kinds[state.state_id] == PLAIN:
+                i = state.state_id
+                lines.append(pad + "if not (rt.active >> %d) & 1:" % i)
+                lines.extend(self.activate_lines(state, indent + 4))
+            else:
+                lines.append(pad + "enter_%d(rt, p)" % state.state_id)
+
+        lines.append(pad + "rt.transition = None")
+        lines.append(pad + "rt.event = None")
+        lines.append(pad + "rt.last_transition = T%d" % k)
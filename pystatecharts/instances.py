@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+class InstanceManager(object):
+
+    """
+        Runs many independent sessions of one statechart definition. The
+        state graph is shared, a session only owns its runtime data and
+        the parameter object handed to the actions.
+    """
+
+    def __init__(self, statechart):
+        statechart.finalize()
+        self.statechart = statechart
+        self.sessions = {}
+
+    def create(self, key, param):
+        assert not (key in self.sessions), "Session %s already present" % key
+
+        runtime = self.statechart.create_runtime()
+        self.sessions[key] = (runtime, param)
+        self.statechart.start_runtime(runtime, param)
+
+        return runtime
+
+    def dispatch(self, key, event):
+        runtime, param = self.sessions[key]
+        return self.statechart.dispatch_runtime(runtime, event, param)
+
+    def dispatch_many(self, key, events):
+        runtime, param = self.sessions[key]
+        return self.statechart.dispatch_runtime_many(runtime, events, param)
+
+    def destroy(self, key):
+        runtime, param = self.sessions.pop(key)
+        runtime.reset()
+
+    def runtime(self, key):
+        return self.sessions[key][0]
+
+    def param(self, key):
+        return self.sessions[key][1]
+
+    def keys(self):
+        return self.sessions.keys()
+
+    def __contains__(self, key):
+        return key in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+from array import array
+
+from states import State
+from compiler import CompileError
+from compiler import classify_state
+from compiler import check_transition
+from compiler import CHART, START, END, HISTORY, PSEUDO
+from compiler import CONCURRENT, HIERARCHICAL, PLAIN
+
+""" Work items of the engine """
+BEGIN, EXIT, EXITED, ACTION, ENTER, END_FIRE = range(6)
+
+def make_iterative(statechart):
+    """
+        Returns the statechart with the iterative engine, or the statechart
+        itself when it overrides behaviour the engine reproduces
+    """
+    try:
+        return IterativeStatechart(statechart)
+    except CompileError:
+        return statechart
+
+class IterativeStatechart(object):
+
+    """
+        Dispatch, exit and entry without recursion. The dispatch walks the
+        active configuration with an explicit stack of frames (innermost
+        state first, then outward, every region of a concurrent state in
+        order); a transition that fires is run by a work list of begin,
+        exit, action, enter and end items, exits expanded children first.
+        The order of the entry, exit and transition actions, the history
+        records and the listener calls are the ones of the recursive
+        methods of the stock classes, with either runtime.
+    """
+
+    def __init__(self, statechart):
+        statechart.finalize()
+        self.statechart = statechart
+        self.param = statechart.param
+        self.runtime = None
+
+        self.kinds = [classify_state(state) for state in
+                        statechart.state_table]
+        for transition in statechart.transition_table:
+            check_transition(transition)
+
+    """ Interface shared with Statechart """
+
+    def finalize(self):
+        pass
+
+    def create_runtime(self):
+        return self.statechart.create_runtime()
+
+    def start_runtime(self, runtime, param):
+        statechart = self.statechart
+        runtime.reset()
+        runtime.activate(statechart)
+        runtime.activate(statechart.start_state)
+        self.dispatch_runtime(runtime, None, param)
+
+    def relevant_runtime(self, runtime, event):
+        return self.statechart.relevant_runtime(runtime, event)
+
+    def dispatch_runtime(self, runtime, event, param):
+        if not runtime.relevant(event):
+            runtime.dropped += 1
+            return False
+
+        current_state = runtime.get_current_state(self.statechart)
+        return self.dispatch_state(runtime, current_state, event, param)
+
+    def dispatch_runtime_many(self, runtime, events, param):
+        """ Same results as Statechart.dispatch_runtime_many """
+        results = array('i')
+        append = results.append
+
+        for event in events:
+            runtime.last_transition = None
+            if self.dispatch_runtime(runtime, event, param):
+                append(runtime.last_transition.transition_id)
+            else:
+                append(-1)
+
+        return results
+
+    def start(self):
+        self.runtime = self.create_runtime()
+        self.start_runtime(self.runtime, self.param)
+
+    def dispatch(self, event):
+        return self.dispatch_runtime(self.runtime, event, self.param)
+
+    def dispatch_many(self, events):
+        return self.dispatch_runtime_many(self.runtime, events, self.param)
+
+    def relevant(self, event):
+        return self.relevant_runtime(self.runtime, event)
+
+    def dropped(self):
+        return self.runtime.dropped
+
+    """ Dispatch """
+
+    def dispatch_state(self, runtime, state, event, param):
+        """
+            state.dispatch(runtime, event, param). Descends to the innermost
+            active state pushing the contexts, a frame is [state, kind,
+            regions visited, dispatched]; then ascends, each context trying
+            its own transitions when its children did not handle the event.
+            A concurrent context sends the descent into its next region.
+        """
+        kinds = self.kinds
+        stack = []
+
+        while True:
+            leaf = None
+            while True:
+                kind = kinds[state.state_id]
+
+                if kind == HIERARCHICAL:
+                    if not runtime.is_active(state):
+                        assert False, (("HierarchicalState: " +
+                                    "trying to dispatch on inactive state"))
+
+                    current_state = runtime.get_current_state(state)
+                    if current_state == None and state.start_state:
+                        runtime.activate(state.start_state)
+                        current_state = state.start_state
+                        self.run(runtime, [(ENTER, current_state)], param)
+
+                    stack.append([state, kind, 0, False])
+                    if not current_state:
+                        break
+
+                    state = current_state
+
+                elif kind == CONCURRENT:
+                    if not runtime.is_active(state):
+                        assert False, "Dispatching an event on inactive state"
+
+                    """ The regions are visited on the way up """
+                    stack.append([state, kind, 0, False])
+                    break
+
+                else:
+                    leaf = state
+                    break
+
+            result = False
+            if leaf:
+                result = self.fire_first(runtime, leaf, event, param)
+
+            while stack:
+                frame = stack[-1]
+                if frame[1] == CONCURRENT:
+                    if result:
+                        frame[3] = True
+
+                    regions = frame[0].regions
+                    if frame[2] < len(regions):
+                        state = regions[frame[2]]
+                        frame[2] += 1
+                        break
+
+                    result = frame[3]
+
+                """ The children did not handle the event, this state tries """
+                if not result:
+                    result = self.fire_first(runtime, frame[0], event, param)
+
+                stack.pop()
+            else:
+                return result
+
+    def fire_first(self, runtime, state, event, param):
+        """ State.dispatch_transitions """
+        for transition in state.candidate_transitions(event):
+            if (transition.guard and
+                (not transition.guard.check(runtime, param))):
+                continue
+
+            self.run(runtime, self.fire_items(transition, event), param)
+            return True
+
+        return False
+
+    """ Exit and entry """
+
+    def fire_items(self, transition, event):
+        """ Transition.fire, the guard is assumed to have passed """
+        items = [(BEGIN, transition, event)]
+        for state in transition.deactivate:
+            items.append((EXIT, state))
+
+        items.append((ACTION, transition))
+        for state in transition.activate:
+            items.append((ENTER, state))
+
+        items.append((END_FIRE, transition))
+        return items
+
+    def run(self, runtime, items, param):
+        """ Runs the work items in order, an item may add items before the rest """
+        kinds = self.kinds
+        work = items[::-1]
+        pop = work.pop
+        push = work.append
+
+        while work:
+            item = pop()
+            code = item[0]
+
+            if code == BEGIN:
+                runtime.event = item[2]
+                runtime.transition = item[1]
+
+            elif code == ACTION:
+                if item[1].action:
+                    item[1].action.execute(param)
+
+            elif code == END_FIRE:
+                runtime.transition = None
+                runtime.event = None
+                runtime.last_transition = item[1]
+
+            elif code == EXIT:
+                state = item[1]
+                kind = kinds[state.state_id]
+
+                """ A region is exited only if active when its turn comes """
+                if len(item) > 2 and not runtime.is_active(state):
+                    continue
+
+                if kind == HIERARCHICAL:
+                    """ HierarchicalState.deactivate, the child first """
+                    assert runtime.is_active(state), state
+
+                    current_state = runtime.get_current_state(state)
+                    if state.history:
+                        runtime.store_history_info(state.history,
+                                                   current_state)
+
+                    push((EXITED, state))
+                    if current_state and runtime.is_active(current_state):
+                        push((EXIT, current_state))
+
+                elif kind == CONCURRENT:
+                    """ ConcurrentState.deactivate, the regions in order """
+                    push((EXITED, state))
+                    for region in reversed(state.regions):
+                        push((EXIT, region, True))
+
+                else:
+                    State.deactivate(state, runtime, param)
+
+            elif code == EXITED:
+                State.deactivate(item[1], runtime, param)
+
+            elif code == ENTER:
+                state = item[1]
+                kind = kinds[state.state_id]
+
+                if kind == PLAIN:
+                    State.activate(state, runtime, param)
+
+                elif kind == HIERARCHICAL:
+                    State.activate(state, runtime, param)
+                    if (runtime.transition and
+                        runtime.transition.end == state):
+                        push((ENTER, state.start_state))
+
+                elif kind == CONCURRENT:
+                    if State.activate(state, runtime, param):
+                        for region in reversed(state.regions):
+                            push((ENTER, region.start_state))
+                            push((ENTER, region))
+
+                elif kind == START:
+                    self.pseudo_dispatch(runtime, state, param, push)
+
+                elif kind == HISTORY:
+                    assert len(state.transitions) == 1,\
+                        "History state cannot have more than 1 transition"
+
+                    assert ((len(state.transitions[0].deactivate) == 1) and
+                       (state.transitions[0].deactivate[0] == state))
+
+                    if runtime.has_history_info(state):
+                        push((ENTER, runtime.get_history_state(state)))
+                    else:
+                        self.pseudo_dispatch(runtime, state, param, push)
+
+                else:
+                    """ PseudoState.activate """
+                    runtime.activate(state)
+                    if state.entry:
+                        state.entry.execute(runtime, param)
+
+    def pseudo_dispatch(self, runtime, state, param, push):
+        """ State.dispatch(runtime, None, param) of a start or history state """
+        for transition in state.candidate_transitions(None):
+            if (transition.guard and
+                (not transition.guard.check(runtime, param))):
+                continue
+
+            for item in reversed(self.fire_items(transition, None)):
+                push(item)
+            return
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+from multiprocessing.pool import ThreadPool
+
+""" Operations of a partition log """
+ACTIVATE, DEACTIVATE, HISTORY = range(3)
+
+def create_pool(workers=4):
+    """ A pool for ConcurrentState.set_pool, shared by as many states """
+    return ThreadPool(workers)
+
+class RegionRuntime(object):
+
+    """
+        Runtime partition of one region for one run to completion step.
+        Reads fall through to the runtime of the chart, writes (activation,
+        deactivation and history records) are kept in an overlay the
+        region sees and in a log merge() replays on the chart runtime.
+        The listeners of the chart runtime are called by the replay, in
+        the dispatching thread.
+    """
+
+    __slots__ = ('base', 'active', 'current', 'history', 'log',
+                 'transition', 'event', 'last_transition')
+
+    def __init__(self, base):
+        self.base = base
+        self.active = {}
+        self.current = {}
+        self.history = {}
+        self.log = []
+        self.transition = None
+        self.event = None
+        self.last_transition = None
+
+    def is_active(self, state):
+        if state in self.active:
+            return self.active[state]
+
+        return self.base.is_active(state)
+
+    def get_current_state(self, state):
+        if state in self.current:
+            return self.current[state]
+
+        return self.base.get_current_state(state)
+
+    def activate(self, state):
+        self.log.append((ACTIVATE, state, None))
+        self.active[state] = True
+        self.current[state] = None
+
+        if state.context:
+            assert self.is_active(state.context),\
+                "Activate record not present for parent"
+
+            self.current[state.context] = state
+
+    def deactivate(self, state):
+        if self.is_active(state):
+            self.log.append((DEACTIVATE, state, None))
+            self.active[state] = False
+            self.current[state] = None
+
+    def has_history_info(self, history_state):
+        return (history_state in self.history or 
+                self.base.has_history_info(history_state))
+
+    def get_history_state(self, history_state):
+        if history_state in self.history:
+            return self.history[history_state]
+
+        return self.base.get_history_state(history_state)
+
+    def store_history_info(self, history_state, actual_state):
+        self.log.append((HISTORY, history_state, actual_state))
+        self.history[history_state] = actual_state
+
+    def merge(self):
+        base = self.base
+        for operation, state, actual_state in self.log:
+            if operation == ACTIVATE:
+                base.activate(state)
+            elif operation == DEACTIVATE:
+                base.deactivate(state)
+            else:
+                base.store_history_info(state, actual_state)
+
+        self.log = []
+
+def _subtree(region, states):
+    """ The region and the states nested in it """
+    subtree = set([region])
+    for state in states:
+        context = state.context
+        while context is not None:
+            if context is region:
+                subtree.add(state)
+                break
+            context = context.context
+
+    return subtree
+
+def partitionable(state, event):
+    """
+        True when the regions of the concurrent state can take the event
+        in parallel: at least two regions have a transition on it and none
+        of the transitions the event (or an event-less step) can fire in a
+        region exits or enters a state outside that region. Computed once
+        per event id, the definition is frozen by then.
+    """
+    events = state.parallel_events
+    if event.id in events:
+        return events[event.id]
+
+    states = state.statechart.states
+    handling = 0
+    local = True
+    for region in state.regions:
+        subtree = _subtree(region, states)
+        handles = False
+        for start in subtree:
+            for transition in start.transitions:
+                if (transition.event is not None and
+                    transition.event.id != event.id):
+                    continue
+
+                if transition.event is not None:
+                    handles = True
+
+                for changed in transition.deactivate + transition.activate:
+                    if changed not in subtree:
+                        local = False
+
+        if handles:
+            handling += 1
+
+    events[event.id] = local and handling > 1
+    return events[event.id]
+
+def dispatch_regions(state, runtime, event, param):
+    """
+        ConcurrentState.dispatch of the regions on the pool of the state.
+        Every region dispatches on its own partition, the pool is the
+        barrier of the step; the partitions are then merged in region
+        order, the order the sequential dispatch applies them in. If a
+        region raises, nothing is merged and the exception propagates.
+    """
+    regions = state.regions
+    partitions = [RegionRuntime(runtime) for region in regions]
+
+    def dispatch(i):
+        return regions[i].dispatch(partitions[i], event, param)
+
+    results = state.pool.map(dispatch, range(len(regions)))
+
+    for partition in partitions:
+        partition.merge()
+        if partition.last_transition:
+            runtime.last_transition = partition.last_transition
+
+    return any(results)
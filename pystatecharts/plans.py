@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+from array import array
+
+from compiler import CompileError
+from compiler import classify_state
+from compiler import check_transition
+from compiler import CHART, CONCURRENT, HIERARCHICAL
+from runtime import CompactRuntimeData
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+""" Returned by select when the plan depends on more than the configuration """
+UNCACHEABLE = None
+
+""" Cached for such keys, the statechart dispatches them """
+BYPASS = object()
+
+def cache_plans(statechart, size=1024):
+    """
+        Returns the statechart with a plan cache, or the statechart itself
+        when it uses features the planner cannot reason about
+    """
+    try:
+        return PlannedStatechart(statechart, size)
+    except CompileError:
+        return statechart
+
+class PlanCache(object):
+
+    """
+        Bounded LRU map of (configuration fingerprint, event id) to a plan,
+        the ordered transitions a dispatch fires. hits (plans replayed),
+        misses (plans selected) and bypassed (dispatches that can not be
+        planned, e.g. guarded) count the dispatches.
+    """
+
+    def __init__(self, size=1024):
+        assert size > 0, "Plan cache size must be positive"
+        self.size = size
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key):
+        plans = self.plans
+        if key in plans:
+            """ Most recently used last """
+            plan = plans.pop(key)
+            plans[key] = plan
+            return plan
+
+        return None
+
+    def put(self, key, plan):
+        plans = self.plans
+        if len(plans) >= self.size:
+            plans.popitem(last=False)
+
+        plans[key] = plan
+
+    def clear(self):
+        self.plans.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'bypassed': self.bypassed, 'size': len(self.plans)}
+
+    def __len__(self):
+        return len(self.plans)
+
+class PlannedStatechart(object):
+
+    """
+        Interpreter front end with a plan cache. For guard-free dispatches
+        the transitions that win depend only on the active configuration
+        (the bitset of a CompactRuntimeData) and the event, the winners are
+        looked up once and replayed: each transition fires its precomputed
+        exit, action and entry lists, the regions of a concurrent state in
+        region order. Guarded candidates, event-less dispatches and
+        configurations with a context whose current child is not active
+        bypass the cache and are dispatched by the statechart.
+    """
+
+    def __init__(self, statechart, size=1024):
+        if OrderedDict is None:
+            raise CompileError("collections.OrderedDict is not available")
+
+        statechart.finalize()
+        self.statechart = statechart
+        self.param = statechart.param
+        self.runtime = None
+        self.cache = PlanCache(size)
+
+        self.kinds = [classify_state(state) for state in
+                        statechart.state_table]
+        for transition in statechart.transition_table:
+            check_transition(transition)
+
+    """ Interface shared with Statechart """
+
+    def finalize(self):
+        pass
+
+    def create_runtime(self):
+        statechart = self.statechart
+        return CompactRuntimeData(statechart.state_table,
+                                  statechart.history_count,
+                                  statechart.event_masks,
+                                  statechart.wildcard_mask)
+
+    def start_runtime(self, runtime, param):
+        self.statechart.start_runtime(runtime, param)
+
+    def relevant_runtime(self, runtime, event):
+        return self.statechart.relevant_runtime(runtime, event)
+
+    def select(self, state, runtime, event):
+        """
+            The transitions state.dispatch would fire, in order, or
+            UNCACHEABLE. Mirrors the dispatch methods of the stock classes
+            without firing anything.
+        """
+        kind = self.kinds[state.state_id]
+
+        if kind == CHART or kind == HIERARCHICAL:
+            current = runtime.get_current_state(state)
+            if current is None or not runtime.is_active(current):
+                return UNCACHEABLE
+
+            plan = self.select(current, runtime, event)
+            if plan is UNCACHEABLE or plan or kind == CHART:
+                return plan
+
+        elif kind == CONCURRENT:
+            plan = ()
+            for region in state.regions:
+                if not runtime.is_active(region):
+                    return UNCACHEABLE
+
+                region_plan = self.select(region, runtime, event)
+                if region_plan is UNCACHEABLE:
+                    return UNCACHEABLE
+
+                plan = plan + region_plan
+
+            """ 
+                A transition out of a region changes the configuration the 
+                regions after it are dispatched in
+            """
+            if len(plan) > 1:
+                for transition in plan:
+                    for exited in transition.deactivate:
+                        if exited is state or exited in state.regions:
+                            return UNCACHEABLE
+
+            if plan:
+                return plan
+
+        for transition in state.candidate_transitions(event):
+            if transition.guard:
+                return UNCACHEABLE
+
+            return (transition,)
+
+        return ()
+
+    def dispatch_runtime(self, runtime, event, param):
+        statechart = self.statechart
+        if not runtime.relevant(event):
+            runtime.dropped += 1
+            return False
+
+        cache = self.cache
+        if event is None:
+            cache.bypassed += 1
+            return statechart.dispatch_runtime(runtime, event, param)
+
+        key = (runtime.active, event.id)
+        plan = cache.get(key)
+        if plan is None:
+            cache.misses += 1
+            plan = self.select(statechart, runtime, event)
+            if plan is UNCACHEABLE:
+                plan = BYPASS
+
+            cache.put(key, plan)
+        elif plan is not BYPASS:
+            cache.hits += 1
+
+        if plan is BYPASS:
+            cache.bypassed += 1
+            return statechart.dispatch_runtime(runtime, event, param)
+
+        for transition in plan:
+            transition.fire(runtime, event, param)
+
+        return len(plan) > 0
+
+    def dispatch_runtime_many(self, runtime, events, param):
+        """ Same results as Statechart.dispatch_runtime_many """
+        results = array('i')
+        append = results.append
+
+        for event in events:
+            runtime.last_transition = None
+            if self.dispatch_runtime(runtime, event, param):
+                append(runtime.last_transition.transition_id)
+            else:
+                append(-1)
+
+        return results
+
+    def start(self):
+        self.runtime = self.create_runtime()
+        self.start_runtime(self.runtime, self.param)
+
+    def dispatch(self, event):
+        return self.dispatch_runtime(self.runtime, event, self.param)
+
+    def dispatch_many(self, events):
+        return self.dispatch_runtime_many(self.runtime, events, self.param)
+
+    def relevant(self, event):
+        return self.relevant_runtime(self.runtime, event)
+
+    def dropped(self):
+        return self.runtime.dropped
@@ -53,6 +53,9 @@ class HistoryState(PseudoState):
         PseudoState.__init__(self, context)
         self.state = None
 
+        """ Slot in CompactRuntimeData.history, assigned on finalize """
+        self.history_id = -1
+
         if isinstance(self.context, HierarchicalState): 
             if self.context.history:
                 assert False, "history state already present" 
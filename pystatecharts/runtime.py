@@ -4,19 +4,41 @@ __author__      = "Vishal Patil"
 __copyright__   = "Copyright 2010 - 2011, Vishal Patil"
 __license__     = "New-style BSD"
 
+from array import array
+
 class StateRuntimeData(object):
 
+    __slots__ = ('current_state',)
+
     def __init__(self):
         self.current_state = None
-        self.state_set = list()
 
 class RuntimeData(object):
 
+    __slots__ = ('active_states', 'history_states', 'transition', 'event',
+                 'last_transition', 'listeners', 'handled', 'wildcards',
+                 'dropped')
+
     def __init__(self):
         self.active_states = {}
         self.history_states = {}
         self.transition = None
         self.event = None
+        self.last_transition = None
+        self.listeners = ()
+
+        """ 
+            Event id -> number of active states with a transition on it, 
+            and the number of active states with event-less transitions 
+            (those are candidates for any event)
+        """
+        self.handled = {}
+        self.wildcards = 0
+        self.dropped = 0
+
+    def add_listener(self, listener):
+        """ The listener is told when a state is deactivated """
+        self.listeners = self.listeners + (listener,)
 
     def is_active(self, state):
         status = False
@@ -26,9 +48,33 @@ class RuntimeData(object):
 
         return status
 
+    def get_current_state(self, state):
+        return self.active_states[state].current_state
+
+    def relevant(self, event):
+        """ True when an active state has a candidate transition """
+        return (event is None or self.wildcards > 0 or 
+                self.handled.get(event.id, 0) > 0)
+
+    def note_dropped(self):
+        """ Counts an event relevant() turned away without a dispatch """
+        self.dropped += 1
+
+    def count_handled(self, state, step):
+        if state.transition_index is None:
+            state.build_transition_index()
+
+        handled = self.handled
+        for id in state.transition_index:
+            handled[id] = handled.get(id, 0) + step
+
+        if state.eventless_transitions:
+            self.wildcards += step
+
     def activate(self, state):
         if not (state in self.active_states):
             self.active_states[state] = StateRuntimeData()
+            self.count_handled(state, 1)
 
         data = self.active_states[state]			
         data.current_state = None
@@ -46,6 +92,10 @@ class RuntimeData(object):
             data.current_state = None
             data = None
             del self.active_states[state]
+            self.count_handled(state, -1)
+
+            for listener in self.listeners:
+                listener.state_deactivated(self, state)
 
     def has_history_info(self, history_state):
         status = False
@@ -67,3 +117,105 @@ class RuntimeData(object):
     def reset(self):
         self.active_states.clear()
         self.history_states.clear()
+        self.handled.clear()
+        self.wildcards = 0
+        self.dropped = 0
+
+class CompactRuntimeData(object):
+
+    """
+        Same interface as RuntimeData, keyed on the dense state ids assigned
+        by Statechart.finalize(). The active configuration is a bitset, the
+        current child of every context and the history records are int
+        arrays, -1 meaning none. The id -> State table is shared with the
+        statechart, so are the relevance masks: event id -> bitset of the 
+        states with a transition on it, and the bitset of the states with 
+        event-less transitions.
+    """
+
+    __slots__ = ('states', 'active', 'current', 'history',
+                 'transition', 'event', 'last_transition', 'listeners',
+                 'masks', 'wildcard', 'dropped')
+
+    def __init__(self, states, history_count, masks=None, wildcard=0):
+        self.states = states
+        self.masks = masks
+        self.wildcard = wildcard
+        self.dropped = 0
+        self.active = 0
+        self.current = array('i', [-1]) * len(states)
+        self.history = array('i', [-1]) * history_count
+        self.transition = None
+        self.event = None
+        self.last_transition = None
+        self.listeners = ()
+
+    def add_listener(self, listener):
+        self.listeners = self.listeners + (listener,)
+
+    def is_active(self, state):
+        return (self.active >> state.state_id) & 1 == 1
+
+    def get_current_state(self, state):
+        state_id = self.current[state.state_id]
+        if state_id < 0:
+            return None
+
+        return self.states[state_id]
+
+    def relevant(self, event):
+        if event is None or self.masks is None:
+            return True
+
+        return (self.active & 
+                (self.masks.get(event.id, 0) | self.wildcard)) != 0
+
+    def note_dropped(self):
+        self.dropped += 1
+
+    def activate(self, state):
+        state_id = state.state_id
+        self.active |= 1 << state_id
+        self.current[state_id] = -1
+
+        context = state.context
+        if context:
+            assert self.is_active(context),\
+                "Activate record not present for parent"
+
+            self.current[context.state_id] = state_id
+
+    def deactivate(self, state):
+        state_id = state.state_id
+        if (self.active >> state_id) & 1:
+            self.current[state_id] = -1
+            self.active &= ~(1 << state_id)
+
+            for listener in self.listeners:
+                listener.state_deactivated(self, state)
+
+    def has_history_info(self, history_state):
+        return self.history[history_state.history_id] >= 0
+
+    def get_history_state(self, history_state):
+        assert self.has_history_info(history_state),\
+            "Record not found for history state"
+
+        return self.states[self.history[history_state.history_id]]
+
+    def store_history_info(self, history_state, actual_state):
+        state_id = -1
+        if actual_state:
+            state_id = actual_state.state_id
+
+        self.history[history_state.history_id] = state_id
+
+    def reset(self):
+        self.active = 0
+        for i in xrange(len(self.current)):
+            self.current[i] = -1
+
+        for i in xrange(len(self.history)):
+            self.history[i] = -1
+
+        self.dropped = 0
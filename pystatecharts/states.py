@@ -4,7 +4,11 @@ __author__      = "Vishal Patil"
 __copyright__   = "Copyright 2010 - 2011, Vishal Patil"
 __license__     = "New-style BSD"
 
+from array import array
+
 from runtime import RuntimeData
+from runtime import CompactRuntimeData
+import parallel
 
 class State(object):
 
@@ -30,6 +34,7 @@ class State(object):
             
             if isinstance(parent, Statechart):
                 self.statechart = parent 
+                self.statechart.register_state(self)
             else:
                 assert False, "Statechart not found check hierarchy"
 
@@ -37,16 +42,66 @@ class State(object):
         self.do    = do 
         self.exit  = exit 
         self.transitions = []
+        self.transition_index = None
+        self.eventless_transitions = ()
+
+        """ Dense id, assigned when the statechart is finalized """
+        self.state_id = -1
 
     def add_transition(self, transition):
         if transition == None:
             assert False, "Cannot add null transition"
 
+        """ The relevance masks and counts of finalize would go stale """
+        assert not self.statechart.finalized,\
+            "Cannot add a transition to a finalized statechart"
+
         if (transition.guard):
             self.transitions.insert(0, transition)
         else:
             self.transitions.append(transition)
 
+        """ Adding a transition invalidates the event index """
+        self.transition_index = None
+
+    def build_transition_index(self):
+        """ 
+            Build a frozen map of event id to the transitions that can fire 
+            on that event. Each entry keeps the order of self.transitions
+            (guarded transitions first), with the event-less transitions
+            merged in at their original positions.
+        """
+        index = {}
+        for transition in self.transitions:
+            if transition.event is not None:
+                index[transition.event.id] = None
+
+        for id in index:
+            index[id] = tuple([t for t in self.transitions 
+                                if t.event is None or t.event.id == id])
+
+        self.eventless_transitions = tuple([t for t in self.transitions
+                                                if t.event is None])
+        self.transition_index = index
+
+    def candidate_transitions(self, event):
+        if self.transition_index is None:
+            self.build_transition_index()
+
+        if event is None:
+            return self.eventless_transitions
+
+        return self.transition_index.get(event.id, 
+                                         self.eventless_transitions)
+
+    def dispatch_transitions(self, runtime, event, param):
+        """ Fire the first candidate transition whose guard allows it """
+        for transition in self.candidate_transitions(event):
+            if transition.fire(runtime, event, param):
+                return True
+
+        return False
+
     def activate(self, runtime, param):
         activated = False
 
@@ -73,14 +128,7 @@ class State(object):
             runtime.deactivate(self)
 
     def dispatch(self, runtime, event, param):
-        status = False
-
-        for transition in self.transitions:	
-            if transition.execute(runtime, event, param):
-                status = True
-                break
-
-        return status 
+        return self.dispatch_transitions(runtime, event, param)
 
 class Context(State):
 
@@ -103,6 +151,9 @@ class Transition(object):
         """ Used to store the states that will get de-activated """
         self.deactivate = list() 
 
+        """ Dense id, assigned when the statechart is finalized """
+        self.transition_id = -1
+
         self.calculate_changed_states(start, end)
 
         start.add_transition(self)
@@ -155,12 +206,14 @@ class Transition(object):
             i += 1
 
     def execute(self, runtime, event, param):
-        if (self.event and (event == None)):
-            return False
+        if self.event is not None:
+            if event is None or self.event.id != event.id:
+                return False
 
-        if (self.event and (self.event != event)):
-            return False
+        return self.fire(runtime, event, param)
 
+    def fire(self, runtime, event, param):
+        """ Take the transition, the event is assumed to have matched """
         if (self.guard and (not self.guard.check(runtime, param))):
             return False
 
@@ -179,6 +232,9 @@ class Transition(object):
         runtime.transition = None 
         runtime.event = None
 
+        """ Set after the activations, nested transitions finish first """
+        runtime.last_transition = self
+
         return True	
 
 class HierarchicalState(Context):
@@ -200,42 +256,39 @@ class HierarchicalState(Context):
 
     def deactivate(self, runtime, param):
 
-        assert (self in runtime.active_states), self
+        assert runtime.is_active(self), self
                         
-        rdata = runtime.active_states[self]
+        current_state = runtime.get_current_state(self)
         if self.history:
-            runtime.store_history_info(self.history, rdata.current_state)
+            runtime.store_history_info(self.history, current_state)
 
-        if runtime.is_active(rdata.current_state):
-            rdata.current_state.deactivate(runtime, param)
+        if current_state and runtime.is_active(current_state):
+            current_state.deactivate(runtime, param)
 
         Context.deactivate(self, runtime, param)
 
     def dispatch(self, runtime, event, param):
         
-        if not runtime.active_states[self]:
+        if not runtime.is_active(self):
             assert False, (("HierarchicalState: " +
                         "trying to dispatch on inactive state"))
 
         """ See if the current child state can handle the event """
-        rdata = runtime.active_states[self]
-        if rdata.current_state == None and self.start_state:
+        current_state = runtime.get_current_state(self)
+        if current_state == None and self.start_state:
             runtime.activate(self.start_state) 
-            rdata.current_state.activate(runtime, param)
+            current_state = self.start_state
+            current_state.activate(runtime, param)
 
-        if (rdata.current_state and 
-            rdata.current_state.dispatch(runtime, event, param)):
+        if (current_state and 
+            current_state.dispatch(runtime, event, param)):
             return True
        
         """ 
             Since none of the child states can handle the event, let this 
             state try handling the event.
         """
-        for transition in self.transitions: 
-            if transition.execute(runtime, event, param):
-                return True
-
-        return False                
+        return self.dispatch_transitions(runtime, event, param)
 
 class ConcurrentState(Context):
 
@@ -243,19 +296,30 @@ class ConcurrentState(Context):
         Context.__init__(self, context, entry, do, exit)
         self.regions = []
 
+        """ Pool the regions dispatch on, see set_pool """
+        self.pool = None
+        self.parallel_events = {}
+
     def add_region(self, region):
         self.regions.append(region)
 
+    def set_pool(self, pool):
+        """ 
+            Opt in to dispatching the regions in parallel on pool (see 
+            parallel.create_pool), None to dispatch them in sequence again.
+            An event is dispatched in parallel when it stays inside every 
+            region, see parallel.partitionable; each region then sees the 
+            configuration of the other regions before the step. 
+        """
+        self.pool = pool
+
     def activate(self, runtime, param):
         status = False
 
         if Context.activate(self, runtime, param):
-            rdata = runtime.active_states[self]
-
             for region in self.regions:
-                if not (region in rdata.state_set):
-                    region.activate(runtime, param)
-                    region.start_state.activate(runtime, param)
+                region.activate(runtime, param)
+                region.start_state.activate(runtime, param)
                     
         return status            
 
@@ -268,47 +332,162 @@ class ConcurrentState(Context):
 
     def dispatch(self, runtime, event, param):
 
-        if not runtime.active_states[self]:
+        if not runtime.is_active(self):
             assert False, "Dispatching an event on inactive state"
 
         dispatched = False
 
         """ Check if any of the child regions can handle the event """
-        for region in self.regions:
-            if region.dispatch(runtime, event, param):
-                dispatched = True
+        if (self.pool is not None and event is not None and
+            not isinstance(runtime, parallel.RegionRuntime) and
+            parallel.partitionable(self, event)):
+            dispatched = parallel.dispatch_regions(self, runtime, event, param)
+        else:
+            for region in self.regions:
+                if region.dispatch(runtime, event, param):
+                    dispatched = True
 
         if dispatched:
             return True
 
         """ Check if this state can handle the event by itself """
-        for transition in self.transitions:
-            if transition.execute(runtime, event, param):
-               dispatched = True
-               break
-
-        return dispatched
+        return self.dispatch_transitions(runtime, event, param)
 
 class Statechart(Context):
 
-    def __init__(self, param):
+    def __init__(self, param, compact=False):
+        """ States register themselves here as they are created """
+        self.states = []
+        self.finalized = False
+
         Context.__init__(self, None, None, None, None) 
         self.param = param
 
+        """ Use CompactRuntimeData for the runtimes of this statechart """
+        self.compact = compact
+        self.state_table = []
+        self.transition_table = []
+        self.history_count = 0
+
+        """ Relevance masks of the compact runtimes, see finalize """
+        self.event_masks = None
+        self.wildcard_mask = 0
+
+    def register_state(self, state):
+        assert not self.finalized, "Cannot add a state to a finalized statechart"
+        self.states.append(state)
+
+    def finalize(self):
+        """ 
+            Freeze the definition. The state graph, the transitions and 
+            their activate/deactivate lists are shared by every runtime 
+            created from this statechart and must not change after this.
+        """
+        if self.finalized:
+            return
+
+        """ Dense ids, the statechart itself is 0 """
+        self.state_table = [self] + self.states
+        self.transition_table = []
+        self.event_masks = {}
+        self.wildcard_mask = 0
+        history_id = 0
+        for state_id, state in enumerate(self.state_table):
+            state.state_id = state_id
+            state.build_transition_index()
+
+            """ The states that can fire on an event, any event if event-less """
+            for id in state.transition_index:
+                self.event_masks[id] = (self.event_masks.get(id, 0) | 
+                                        (1 << state_id))
+            if state.eventless_transitions:
+                self.wildcard_mask |= 1 << state_id
+
+            for transition in state.transitions:
+                transition.transition_id = len(self.transition_table)
+                self.transition_table.append(transition)
+
+            if isinstance(state, HierarchicalState) and state.history:
+                state.history.history_id = history_id
+                history_id += 1
+
+        self.history_count = history_id
+        self.finalized = True
+
+    def create_runtime(self):
+        if self.compact:
+            self.finalize()
+            return CompactRuntimeData(self.state_table, self.history_count,
+                                      self.event_masks, self.wildcard_mask)
+
+        return RuntimeData()
+
+    def start_runtime(self, runtime, param):
+        self.finalize()
+        runtime.reset()
+        runtime.activate(self)
+        runtime.activate(self.start_state)
+        self.dispatch_runtime(runtime, None, param)
+
+    def relevant_runtime(self, runtime, event):
+        """
+            False when no active state has a transition the event can fire,
+            a query only: dispatch_runtime counts the dropped events
+        """
+        return runtime.relevant(event)
+
+    def dispatch_runtime(self, runtime, event, param):
+        if not runtime.relevant(event):
+            runtime.dropped += 1
+            return False
+
+        current_state = runtime.get_current_state(self)
+        return current_state.dispatch(runtime, event, param)	
+
+    def dispatch_runtime_many(self, runtime, events, param):
+        """
+            Dispatch a batch of events. The current state of the statechart
+            is looked up once and again only after a transition fires. 
+            Returns an array with the id of the transition fired for each 
+            event, -1 when the event was not handled.
+        """
+        results = array('i')
+        append = results.append
+        current_state = runtime.get_current_state(self)
+
+        relevant = runtime.relevant
+
+        for event in events:
+            runtime.last_transition = None
+            if not relevant(event):
+                runtime.dropped += 1
+                append(-1)
+            elif current_state.dispatch(runtime, event, param):
+                append(runtime.last_transition.transition_id)
+                current_state = runtime.get_current_state(self)
+            else:
+                append(-1)
+
+        return results
+
     def start(self):
-        self.runtime = RuntimeData()
-        self.runtime.reset()
-        self.runtime.activate(self)
-        self.runtime.activate(self.start_state)
-        self.dispatch(None)
+        self.runtime = self.create_runtime()
+        self.start_runtime(self.runtime, self.param)
 
     def dispatch(self, event):
-        current_state = self.runtime.active_states[self].current_state
-        return current_state.dispatch(self.runtime, event, self.param)	
+        return self.dispatch_runtime(self.runtime, event, self.param)
+
+    def dispatch_many(self, events):
+        return self.dispatch_runtime_many(self.runtime, events, self.param)
+
+    def relevant(self, event):
+        return self.relevant_runtime(self.runtime, event)
+
+    def dropped(self):
+        return self.runtime.dropped
 
     def add_transition(self, transition):
         assert False, "Cannot add transition to a statechart"
     
     def shutdown(self):
         pass
-
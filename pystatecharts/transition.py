@@ -3,15 +3,45 @@
 from action import Action
 from states import Statechart
 
-class Event(object):
+class EventType(object):
+
+    """ 
+        Immutable description of an event id, one instance per id is 
+        interned by the EventRegistry so it can be compared by identity
+    """
+
+    __slots__ = ('id',)
+
     def __init__(self, id):
-        self.id = id
+        object.__setattr__(self, 'id', id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EventType is immutable")
 
     def __eq__(self, event):
-        if event == None:
-            return False                
+        return event is not None and self.id == event.id
+
+    def __ne__(self, event):
+        return not self.__eq__(event)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return "EventType:%s" % str(self.id)
+
+class Event(object):
 
-        return self.id == event.id
+    """ An occurrence of an event, the payload is carried in data """
+
+    __slots__ = ('id', 'data')
+
+    def __init__(self, id, data=None):
+        self.id = id
+        self.data = data
+
+    def __eq__(self, event):
+        return event is not None and self.id == event.id
 
     def __ne__(self, event):
         return not self.__eq__(event)
@@ -19,6 +49,46 @@ class Event(object):
     def __str__(self):
         return "Event:%s" % str(self.id)
 
+class EventRegistry(object):
+
+    """
+        Interns one EventType per event id and hands out Event objects 
+        from a freelist. An event given back with release() is reused by a
+        later call to event(), it must not be referenced after that.
+
+        The generated charts intern the events of their transitions here,
+        and StatechartThread releases every event it took from the queue
+        once it has been dispatched (or dropped). An action that keeps the
+        event, or its data, past the dispatch must copy what it needs.
+    """
+
+    def __init__(self, freelist_size=1024):
+        self.types = {}
+        self.freelist = []
+        self.freelist_size = freelist_size
+
+    def intern(self, id):
+        event_type = self.types.get(id)
+        if event_type is None:
+            event_type = self.types.setdefault(id, EventType(id))
+
+        return event_type
+
+    def event(self, id, data=None):
+        try:
+            event = self.freelist.pop()
+        except IndexError:
+            return Event(id, data)
+
+        event.id = id
+        event.data = data
+        return event
+
+    def release(self, event):
+        if len(self.freelist) < self.freelist_size:
+            event.data = None
+            self.freelist.append(event)
+
 class Guard(object):
 	def check(self, runtime, param):
 		raise NotImplementedError
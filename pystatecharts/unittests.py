@@ -5,6 +5,9 @@ __copyright__   = "Copyright 2010 - 2011, Vishal Patil"
 __license__     = "New-style BSD"
 
 import re
+import sys
+import Queue
+import threading
 import unittest
 
 from states import State
@@ -17,6 +20,25 @@ from pseudostates import EndState
 from pseudostates import HistoryState 
 from action import Action
 from transition import Event
+from transition import Guard
+from transition import EventType
+from transition import EventRegistry
+from instances import InstanceManager
+from runtime import CompactRuntimeData
+from compiler import CompiledStatechart
+from compiler import compile_statechart
+from plans import PlannedStatechart
+from plans import cache_plans
+from iterative import IterativeStatechart
+from iterative import make_iterative
+from parallel import create_pool
+from parallel import partitionable
+from activities import ActivityRunner
+from activities import current_task
+from vectorized import numpy
+from vectorized import create_manager
+from vectorized import VectorizedManager
+from vectorized import BatchInstanceManager
 
 class TestParam(object):
 
@@ -68,6 +90,14 @@ class TestExitClassAction(TestClassAction):
         TestClassAction.__init__(self, state_name)
         self.action_name = "exit" 
 
+class TestGuard(Guard):
+
+    def __init__(self, allow):
+        self.allow = allow
+
+    def check(self, runtime, param):
+        return self.allow
+
 class Base(unittest.TestCase):
 
     def create_statechart(self, param):       
@@ -303,5 +333,811 @@ class ConcurrentTest(Base):
                         "F:exit B:exit D:exit A:exit X:exit B:C C:entry C:do start_c:history_c J:entry J:do")
         self.dispatch_events(events, expected_path)
 
+class InstanceManagerMixin(object):
+
+    """ Runs the inherited tests as several sessions of one statechart """
+
+    sessions = 3
+
+    def create_manager(self):
+        return InstanceManager(self.create_statechart(TestParam()))
+
+    def dispatch_events(self, events, expected_path):
+        manager = self.create_manager()
+        params = [TestParam() for key in range(self.sessions)]
+        for key in range(self.sessions):
+            manager.create(key, params[key])
+
+        for event in events:
+            for key in range(self.sessions):
+                manager.dispatch(key, Event(event))
+
+        for param in params:
+            self.assertEquals(param.path, expected_path)
+
+        manager.destroy(0)
+        self.assertEquals(len(manager), self.sessions - 1)
+        self.assertFalse(0 in manager)
+
+class FSMInstanceTest(InstanceManagerMixin, FSMTest):
+    pass
+
+class HSMInstanceTest(InstanceManagerMixin, HSMTest):
+    pass
+
+class ConcurrentInstanceTest(InstanceManagerMixin, ConcurrentTest):
+    pass
+
+class CompactRuntimeMixin(object):
+
+    """ Runs the inherited tests on CompactRuntimeData """
+
+    def create_statechart(self, param):
+        state_chart = super(CompactRuntimeMixin, self).create_statechart(param)
+        state_chart.compact = True
+        return state_chart
+
+class CompactFSMTest(CompactRuntimeMixin, FSMTest):
+    pass
+
+class CompactHSMTest(CompactRuntimeMixin, HSMTest):
+    pass
+
+class CompactConcurrentTest(CompactRuntimeMixin, ConcurrentTest):
+
+    def testDenseIds(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.finalize()
+
+        state_ids = [state.state_id for state in state_chart.state_table]
+        self.assertEquals(state_ids, range(len(state_chart.state_table)))
+        self.assertEquals(state_chart.history_count, 3)
+
+    def testRuntimeSize(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+
+        runtime = state_chart.runtime
+        self.assertTrue(isinstance(runtime, CompactRuntimeData))
+        self.assertFalse(hasattr(runtime, '__dict__'))
+
+        size = (sys.getsizeof(runtime) + sys.getsizeof(runtime.active) +
+                sys.getsizeof(runtime.current) + sys.getsizeof(runtime.history))
+        self.assertTrue(size < 512, size)
+
+class CompactInstanceTest(CompactRuntimeMixin, InstanceManagerMixin,
+                          ConcurrentTest):
+    pass
+
+class TransitionIndexTest(Base):
+
+    def create_statechart(self, param):       
+        state_chart = Statechart(param) 
+
+        start = StartState(state_chart)
+        A = State(state_chart, TestEntryClassAction("A"), 
+                TestDoClassAction("A"), TestExitClassAction("A"))
+        B = State(state_chart, TestEntryClassAction("B"), 
+                TestDoClassAction("B"), TestExitClassAction("B"))
+        C = State(state_chart, TestEntryClassAction("C"),
+                TestDoClassAction("C"), TestExitClassAction("C"))
+
+        TestTransition(start, 'start', A, 'A', None, None) 
+        TestTransition(A, 'A', B, 'B', Event(1), None) 
+        TestTransition(A, 'A', C, 'C', Event(1), TestGuard(False)) 
+        TestTransition(A, 'A', C, 'C', Event(2), TestGuard(True)) 
+        TestTransition(B, 'B', A, 'A', Event(3), None) 
+        TestTransition(B, 'B', C, 'C', None, None) 
+        TestTransition(C, 'C', A, 'A', Event(4), None) 
+
+        self.A = A
+        self.B = B
+        return state_chart
+
+    def testCandidateOrder(self):
+        self.create_statechart(TestParam())
+        transitions = self.A.transitions
+
+        self.assertEquals(self.A.candidate_transitions(Event(1)),
+                          (transitions[1], transitions[2]))
+        self.assertEquals(self.A.candidate_transitions(Event(2)),
+                          (transitions[0],))
+        self.assertEquals(self.A.candidate_transitions(Event(9)), ())
+        self.assertEquals(self.A.candidate_transitions(None), ())
+
+    def testEventlessCandidates(self):
+        self.create_statechart(TestParam())
+        transitions = self.B.transitions
+
+        self.assertEquals(self.B.candidate_transitions(Event(3)),
+                          (transitions[0], transitions[1]))
+        self.assertEquals(self.B.candidate_transitions(Event(9)),
+                          (transitions[1],))
+        self.assertEquals(self.B.candidate_transitions(None),
+                          (transitions[1],))
+
+    def testGuardedDispatch(self):
+        events = [1, 3, 2, 4]
+        expected_path = ("start:A A:entry A:do " +
+                         "A:exit A:B B:entry B:do " +
+                         "B:exit B:A A:entry A:do " +
+                         "A:exit A:C C:entry C:do " +
+                         "C:exit C:A A:entry A:do")
+        self.dispatch_events(events, expected_path)
+
+class CompiledMixin(object):
+
+    """ Runs the inherited tests on the compiled dispatcher """
+
+    def create_statechart(self, param):
+        state_chart = super(CompiledMixin, self).create_statechart(param)
+        compiled = compile_statechart(state_chart)
+        self.assertTrue(isinstance(compiled, CompiledStatechart))
+        return compiled
+
+class CompiledFSMTest(CompiledMixin, FSMTest):
+    pass
+
+class CompiledHSMTest(CompiledMixin, HSMTest):
+    pass
+
+class CompiledConcurrentTest(CompiledMixin, ConcurrentTest):
+    pass
+
+class CompiledGuardTest(CompiledMixin, TransitionIndexTest):
+    pass
+
+class CompiledInstanceTest(CompiledMixin, InstanceManagerMixin,
+                           ConcurrentTest):
+    pass
+
+class PlannedMixin(object):
+
+    """ Runs the inherited tests through the plan cache """
+
+    def create_statechart(self, param):
+        state_chart = super(PlannedMixin, self).create_statechart(param)
+        planned = cache_plans(state_chart)
+        self.assertTrue(isinstance(planned, PlannedStatechart))
+        return planned
+
+class PlannedFSMTest(PlannedMixin, FSMTest):
+
+    def testCounters(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        for event in [1, 4, 6, 4, 6, 4, 5, 5]:
+            state_chart.dispatch(Event(event))
+
+        """ 1 in A, 4 in B, 6 and 5 in C are selected once """
+        cache = state_chart.cache
+        self.assertEquals((cache.hits, cache.misses, cache.bypassed), 
+                          (4, 4, 0))
+
+    def testEviction(self):
+        state_chart = cache_plans(FSMTest.create_statechart(self, 
+                                                            TestParam()), 2)
+        state_chart.start()
+        for event in [1, 4, 7, 1, 4]:
+            state_chart.dispatch(Event(event))
+
+        self.assertEquals(len(state_chart.cache), 2)
+        self.assertEquals(state_chart.cache.hits, 0)
+
+class PlannedHSMTest(PlannedMixin, HSMTest):
+    pass
+
+class PlannedConcurrentTest(PlannedMixin, ConcurrentTest):
+    pass
+
+class PlannedGuardTest(PlannedMixin, TransitionIndexTest):
+
+    def testGuardBypass(self):
+        param = TestParam()
+        state_chart = self.create_statechart(param)
+        state_chart.start()
+
+        """ 1 in A has a guarded candidate, selected once then bypassed """
+        for event in [1, 3, 1]:
+            state_chart.dispatch(Event(event))
+
+        cache = state_chart.cache
+        self.assertEquals((cache.hits, cache.misses, cache.bypassed), 
+                          (0, 2, 2))
+        self.assertEquals(param.path, ("start:A A:entry A:do " +
+                                       "A:exit A:B B:entry B:do " +
+                                       "B:exit B:A A:entry A:do " +
+                                       "A:exit A:B B:entry B:do"))
+
+class PlannedInstanceTest(PlannedMixin, InstanceManagerMixin,
+                          ConcurrentTest):
+    pass
+
+class IterativeMixin(object):
+
+    """ Runs the inherited tests on the iterative engine """
+
+    def create_statechart(self, param):
+        state_chart = super(IterativeMixin, self).create_statechart(param)
+        iterative = make_iterative(state_chart)
+        self.assertTrue(isinstance(iterative, IterativeStatechart))
+        return iterative
+
+class IterativeFSMTest(IterativeMixin, FSMTest):
+    pass
+
+class IterativeHSMTest(IterativeMixin, HSMTest):
+    pass
+
+class IterativeConcurrentTest(IterativeMixin, ConcurrentTest):
+    pass
+
+class IterativeGuardTest(IterativeMixin, TransitionIndexTest):
+    pass
+
+class IterativeCompactTest(IterativeMixin, CompactRuntimeMixin, 
+                           ConcurrentTest):
+    pass
+
+class DeepHierarchyTest(unittest.TestCase):
+
+    def create_statechart(self, param, depth):
+        """ A chain of depth nested states, the innermost handles event 1 """
+        state_chart = Statechart(param)
+        start = StartState(state_chart)
+        context = state_chart
+        outer = None
+        for level in range(depth):
+            name = "H%d" % level
+            state = HierarchicalState(context, TestEntryClassAction(name),
+                                      None, TestExitClassAction(name))
+            if outer is None:
+                outer = state
+                TestTransition(start, 'start', state, name, None, None)
+            else:
+                TestTransition(StartState(context), 'start', state, name,
+                               None, None)
+            context = state
+
+        leaf = State(context, TestEntryClassAction("L"), None,
+                     TestExitClassAction("L"))
+        TestTransition(StartState(context), 'start', leaf, 'L', None, None)
+        TestTransition(leaf, 'L', leaf, 'L', Event(1), None)
+        TestTransition(outer, 'H0', outer, 'H0', Event(2), None)
+        return state_chart
+
+    def testSameOrder(self):
+        paths = []
+        for make in (lambda state_chart: state_chart, make_iterative):
+            param = TestParam()
+            state_chart = make(self.create_statechart(param, 20))
+            state_chart.start()
+            for event in [1, 2, 1, 3]:
+                state_chart.dispatch(Event(event))
+            paths.append(param.path)
+
+        self.assertEquals(paths[0], paths[1])
+
+    def testBeyondRecursionLimit(self):
+        limit = sys.getrecursionlimit()
+        depth = 400
+        sys.setrecursionlimit(200)
+        try:
+            param = TestParam()
+            state_chart = make_iterative(self.create_statechart(param, depth))
+            state_chart.start()
+            param.path = ""
+            self.assertTrue(state_chart.dispatch(Event(1)))
+            self.assertEquals(param.path, "L:exit L:L L:entry")
+        finally:
+            sys.setrecursionlimit(limit)
+
+class ParallelMixin(object):
+
+    """ 
+        Runs the inherited tests with the regions on a pool of one worker,
+        which runs them in region order
+    """
+
+    def create_statechart(self, param):
+        state_chart = super(ParallelMixin, self).create_statechart(param)
+        if not getattr(self, 'pool', None):
+            self.pool = create_pool(1)
+
+        for state in state_chart.states:
+            if isinstance(state, ConcurrentState):
+                state.set_pool(self.pool)
+        return state_chart
+
+    def tearDown(self):
+        if getattr(self, 'pool', None):
+            self.pool.close()
+            self.pool.join()
+
+class ParallelConcurrentTest(ParallelMixin, ConcurrentTest):
+
+    def testPartitionable(self):
+        state_chart = self.create_statechart(TestParam())
+        X = [state for state in state_chart.states
+                if isinstance(state, ConcurrentState)][0]
+
+        """ Both regions, local / one region / leaves the regions """
+        self.assertTrue(partitionable(X, Event(1)))
+        self.assertFalse(partitionable(X, Event(6)))
+        self.assertFalse(partitionable(X, Event(3)))
+        self.assertFalse(partitionable(X, Event(5)))
+
+    def testNotCompiled(self):
+        state_chart = self.create_statechart(TestParam())
+        self.assertTrue(compile_statechart(state_chart) is state_chart)
+
+class ParallelCompactTest(ParallelMixin, CompactRuntimeMixin, 
+                          ConcurrentTest):
+    pass
+
+class RendezvousAction(Action):
+
+    """ Sets its flag and waits for the flag of the other region """
+
+    def __init__(self, mine, other, met):
+        self.mine = mine
+        self.other = other
+        self.met = met
+
+    def execute(self, parameter):
+        self.mine.set()
+        self.met.append(self.other.wait(5) or self.other.is_set())
+
+class ParallelDispatchTest(unittest.TestCase):
+
+    def testRegionsOverlap(self):
+        """ The entry actions of the two regions must run at the same time """
+        state_chart = Statechart(TestParam())
+        flags = [threading.Event(), threading.Event()]
+        met = []
+
+        start = StartState(state_chart)
+        X = ConcurrentState(state_chart, None, None, None)
+        TestTransition(start, 'start', X, 'X', None, None)
+        for i in range(2):
+            region = HierarchicalState(X, None, None, None)
+            start_region = StartState(region)
+            A = State(region, None, None, None)
+            B = State(region, RendezvousAction(flags[i], flags[1 - i], met),
+                      None, None)
+            TestTransition(start_region, 'start', A, 'A', None, None)
+            TestTransition(A, 'A', B, 'B', Event(1), None)
+
+        pool = create_pool(2)
+        try:
+            X.set_pool(pool)
+            state_chart.start()
+            self.assertTrue(state_chart.dispatch(Event(1)))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEquals(met, [True, True])
+        for region in X.regions:
+            current = state_chart.runtime.get_current_state(region)
+            self.assertTrue(current.entry is not None)
+
+class GatedActivity(Action):
+
+    """ Runs until the gate opens or the activity is cancelled """
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self.saw_cancel = False
+
+    def execute(self, parameter):
+        self.started.set()
+        task = current_task()
+        while not self.gate.wait(0.01):
+            if task.cancelled.is_set():
+                self.saw_cancel = True
+                break
+        self.finished.set()
+
+class ActivityTest(unittest.TestCase):
+
+    def create_statechart(self, param, attach=True):
+        """ A -1-> B, B's do-activity posts 7 when done, B -7-> C, B -2-> A """
+        state_chart = Statechart(param)
+        start = StartState(state_chart)
+        A = State(state_chart, None, None, None)
+        self.activity = GatedActivity()
+        B = State(state_chart, TestEntryClassAction("B"), self.activity,
+                  TestExitClassAction("B"))
+        C = State(state_chart, TestEntryClassAction("C"), None, None)
+        TestTransition(start, 'start', A, 'A', None, None)
+        TestTransition(A, 'A', B, 'B', Event(1), None)
+        TestTransition(B, 'B', C, 'C', Event(7), None)
+        TestTransition(B, 'B', A, 'A', Event(2), None)
+
+        self.posted = Queue.Queue()
+        self.runner = ActivityRunner(
+                        lambda event_id, task: self.posted.put(event_id), 2)
+        self.B = B
+        if attach:
+            self.runner.attach(B, 7)
+        return state_chart
+
+    def tearDown(self):
+        self.runner.close()
+
+    def testCompletionEvent(self):
+        param = TestParam()
+        state_chart = self.create_statechart(param)
+        state_chart.start()
+        self.runner.listen(state_chart.runtime)
+
+        """ The dispatch returns while the activity runs """
+        self.assertTrue(state_chart.dispatch(Event(1)))
+        self.assertEquals(self.runner.in_flight(), 1)
+
+        self.activity.gate.set()
+        event_id = self.posted.get(timeout=5)
+        self.assertTrue(state_chart.dispatch(Event(event_id)))
+        self.assertEquals(param.path,
+                          "start:A A:B B:entry B:exit B:C C:entry")
+
+        stats = self.runner.stats()
+        self.assertEquals((stats['in_flight'], stats['started'],
+                           stats['completed'], stats['cancelled']),
+                          (0, 1, 1, 0))
+
+    def testCancelOnExit(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        self.runner.listen(state_chart.runtime)
+
+        state_chart.dispatch(Event(1))
+        self.assertTrue(self.activity.started.wait(5) or
+                        self.activity.started.is_set())
+        state_chart.dispatch(Event(2))
+        self.assertEquals(self.runner.in_flight(), 0)
+        self.assertTrue(self.activity.finished.wait(5) or
+                        self.activity.finished.is_set())
+        self.assertTrue(self.activity.saw_cancel)
+
+        stats = self.runner.stats()
+        self.assertEquals((stats['completed'], stats['cancelled']), (0, 1))
+        self.assertRaises(Queue.Empty, self.posted.get, True, 0.05)
+
+    def testPostExcludesExit(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        self.runner.listen(state_chart.runtime)
+        held = []
+
+        def post(event_id, task):
+            """ An exit of B would wait for the lock until the post is done """
+            held.append(not self.runner.lock.acquire(False))
+            self.posted.put(event_id)
+
+        self.runner.post = post
+        state_chart.dispatch(Event(1))
+        self.activity.gate.set()
+        self.assertEquals(self.posted.get(timeout=5), 7)
+        self.assertEquals(held, [True])
+
+    def testFailureNotPosted(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        self.runner.listen(state_chart.runtime)
+
+        def fail(parameter):
+            raise ValueError("activity failed")
+
+        self.activity.execute = fail
+        state_chart.dispatch(Event(1))
+        self.assertRaises(Queue.Empty, self.posted.get, True, 0.1)
+
+        stats = self.runner.stats()
+        self.assertEquals((stats['in_flight'], stats['completed'],
+                           stats['failed']), (0, 0, 1))
+
+    def testAttachAfterCompile(self):
+        param = TestParam()
+        state_chart = self.create_statechart(param, False)
+
+        """ B would run its do action inline, the compiled code sees attach """
+        compiled = compile_statechart(state_chart)
+        self.assertTrue(compiled is not state_chart)
+        self.runner.attach(self.B, 7)
+        compiled.start()
+        self.runner.listen(compiled.runtime)
+
+        self.assertTrue(compiled.dispatch(Event(1)))
+        self.assertEquals(self.runner.in_flight(), 1)
+        self.activity.gate.set()
+        self.assertTrue(compiled.dispatch(Event(self.posted.get(timeout=5))))
+        self.assertEquals(param.path,
+                          "start:A A:B B:entry B:exit B:C C:entry")
+
+class CompilerFallbackTest(Base):
+
+    def testOverriddenDispatch(self):
+        state_chart = Statechart(TestParam())
+
+        class CustomState(State):
+            def dispatch(self, runtime, event, param):
+                return State.dispatch(self, runtime, event, param)
+
+        start = StartState(state_chart)
+        A = CustomState(state_chart, None, None, None)
+        TestTransition(start, 'start', A, 'A', None, None)
+
+        self.assertTrue(compile_statechart(state_chart) is state_chart)
+
+class BatchDispatchMixin(object):
+
+    """ Runs the inherited tests through dispatch_many """
+
+    def dispatch_events(self, events, expected_path):
+        param   = TestParam()
+        state_chart = self.create_statechart(param)
+        state_chart.start()
+        results = state_chart.dispatch_many([Event(event) for event in events])
+        self.assertEquals(len(results), len(events))
+        self.assertEquals(param.path, expected_path)    
+
+class BatchFSMTest(BatchDispatchMixin, FSMTest):
+
+    def testTransitionIds(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        results = state_chart.dispatch_many([Event(1), Event(9), Event(2), 
+                                             Event(3)])
+        self.assertEquals(list(results), [1, -1, 2, 3])
+
+class BatchHSMTest(BatchDispatchMixin, HSMTest):
+    pass
+
+class BatchConcurrentTest(BatchDispatchMixin, ConcurrentTest):
+    pass
+
+class BatchCompiledFSMTest(CompiledMixin, BatchFSMTest):
+    pass
+
+class BatchCompiledTest(BatchDispatchMixin, CompiledMixin, ConcurrentTest):
+    pass
+
+class BatchInstanceTest(FSMTest):
+
+    def testInstanceBatch(self):
+        manager = InstanceManager(self.create_statechart(TestParam()))
+        manager.create(0, TestParam())
+        manager.create(1, TestParam())
+
+        results = manager.dispatch_many(0, [Event(1), Event(4), Event(5)])
+        self.assertEquals(list(results), [1, 4, 5])
+        self.assertEquals(list(manager.dispatch_many(1, [Event(4)])), [-1])
+
+@unittest.skipIf(numpy is None, "numpy is not available")
+class VectorizedFSMTest(InstanceManagerMixin, FSMTest):
+
+    def create_manager(self):
+        manager = create_manager(self.create_statechart(TestParam()))
+        self.assertTrue(isinstance(manager, VectorizedManager))
+        return manager
+
+    def testBatchOrder(self):
+        manager = self.create_manager()
+        params = [TestParam() for key in range(4)]
+        for key in range(4):
+            manager.create(key, params[key])
+
+        """ Instance 1 gets three events in one batch, 3 gets none """
+        results = manager.dispatch_batch([1, 0, 1, 2, 1], [1, 1, 4, 9, 5])
+        self.assertEquals(list(results), [1, 1, 4, -1, 5])
+
+        self.assertEquals(params[1].path, ("start:A A:entry A:do " +
+                                           "A:exit A:B B:entry B:do " +
+                                           "B:exit B:C C:entry C:do " +
+                                           "C:exit C:C C:entry C:do"))
+        self.assertEquals(params[2].path, params[3].path)
+        self.assertEquals([manager.state(key).state_id for key in range(4)],
+                          [3, 4, 2, 2])
+
+    def testGrow(self):
+        manager = self.create_manager()
+        param = TestParam()
+        manager.create(5000, param)
+        manager.dispatch(5000, Event(1))
+        self.assertEquals(manager.keys(), [5000])
+        self.assertEquals(param.path, ("start:A A:entry A:do " +
+                                       "A:exit A:B B:entry B:do"))
+
+class VectorizedFallbackTest(HSMTest):
+
+    def testFallback(self):
+        manager = create_manager(self.create_statechart(TestParam()))
+        self.assertTrue(isinstance(manager, BatchInstanceManager))
+
+        param = TestParam()
+        manager.create(0, param)
+        results = manager.dispatch_batch([0, 0], [1, 4])
+        self.assertEquals(list(results), [6, -1])
+
+class EventRegistryTest(unittest.TestCase):
+
+    def testIntern(self):
+        registry = EventRegistry()
+        event_type = registry.intern(7)
+        self.assertTrue(registry.intern(7) is event_type)
+        self.assertFalse(registry.intern(8) is event_type)
+        self.assertRaises(AttributeError, setattr, event_type, 'id', 8)
+
+    def testFreelist(self):
+        registry = EventRegistry(freelist_size=1)
+        event = registry.event(1, "data")
+        self.assertEquals((event.id, event.data), (1, "data"))
+
+        registry.release(event)
+        self.assertEquals(event.data, None)
+        self.assertTrue(registry.event(2) is event)
+        self.assertEquals(event.id, 2)
+
+        registry.release(Event(3))
+        registry.release(Event(4))
+        self.assertEquals(len(registry.freelist), 1)
+
+    def testTypedTransitions(self):
+        registry = EventRegistry()
+        param = TestParam()
+        state_chart = Statechart(param)
+        start = StartState(state_chart)
+        A = State(state_chart, None, None, None)
+        B = State(state_chart, None, None, None)
+        TestTransition(start, 'start', A, 'A', None, None)
+        TestTransition(A, 'A', B, 'B', registry.intern(1), None)
+
+        state_chart.start()
+        self.assertFalse(state_chart.dispatch(registry.event(2)))
+        self.assertTrue(state_chart.dispatch(registry.event(1, "data")))
+        self.assertEquals(param.path, " start:A A:B")
+
+class TestListener(object):
+
+    def __init__(self):
+        self.deactivated = []
+
+    def state_deactivated(self, runtime, state):
+        self.deactivated.append(state.state_id)
+
+class RuntimeListenerTest(FSMTest):
+
+    def check_listener(self, state_chart):
+        state_chart.start()
+        listener = TestListener()
+        state_chart.runtime.add_listener(listener)
+
+        for event in [1, 4, 7]:
+            state_chart.dispatch(Event(event))
+
+        """ A:2 B:3 C:4, the start state is deactivated before this """
+        self.assertEquals(listener.deactivated, [2, 3, 4])
+
+    def testListener(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.finalize()
+        self.check_listener(state_chart)
+
+    def testCompactListener(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.compact = True
+        self.check_listener(state_chart)
+
+    def testCompiledListener(self):
+        state_chart = self.create_statechart(TestParam())
+        self.check_listener(compile_statechart(state_chart))
+
+class IterativeListenerTest(FSMTest):
+
+    def check_listener(self, compact):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.compact = compact
+        state_chart = make_iterative(state_chart)
+        state_chart.start()
+        listener = TestListener()
+        state_chart.runtime.add_listener(listener)
+
+        for event in [1, 4, 7]:
+            state_chart.dispatch(Event(event))
+
+        self.assertEquals(listener.deactivated, [2, 3, 4])
+
+    def testListener(self):
+        self.check_listener(False)
+
+    def testCompactListener(self):
+        self.check_listener(True)
+
+class RelevanceTest(FSMTest):
+
+    def check_relevance(self, state_chart):
+        param = state_chart.param
+        state_chart.start()
+
+        """ A handles 1 only """
+        self.assertTrue(state_chart.relevant(Event(1)))
+        self.assertFalse(state_chart.relevant(Event(4)))
+        self.assertTrue(state_chart.relevant(None))
+        self.assertEquals(state_chart.dropped(), 0)
+
+        """ 8 is dropped in B, 2 in C """
+        for event in [1, 8, 4, 5, 2, 5, 6, 4, 7, 1, 2, 3]:
+            state_chart.dispatch(Event(event))
+
+        self.assertEquals(state_chart.dropped(), 2)
+        self.assertEquals(param.path, ("start:A A:entry A:do " +
+                                       "A:exit A:B B:entry B:do " +
+                                       "B:exit B:C C:entry C:do " +
+                                       "C:exit C:C C:entry C:do " +
+                                       "C:exit C:C C:entry C:do " +
+                                       "C:exit C:B B:entry B:do " +
+                                       "B:exit B:C C:entry C:do " +
+                                       "C:exit C:A A:entry A:do " +
+                                       "A:exit A:B B:entry B:do " +
+                                       "B:exit B:B B:entry B:do " +
+                                       "B:exit B:end"))
+
+    def testRelevance(self):
+        self.check_relevance(self.create_statechart(TestParam()))
+
+    def testCompactRelevance(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.compact = True
+        self.check_relevance(state_chart)
+
+    def testCompiledRelevance(self):
+        state_chart = self.create_statechart(TestParam())
+        self.check_relevance(compile_statechart(state_chart))
+
+    def testBatchRelevance(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        results = state_chart.dispatch_many([Event(e) for e in [4, 1, 1, 4]])
+        self.assertEquals(list(results)[0], -1)
+        self.assertEquals(list(results)[2], -1)
+        self.assertEquals(state_chart.dropped(), 2)
+
+    def testResetDropped(self):
+        state_chart = self.create_statechart(TestParam())
+        state_chart.compact = True
+        state_chart.start()
+        state_chart.dispatch(Event(4))
+        self.assertEquals(state_chart.dropped(), 1)
+        state_chart.runtime.reset()
+        self.assertEquals(state_chart.dropped(), 0)
+
+        state_chart = self.create_statechart(TestParam())
+        state_chart.start()
+        state_chart.dispatch(Event(4))
+        state_chart.start_runtime(state_chart.runtime, state_chart.param)
+        self.assertEquals(state_chart.dropped(), 0)
+
+    def testNoteDropped(self):
+        for compact in (False, True):
+            state_chart = self.create_statechart(TestParam())
+            state_chart.compact = compact
+            state_chart.start()
+            self.assertFalse(state_chart.relevant(Event(4)))
+            state_chart.runtime.note_dropped()
+            self.assertEquals(state_chart.dropped(), 1)
+
+    def testAddTransitionAfterFinalize(self):
+        state_chart = Statechart(TestParam())
+        start = StartState(state_chart)
+        A = State(state_chart, None, None, None)
+        TestTransition(start, 'start', A, 'A', None, None)
+        state_chart.start()
+        self.assertRaises(AssertionError, TestTransition,
+                          A, 'A', A, 'A', Event(1), None)
+
 if __name__ == "__main__":
     unittest.main()    
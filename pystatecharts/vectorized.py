@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+__author__      = "Vishal Patil"
+__copyright__   = "Copyright 2010 - 2011, Vishal Patil"
+__license__     = "New-style BSD"
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pseudostates import PseudoState
+from compiler import CompileError
+from compiler import classify_state
+from compiler import check_transition
+from compiler import PLAIN, START, END
+from instances import InstanceManager
+from transition import Event
+
+class VectorizeError(Exception):
+    pass
+
+def create_manager(statechart):
+    """
+        Returns a VectorizedManager for flat statecharts when numpy is
+        available, an interpreter backed BatchInstanceManager otherwise.
+        Both take batches of (instance, event id) pairs.
+    """
+    try:
+        return VectorizedManager(statechart)
+    except VectorizeError:
+        return BatchInstanceManager(statechart)
+
+class BatchInstanceManager(InstanceManager):
+
+    """ InstanceManager with the batch interface of VectorizedManager """
+
+    def dispatch_batch(self, instances, event_ids):
+        results = array('i')
+        for key, event_id in zip(instances, event_ids):
+            event = None
+            if event_id is not None:
+                event = Event(event_id)
+
+            results.extend(self.dispatch_many(key, [event]))
+
+        return results
+
+class VectorizedManager(object):
+
+    """
+        Runs many instances of a flat statechart (plain states, a start and
+        end state directly under the statechart, no guards) with numpy.
+
+        The statechart is exported as two dense tables indexed by
+        [state id, event column]: the next state id and the id of the
+        transition taken, -1 when no transition fires. Event ids are mapped
+        to columns, the last column stands for any other event (only the
+        event-less transitions match). Instances are small ints and the
+        current state of every instance lives in one int array.
+
+        A batch is applied in rounds, an instance that appears several
+        times in the batch sees its events in order. The exit, transition
+        and entry actions are invoked per transition id, for all the
+        instances that took that transition in the round.
+    """
+
+    def __init__(self, statechart, capacity=1024):
+        if numpy is None:
+            raise VectorizeError("numpy is not available")
+
+        statechart.finalize()
+        self.check(statechart)
+
+        self.statechart = statechart
+        self.states = statechart.state_table
+        self.build_tables()
+
+        """ The extra row is used by the instances that do not exist """
+        self.dead = len(self.states)
+        self.current = numpy.empty(max(capacity, 1), dtype=numpy.int32)
+        self.current.fill(self.dead)
+        self.params = [None] * len(self.current)
+        self.count = 0
+
+    def check(self, statechart):
+        try:
+            for state in statechart.states:
+                if state.context is not statechart:
+                    raise VectorizeError("%s is not a flat state" % state)
+
+                if not classify_state(state) in (PLAIN, START, END):
+                    raise VectorizeError("%s is not a flat state" % state)
+
+                for transition in state.transitions:
+                    check_transition(transition)
+                    if transition.guard:
+                        raise VectorizeError("%s is guarded" % transition)
+        except CompileError, e:
+            raise VectorizeError(str(e))
+
+        if statechart.start_state == None:
+            raise VectorizeError("Statechart has no start state")
+
+    def build_tables(self):
+        self.columns = {}
+        for state in self.states:
+            for event_id in state.transition_index:
+                if not event_id in self.columns:
+                    self.columns[event_id] = len(self.columns)
+
+        self.default_column = len(self.columns)
+
+        shape = (len(self.states) + 1, len(self.columns) + 1)
+        self.next_state = numpy.empty(shape, dtype=numpy.int32)
+        self.next_state.fill(-1)
+        self.transition_ids = numpy.empty(shape, dtype=numpy.int32)
+        self.transition_ids.fill(-1)
+
+        for state in self.states[1:]:
+            row = state.state_id
+            for event_id, column in self.columns.items():
+                self.set_entry(row, column,
+                               state.transition_index.get(event_id,
+                                            state.eventless_transitions))
+
+            self.set_entry(row, self.default_column,
+                           state.eventless_transitions)
+
+        """ Per transition id the actions invoked when it is taken """
+        self.actions = []
+        for transition in self.statechart.transition_table:
+            self.actions.append(self.transition_actions(transition))
+
+        self.has_actions = numpy.array([len(actions) > 0
+                                        for actions in self.actions],
+                                       dtype=bool)
+
+    def set_entry(self, row, column, transitions):
+        if transitions:
+            transition = transitions[0]
+            self.next_state[row, column] = transition.end.state_id
+            self.transition_ids[row, column] = transition.transition_id
+
+    def transition_actions(self, transition):
+        actions = []
+        for state in transition.deactivate:
+            if not isinstance(state, PseudoState) and state.exit:
+                actions.append(state.exit.execute)
+
+        if transition.action:
+            actions.append(transition.action.execute)
+
+        for state in transition.activate:
+            if not isinstance(state, PseudoState):
+                if state.entry:
+                    actions.append(state.entry.execute)
+                if state.do:
+                    actions.append(state.do.execute)
+
+        return actions
+
+    def grow(self, key):
+        size = len(self.current)
+        while size <= key:
+            size *= 2
+
+        current = numpy.empty(size, dtype=numpy.int32)
+        current.fill(self.dead)
+        current[:len(self.current)] = self.current
+        self.params.extend([None] * (size - len(self.current)))
+        self.current = current
+
+    """ Interface shared with InstanceManager, the keys are small ints """
+
+    def create(self, key, param):
+        assert not (key in self), "Session %s already present" % key
+
+        if key >= len(self.current):
+            self.grow(key)
+
+        self.current[key] = self.statechart.start_state.state_id
+        self.params[key] = param
+        self.count += 1
+
+        """ Take the event-less transition of the start state """
+        self.dispatch_batch([key], [None])
+
+    def dispatch(self, key, event):
+        event_id = None
+        if event is not None:
+            event_id = event.id
+
+        return self.dispatch_batch([key], [event_id])[0] >= 0
+
+    def dispatch_many(self, key, events):
+        event_ids = [(event.id if event is not None else None)
+                        for event in events]
+        return self.dispatch_batch([key] * len(event_ids), event_ids)
+
+    def destroy(self, key):
+        assert key in self, "Session %s not present" % key
+
+        self.current[key] = self.dead
+        self.params[key] = None
+        self.count -= 1
+
+    def param(self, key):
+        return self.params[key]
+
+    def state(self, key):
+        return self.states[self.current[key]]
+
+    def keys(self):
+        return [int(key) for key in numpy.nonzero(self.current != self.dead)[0]]
+
+    def __contains__(self, key):
+        return 0 <= key < len(self.current) and self.current[key] != self.dead
+
+    def __len__(self):
+        return self.count
+
+    """ Batches """
+
+    def event_columns(self, event_ids):
+        get = self.columns.get
+        default = self.default_column
+        return numpy.fromiter((get(event_id, default)
+                                for event_id in event_ids),
+                              dtype=numpy.intp, count=len(event_ids))
+
+    def dispatch_batch(self, instances, event_ids):
+        """
+            Dispatch event_ids[i] to instances[i]. Returns an int array with
+            the id of the transition taken per pair, -1 when none fired.
+        """
+        instances = numpy.asarray(instances, dtype=numpy.intp)
+        columns = self.event_columns(event_ids)
+        results = numpy.empty(len(instances), dtype=numpy.int32)
+        results.fill(-1)
+
+        for selected in self.rounds(instances):
+            self.dispatch_round(instances[selected], columns[selected],
+                                selected, results)
+
+        return results
+
+    def rounds(self, instances):
+        """
+            Positions of the pairs per round, round n has the n-th event of
+            every instance in the batch, in batch order
+        """
+        count = len(instances)
+        if count == 0:
+            return []
+
+        positions = numpy.arange(count)
+        order = numpy.argsort(instances, kind='mergesort')
+        ordered = instances[order]
+
+        first = numpy.empty(count, dtype=bool)
+        first[0] = True
+        first[1:] = ordered[1:] != ordered[:-1]
+        if first.all():
+            return [positions]
+
+        starts = numpy.maximum.accumulate(numpy.where(first, positions, 0))
+        ranks = numpy.empty(count, dtype=numpy.intp)
+        ranks[order] = positions - starts
+
+        by_rank = numpy.argsort(ranks, kind='mergesort')
+        sizes = numpy.bincount(ranks)
+        return numpy.split(by_rank, numpy.cumsum(sizes)[:-1])
+
+    def dispatch_round(self, instances, columns, selected, results):
+        current = self.current[instances]
+        transition_ids = self.transition_ids[current, columns]
+        results[selected] = transition_ids
+
+        fired = transition_ids >= 0
+        instances = instances[fired]
+        transition_ids = transition_ids[fired]
+        self.current[instances] = self.next_state[current[fired],
+                                                  columns[fired]]
+
+        with_actions = self.has_actions[transition_ids]
+        if with_actions.any():
+            self.run_actions(instances[with_actions],
+                             transition_ids[with_actions])
+
+    def run_actions(self, instances, transition_ids):
+        order = numpy.argsort(transition_ids, kind='mergesort')
+        transition_ids = transition_ids[order]
+        instances = instances[order]
+
+        starts = numpy.nonzero(numpy.diff(transition_ids))[0] + 1
+        for group in numpy.split(numpy.arange(len(instances)), starts):
+            actions = self.actions[transition_ids[group[0]]]
+            params = self.params
+            for key in instances[group]:
+                param = params[key]
+                for action in actions:
+                    action(param)
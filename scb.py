@@ -85,6 +85,7 @@ import traceback                  # exception trace
 import datetime                   # time
 import scbObjects as SCBO
 import scbUtilities as SCBU      
+import scbTransport                # local transports ([OPTIONS] Transport)
 
 sys.path.append(os.getcwd())      # needed when scb.py is a logical link
 
@@ -325,6 +326,7 @@ class scb:
       self.states = None          # list of states
       self.warning_count = None   # count of warnings
       self.evo = None             # event objects
+      self.evx = None             # event index, built after unique_events
       self.states = None          # state objects
       self.xitions = None         # transition objects
                               
@@ -342,6 +344,11 @@ class scb:
       self.iniGenCallbacks = None # generate callbacks versus read from file
       self.iniInterpret = None    # enter interpreter
       self.iniInsertCB = None     # name of callbacks file
+      self.iniQueueSize = None    # event queue bound, 0 is unbounded
+      self.iniPrefetch = None     # rabbitmq push consumption, 0 is Subscribe
+      self.iniHighWater = None    # event queue backlog that pauses consumption
+      self.iniTransport = None    # local transport instead of the broker
+      self.iniWirePickle = None   # BinaryData ports accept pickled data
       self.iniInsertCB_sav = None # copy of
       self.funcFromFile = None    # function copied from callback file
       self.scobj = None           # the instantiated statechart object
@@ -548,6 +555,8 @@ class scb:
             
         #end while all event sets   
         
+        self.evo.reindex()                   # ids and bases have changed
+        
       #endif not error
         
       return err_f
@@ -762,14 +771,14 @@ class scb:
         event_name = event_phrase
         class_name = None
                  
+      if (self.evx == None):                      # unique_events failed
+        self.evx = SCBO.EventObject.compile(self.evo)
       if (class_name == None):
-        event_f, event_info = SCBO.NamedObject.namedListMatch(list_of_lists=self.evo,
-                                                    name="events",
-                                                    value =event_name,
-                                                    unique_f = True)      # find all occurrences
+        classes = self.evx.classesOf(event_name)  # find all occurrences
+        event_f = (len(classes) > 0)
         if (event_f):
-          if (len(event_info)==1):                # unique, return class name
-            class_name = event_info[0].name
+          if (len(classes)==1):                   # unique, return class name
+            class_name = classes[0]
             #
             # fixup allows the class to be added to the event info for later use
             #
@@ -778,7 +787,7 @@ class scb:
             event_f = False                       # non-unique, cannot resolve
             print "*** Error: Non-unique event: %s without class specifier ***" %(event_phrase)
       else:
-        event_f, dummy = SCBO.NamedObject.namedListMatch(self.evo,"name",class_name,"events",event_name)
+        event_f = self.evx.hasEvent(event_phrase)
         
       return event_f, event_fixup 
     #end valid_event
@@ -1431,7 +1440,60 @@ class scb:
           tmp = tmp.upper()
           if ((tmp=='TRUE') or (tmp=='1')):
             self.iniInterpret = 1 
+
+        self.iniQueueSize = 0                    # 0 is an unbounded event queue
+        key = "QueueSize"
+        if cp.has_option(section,key):
+          tmp = cp.get(section,key)
+          tmp = tmp.strip()
+          try:
+            self.iniQueueSize = int(tmp)
+          except ValueError:
+            print "*** Error: %s, [%s] %s = %s is not an integer ***" % (fname,section,key,tmp)
+            err_f = True
+
+        self.iniPrefetch = 0                     # 0 subscribes message by message
+        key = "Prefetch"
+        if cp.has_option(section,key):
+          tmp = cp.get(section,key)
+          tmp = tmp.strip()
+          try:
+            self.iniPrefetch = int(tmp)
+          except ValueError:
+            print "*** Error: %s, [%s] %s = %s is not an integer ***" % (fname,section,key,tmp)
+            err_f = True
+
+        self.iniHighWater = 0                    # 0 never pauses consumption
+        key = "HighWater"
+        if cp.has_option(section,key):
+          tmp = cp.get(section,key)
+          tmp = tmp.strip()
+          try:
+            self.iniHighWater = int(tmp)
+          except ValueError:
+            print "*** Error: %s, [%s] %s = %s is not an integer ***" % (fname,section,key,tmp)
+            err_f = True
+
+        self.iniTransport = ""                   # empty is the message broker
+        key = "Transport"
+        if cp.has_option(section,key):
+          tmp = cp.get(section,key)
+          tmp = tmp.strip().lower()
+          if (tmp in scbTransport.TRANSPORTS):
+            self.iniTransport = tmp
+          elif (tmp!="") and (tmp!="broker"):
+            print "*** Error: %s, [%s] %s = %s is not one of broker,%s ***" % (fname,section,key,tmp,
+                  ",".join(sorted(scbTransport.TRANSPORTS.keys())))
+            err_f = True
               
+        self.iniWirePickle = False               # pickles run code of the sender
+        key = "WirePickle"
+        if cp.has_option(section,key):
+          tmp = cp.get(section,key)
+          tmp = tmp.strip().upper()
+          if ((tmp=='TRUE') or (tmp=='1')):
+            self.iniWirePickle = True
+
         self.iniInsertCB = ""
         if (g_cb_file != None):    # command line callbacks file takes precidence
           self.iniInsertCB = g_cb_file
@@ -1702,7 +1764,7 @@ class scb:
             events = events + [iniEvent]
         # end else events section
       # end if no error
-      self.evo = []    
+      self.evo = SCBO.IndexedList()    
       if (not err_f): 
         #
         # turn events into a named object suitable for use
@@ -1730,6 +1792,7 @@ class scb:
         #
         if (not err_f):
           print "%d events total" % sum     
+          self.evx = SCBO.EventObject.compile(self.evo)  # ids are final
           
       # ---------------- optional event suppress print --------------------------- 
        
@@ -2421,6 +2484,26 @@ class scb:
       return 0, ulist
     # end gen_code_hooks
     #---------------------------------------------
+    # decodeTables
+    #            purpose: generate the module level tables used by the
+    #            port callbacks to decode messages, built once at import
+    #            rather than per message
+    #
+    def decodeTables(self,evo):   # event object
+      mbuf = []
+      tbuf = "EVENT_IDS = {}"                                          ; mbuf += [tbuf]
+      ii = 0
+      while (ii < len(evo)):
+        jj = 0
+        while (jj < len(evo[ii].events)):
+          tbuf = "EVENT_IDS[\"%s.%s\"] = %d" % (evo[ii].name,evo[ii].events[jj],
+                                              evo[ii].ids[jj])        ; mbuf += [tbuf]
+          jj = jj + 1
+        ii = ii + 1
+      tbuf = "EVENT_ID_SET = frozenset(EVENT_IDS.values())"            ; mbuf += [tbuf]
+      return mbuf
+    # end decodeTables
+    #---------------------------------------------
     # commsCallbacksRmq
     #            purpose: generate the message queue "callbacks" 
     #
@@ -2451,84 +2534,90 @@ class scb:
       #
       
       sortedCbo = sorted(cbObj,key =lambda dummy: dummy.queue)
-      
-      first_f = True        # statemachine vectors between
-                            # 1: function definition+if, 
-                            # 2: elif(s), and 
-                            # 3: else+return
-      last_queue = None
+      #
+      # the expected messages of a queue are known here, they are emitted once
+      # as a frozenset class attribute and the decoding branch (json or plain)
+      # is chosen here rather than tested on every message. The event ids are
+      # looked up in the module level EVENT_IDS dict (see decodeTables)
+      #
+      # the key may be appended with json data
+      # and looks like this:
+      #
+      # <event_class.event_id>:<event_data_as_json_string>
+      #
+      # split once at the ':' separator, then extract the json data
+      #
       mbuf = []
       retlist = []
       ii = 0
-      
+
       while (ii < len(sortedCbo)):
-      
-        if (sortedCbo[ii].queue != last_queue):   # restart for each unique queue
-          last_queue = sortedCbo[ii].queue   
-          first_f = True
-        if (first_f): 
-          #
-          # the callback function for the message queue listen thread
-          # generate an expected messages list for mis-directed messages
-          #      
-          tbuf = "    def %s_queueCallback(self,msg):"   % (sortedCbo[ii].queue); mbuf += [tbuf]
-          tbuf = "      thisFcn = \'%s_queueCallback\'" % (sortedCbo[ii].queue) ; mbuf += [tbuf]
-          tbuf = "      err_f = False"                                          ; mbuf += [tbuf]
-          tbuf = "      expctd = []"                                            ; mbuf += [tbuf]
-          jj = 0
-          while (jj<len(sortedCbo)):
-            tbuf = "      expctd.append(\"%s\")"  % (sortedCbo[jj].event_id)     ; mbuf += [tbuf]  
-            jj = jj +1 
-          #
-          # the key may be appended with json data
-          # and looks like this:
-          #
-          # <event_class.event_id>:<event_data_as_json_string>
-          #
-          # match the key (up to the ':' separator), then extract the json data
-          #
-          first_f = False
-        if (ii + 1) == len(sortedCbo) or (sortedCbo[ii+1].queue != last_queue):
-          tbuf = "      if (isInlist(expctd,\'JsonData\')):"              ; mbuf += [tbuf]
-          tbuf = "        evData = None"                                  ; mbuf += [tbuf]
-          tbuf = "        eidx = msg.body.find(\':\')"                    ; mbuf += [tbuf]
-          tbuf = "        if (eidx <0):"                                  ; mbuf += [tbuf]  
-          tbuf = "          eidx = len(msg.body)"                         ; mbuf += [tbuf]
-          tbuf = "        else:"                                          ; mbuf += [tbuf]
-          tbuf = "          dataStr=msg.body[msg.body.find(\':\')+1:]"    ; mbuf += [tbuf]
-          tbuf = "          evData = jsonpickle.decode(dataStr)"                 ; mbuf += [tbuf]
-          tbuf = "        evStr = msg.body[0:eidx]"                       ; mbuf += [tbuf]
-          tbuf = "        evid = EventObject.EventToId(self.evo,evStr)"   ; mbuf += [tbuf]
-          tbuf = "        if (evid >0):"                                  ; mbuf += [tbuf]
-          tbuf = "          self.sendEvent(evid,evData,True)"             ; mbuf += [tbuf]
-          tbuf = "        else:"                                          ; mbuf += [tbuf]
-          tbuf = "          emsg = \"%s: %s is not an event\" % (thisFcn,evStr)" ; mbuf += [tbuf] 
-          tbuf = "          err_f = True"                                 ; mbuf += [tbuf]
-          tbuf = "      elif (isInlist(expctd,msg.body) or isInlist(expctd,\'AnyEvent\')):" ; mbuf += [tbuf]
-          tbuf = "        eid = EventObject.EventToId(self.evo,msg.body)" ; mbuf += [tbuf]
-          tbuf = "        if (eid>0):"                                    ; mbuf += [tbuf]
-          tbuf = "          self.sendEvent(eid,None,True)"                ; mbuf += [tbuf]
-          tbuf = "        else:"                                          ; mbuf += [tbuf]
-          tbuf = "          emsg = \"%s: %s Cannot decode event\" % (thisFcn,msg.body)" ; mbuf += [tbuf] 
-          tbuf = "          err_f = True"                                 ; mbuf += [tbuf]   
-          tbuf = "      else:"                                            ; mbuf += [tbuf] 
-          tbuf = "        emsg = \"%s:Cannot decode header - (rd,[exp]):(%s,%s)\"%(" ; mbuf += [tbuf] 
-          tbuf = "thisFcn,msg.body,expctd)"                               ; mbuf += [tbuf] 
-          tbuf = "        err_f = True"                                   ; mbuf += [tbuf]
-          tbuf = "      if (err_f):"                                      ; mbuf += [tbuf]
-          tbuf = "        if (self.txtlog!=None):"                        ; mbuf += [tbuf]
-          tbuf = "          self.txtlog.error(emsg)"                      ; mbuf += [tbuf]
-          tbuf = "        else:"                                          ; mbuf += [tbuf] 
-          tbuf = "          print emsg"                                   ; mbuf += [tbuf]    
-          tbuf = "      msg.channel.basic_ack(msg.delivery_tag)"          ; mbuf += [tbuf]	
+        queue = sortedCbo[ii].queue
+        expctd = []
+        while (ii < len(sortedCbo)) and (sortedCbo[ii].queue == queue):
+          if (not SCBU.isInlist(expctd,sortedCbo[ii].event_id)):
+            expctd = expctd + [sortedCbo[ii].event_id]
+          ii = ii + 1
+        tbuf = "    EXPECTED_%s = frozenset(%s)" % (queue,expctd)            ; mbuf += [tbuf]
+        tbuf = "    def %s_queueDecode(self,msg):"   % (queue)               ; mbuf += [tbuf]
+        tbuf = "      thisFcn = \'%s_queueCallback\'" % (queue)              ; mbuf += [tbuf]
+        if (SCBU.isInlist(expctd,'BinaryData')):
           #
-          # build a list of queues and callbacks that can be input to the Subscribe method
+          # header and payload are read in place, see scbWire
           #
-          queue = sortedCbo[ii].queue
-          method = sortedCbo[ii].queue + "_queueCallback" 
-          retlist = retlist + [[queue, method]]   # list of two-element lists	
-          first_f = True 
-        ii = ii + 1        
+          tbuf = "      try:"                                                ; mbuf += [tbuf]
+          tbuf = "        evid, evData, stamp, end = scbWire.decode(msg.body,0,%s)" % (
+                 self.iniWirePickle)                                       ; mbuf += [tbuf]
+          tbuf = "      except Exception as eobj:"                           ; mbuf += [tbuf]
+          tbuf = "        return self.decodeErr(\"%s: %s\" % (thisFcn,eobj))" ; mbuf += [tbuf]
+          tbuf = "      if (evid in EVENT_ID_SET):"                          ; mbuf += [tbuf]
+          tbuf = "        return evid, evData"                               ; mbuf += [tbuf]
+          tbuf = "      emsg = \"%s: %d is not an event\" % (thisFcn,evid)"  ; mbuf += [tbuf]
+        elif (SCBU.isInlist(expctd,'JsonData')):
+          tbuf = "      evStr, sep, dataStr = msg.body.partition(\':\')"     ; mbuf += [tbuf]
+          tbuf = "      evData = None"                                       ; mbuf += [tbuf]
+          tbuf = "      if (sep):"                                           ; mbuf += [tbuf]
+          tbuf = "        evData = jsonpickle.decode(dataStr)"               ; mbuf += [tbuf]
+          tbuf = "      evid = EVENT_IDS.get(evStr.strip(),-1)"              ; mbuf += [tbuf]
+          tbuf = "      if (evid >0):"                                       ; mbuf += [tbuf]
+          tbuf = "        return evid, evData"                               ; mbuf += [tbuf]
+          tbuf = "      emsg = \"%s: %s is not an event\" % (thisFcn,evStr)" ; mbuf += [tbuf]
+        else:
+          tbuf = "      evStr = msg.body.strip()"                          ; mbuf += [tbuf]
+          if (not SCBU.isInlist(expctd,'AnyEvent')):
+            tbuf = "      if (not (evStr in self.EXPECTED_%s)):" % (queue)    ; mbuf += [tbuf]
+            tbuf = "        emsg = \"%s:Cannot decode header - (rd,[exp]):(%s,%s)\"%(" ; mbuf += [tbuf]
+            tbuf = "thisFcn,msg.body,list(self.EXPECTED_%s))" % (queue)      ; mbuf += [tbuf]
+            tbuf = "        return self.decodeErr(emsg)"                     ; mbuf += [tbuf]
+          tbuf = "      evid = EVENT_IDS.get(evStr,-1)"                      ; mbuf += [tbuf]
+          tbuf = "      if (evid>0):"                                        ; mbuf += [tbuf]
+          tbuf = "        return evid, None"                                 ; mbuf += [tbuf]
+          tbuf = "      emsg = \"%s: %s Cannot decode event\" % (thisFcn,msg.body)" ; mbuf += [tbuf]
+        tbuf = "      return self.decodeErr(emsg)"                           ; mbuf += [tbuf]
+        #
+        # one message per call, or several per wakeup: the events of a
+        # batch are queued under one lock
+        #
+        tbuf = "    def %s_queueCallback(self,msg):"   % (queue)             ; mbuf += [tbuf]
+        tbuf = "      evid, evData = self.%s_queueDecode(msg)" % (queue)     ; mbuf += [tbuf]
+        tbuf = "      if (evid>0):"                                          ; mbuf += [tbuf]
+        tbuf = "        self.sendEvent(evid,evData,True)"                    ; mbuf += [tbuf]
+        tbuf = "      self.comm.Ack(msg.channel,msg.delivery_tag)"           ; mbuf += [tbuf]
+        tbuf = "    def %s_queueCallbackMany(self,msgs):" % (queue)          ; mbuf += [tbuf]
+        tbuf = "      events = []"                                           ; mbuf += [tbuf]
+        tbuf = "      for msg in msgs:"                                      ; mbuf += [tbuf]
+        tbuf = "        evid, evData = self.%s_queueDecode(msg)" % (queue)   ; mbuf += [tbuf]
+        tbuf = "        if (evid>0):"                                        ; mbuf += [tbuf]
+        tbuf = "          events.append(self.registry.event(evid,evData))"   ; mbuf += [tbuf]
+        tbuf = "      if (len(events)>0):"                                   ; mbuf += [tbuf]
+        tbuf = "        self.events.put_many(events)"                        ; mbuf += [tbuf]
+        tbuf = "      if (len(msgs)>0):"                                     ; mbuf += [tbuf]
+        tbuf = "        self.comm.AckMany(msgs[-1].channel,msgs[-1].delivery_tag)" ; mbuf += [tbuf]
+        #
+        # build a list of queues and callbacks that can be input to the Subscribe method
+        #
+        method = queue + "_queueCallback"
+        retlist = retlist + [[queue, method]]   # list of two-element lists
       # end while
 
       cbo = retlist
@@ -2544,7 +2633,17 @@ class scb:
           # The subscribe method instantiates a listener on a port
           # and a callback to handle the data that arrives on that port
           #
-          tbuf="      self.comm.Subscribe(\"%s\",self.%s)"%(cbo[ii][0],cbo[ii][1]); mbuf += [tbuf]
+          if (self.iniPrefetch > 0):
+            #
+            # push based: the broker pushes up to Prefetch unacked messages,
+            # handed to the callback in batches; the batches are held while
+            # the event queue is above HighWater
+            #
+            tbuf="      self.comm.Consume(\"%s\",self.%sMany,prefetch=%d,"%(
+                 cbo[ii][0],cbo[ii][1],self.iniPrefetch)                 ; mbuf += [tbuf]
+            tbuf="backlog=self.events,high_water=%d,ack=False)"%(self.iniHighWater) ; mbuf += [tbuf]
+          else:
+            tbuf="      self.comm.Subscribe(\"%s\",self.%s)"%(cbo[ii][0],cbo[ii][1]); mbuf += [tbuf]
           ii = ii + 1 
         # end while
       # end else
@@ -2598,117 +2697,109 @@ class scb:
       # Solution: prepend a string to the port.
       
       sortedCbo = sorted(cbObj,key =lambda dummy: dummy.port)
-
-      # statemachine vectors between 1: function definition+if, 2: elif(s), and 3: else+return
-      first_f = True        
-      last_port = None
+      #
+      # Embedded Callbacks
+      #
+      # Note: The expected messages of a port detect mis-directed messages.
+      #       The list is constant at compile time, it is emitted once as a
+      #       frozenset class attribute and the decoding branch (json, yaml
+      #       or plain) is chosen here rather than tested on every message.
+      #       The event ids are looked up in the module level EVENT_IDS dict
+      #       (see decodeTables).
+      #
+      # The delimiter key may be appended with json data and looks like this:
+      #
+      # <event_class.event>:<event_data_as_json_string>
+      #
+      # split once at the ':' separator, then extract the json data
+      #
+      # Note: rabbitmq/zeromq differences
+      #       rabbitmq messages are objects with metadata and data components
+      #       zeromq messages are strictly strings
+      #
       mbuf = []
       retlist = []
       ii = 0
-      
+
       while (ii < len(sortedCbo)):
-        if (sortedCbo[ii].disable):  # skip generating code for disabled ports
+        port = sortedCbo[ii].port
+        expctd = []
+        while (ii < len(sortedCbo)) and (sortedCbo[ii].port == port):
+          if (not sortedCbo[ii].disable) and \
+             (not SCBU.isInlist(expctd,sortedCbo[ii].format)):
+            expctd = expctd + [sortedCbo[ii].format]
           ii = ii + 1
+        if (len(expctd)==0):         # skip generating code for disabled ports
           continue
-        if (sortedCbo[ii].port != last_port):   # restart for each unique port
-          last_port = sortedCbo[ii].port   
-          first_f = True
-        if (first_f): 
-          # 
-          # Embedded Callbacks
-          #
-          # Note: The callback function for the port listen thread generates
-          #       a list of expected messages to permit detection of mis-directed messages.
-          #       Since this list is constant at compile time, it would make sense to 
-          #       create the variable in 'self' once and only once rather than rebuild 
-          #       the list on each call. 
-          #   
-          tbuf = "    def port%sCallback(self,msg):"   % (sortedCbo[ii].port); mbuf += [tbuf]
-          
-          tbuf = "      thisFcn = \'port%sCallback\'" % (sortedCbo[ii].port) ; mbuf += [tbuf]
-          tbuf = "      err_f = False"                                       ; mbuf += [tbuf]
-          tbuf = "      expctd = []"                                         ; mbuf += [tbuf]
-          jj = 0
-          while (jj<len(sortedCbo)):
-            tbuf = "      expctd.append(\"%s\")"  % (sortedCbo[jj].format) ; mbuf += [tbuf]
-            jj = jj +1 
-          #
-          # The delimiter key may be appended with json data and looks like this:
-          #
-          # <event_class.event>:<event_data_as_json_string>
+        tbuf="    EXPECTED_PORT%s = frozenset(%s)" % (port,expctd)        ; mbuf += [tbuf]
+        tbuf="    def port%sDecode(self,msg):"   % (port)                 ; mbuf += [tbuf]
+        tbuf="      thisFcn = \'port%sCallback\'" % (port)                ; mbuf += [tbuf]
+        if (SCBU.isInlist(expctd,'BinaryData')):
           #
-          # match the key (up to the ':' separator), then extract the json data
+          # header and payload are read in place, see scbWire
           #
-          # Note: rabbitmq/zeromq differences 
-          #       rabbitmq messages are objects with metadata and data components
-          #       zeromq messages are strictly strings
-          #
-          first_f = False
-        if (ii + 1) == len(sortedCbo) or (sortedCbo[ii+1].port != last_port):
-          tbuf="      evData = None"                                    ; mbuf += [tbuf]
-          tbuf="      if (isInlist(expctd,\'JsonData\')):"              ; mbuf += [tbuf]
-          tbuf="        eidx = msg.find(\':\')"                         ; mbuf += [tbuf]
-          tbuf="        if (eidx <0):"                                  ; mbuf += [tbuf]  # no data
-          tbuf="          eidx = len(msg)"                              ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf]
-          tbuf="          dataStr=msg[msg.find(\':\')+1:]"              ; mbuf += [tbuf]
-          tbuf="          evData = jsonpickle.decode(dataStr)"          ; mbuf += [tbuf]
-          tbuf="        evStr = msg[0:eidx]"                            ; mbuf += [tbuf]
-          tbuf="        evid = EventObject.EventToId(self.evo,evStr)"   ; mbuf += [tbuf]
-          tbuf="        if (evid >0):"                                  ; mbuf += [tbuf]
-          tbuf="          self.sendEvent(evid,evData,True)"             ; mbuf += [tbuf]
-          tbuf="          if (self.spe.count(evid)<=0):"                ; mbuf += [tbuf]
-          tbuf="             print \"msg->event:\",msg"                 ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf]
-          tbuf="          emsg = \"%s: %s is not an event\" % (thisFcn,evStr)" ; mbuf += [tbuf] 
-          tbuf="          err_f = True"                                 ; mbuf += [tbuf]
-          tbuf="      elif (isInlist(expctd,\'YamlData\')):"            ; mbuf += [tbuf]
-          tbuf="        dataStr=\'\'"                                   ; mbuf += [tbuf]
-          tbuf="        eidx = msg.find(\':\')"                         ; mbuf += [tbuf]
-          tbuf="        if (eidx <0):"                                  ; mbuf += [tbuf]  # no data
-          tbuf="          eidx = len(msg)"                              ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf]
-          tbuf="          dataStr=msg[msg.find(\':\')+1:]"              ; mbuf += [tbuf]
-          tbuf="        evStr = msg[0:eidx]"                            ; mbuf += [tbuf]
-          tbuf="        evData=\'\'"                                    ; mbuf += [tbuf]
-          tbuf="        if (len(dataStr)>0):"                           ; mbuf += [tbuf]
-          tbuf="          msg_unw=self.serializer.fromSerial(dataStr)"     ; mbuf += [tbuf]
-          tbuf="          evData = msg_unw"                             ; mbuf += [tbuf]
-          tbuf="        evid = EventObject.EventToId(self.evo,evStr)"   ; mbuf += [tbuf]
-          tbuf="        if (evid >0):"                                  ; mbuf += [tbuf]
-          tbuf="          self.sendEvent(evid,evData,True)"             ; mbuf += [tbuf]
-          tbuf="          if (self.spe.count(evid)<=0):"                ; mbuf += [tbuf]
-          tbuf="             print \"msg->event:\",msg"                 ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf]
-          tbuf="          emsg = \"%s: %s is not an event\" % (thisFcn,evStr)" ; mbuf += [tbuf] 
-          tbuf="          err_f = True"                                 ; mbuf += [tbuf]
-          tbuf="      elif (isInlist(expctd,msg) or isInlist(expctd,\'AnyEvent\')):" ; mbuf += [tbuf]
-          tbuf="        evid = EventObject.EventToId(self.evo,msg)"     ; mbuf += [tbuf]
-          tbuf="        if (evid>0):"                                   ; mbuf += [tbuf]
-          tbuf="          self.sendEvent(eid,None,True)"                ; mbuf += [tbuf]
-          tbuf="          if (self.spe.count(evid)<=0):"                ; mbuf += [tbuf]
-          tbuf="             print \"msg->event:\",msg"                 ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf]
-          tbuf="          emsg = \"%s: %s is not an event\" % (thisFcn,msg)" ; mbuf += [tbuf] 
-          tbuf="          err_f = True"                                 ; mbuf += [tbuf]   
-          tbuf="      else:"                                            ; mbuf += [tbuf] 
-          tbuf="        emsg = \"%s:Cannot decode header (rd,[exp]):(%s,%s)\"%(" ; mbuf += [tbuf] 
-          tbuf="thisFcn,msg,expctd)"                               ; mbuf += [tbuf] 
-          tbuf="        err_f = True"                                   ; mbuf += [tbuf]
-          tbuf="      if (err_f):"                                      ; mbuf += [tbuf]
-          tbuf="        if (self.txtlog!=None):"                        ; mbuf += [tbuf]
-          tbuf="          self.txtlog.error(emsg)"                      ; mbuf += [tbuf]
-          tbuf="        else:"                                          ; mbuf += [tbuf] 
-          tbuf="          print emsg"                                   ; mbuf += [tbuf]    	
+          tbuf="      try:"                                               ; mbuf += [tbuf]
+          tbuf="        evid, evData, stamp, end = scbWire.decode(msg,0,%s)" % (
+                 self.iniWirePickle)                                     ; mbuf += [tbuf]
+          tbuf="      except Exception as eobj:"                          ; mbuf += [tbuf]
+          tbuf="        return self.decodeErr(\"%s: %s\" % (thisFcn,eobj))" ; mbuf += [tbuf]
+          tbuf="      evStr = msg = str(evid)"                            ; mbuf += [tbuf]
+          tbuf="      if (not (evid in EVENT_ID_SET)):"                   ; mbuf += [tbuf]
+          tbuf="        evid = -1"                                        ; mbuf += [tbuf]
+        elif (SCBU.isInlist(expctd,'JsonData')):
+          tbuf="      evStr, sep, dataStr = msg.partition(\':\')"         ; mbuf += [tbuf]
+          tbuf="      evData = None"                                      ; mbuf += [tbuf]
+          tbuf="      if (sep):"                                          ; mbuf += [tbuf]
+          tbuf="        evData = jsonpickle.decode(dataStr)"              ; mbuf += [tbuf]
+          tbuf="      evid = EVENT_IDS.get(evStr.strip(),-1)"             ; mbuf += [tbuf]
+        elif (SCBU.isInlist(expctd,'YamlData')):
+          tbuf="      evStr, sep, dataStr = msg.partition(\':\')"         ; mbuf += [tbuf]
+          tbuf="      evData=\'\'"                                        ; mbuf += [tbuf]
+          tbuf="      if (len(dataStr)>0):"                               ; mbuf += [tbuf]
+          tbuf="        evData = self.serializer.fromSerial(dataStr)"     ; mbuf += [tbuf]
+          tbuf="      evid = EVENT_IDS.get(evStr.strip(),-1)"             ; mbuf += [tbuf]
+        else:
+          tbuf="      evStr = msg.strip()"                                ; mbuf += [tbuf]
+          if (not SCBU.isInlist(expctd,'AnyEvent')):
+            tbuf="      if (not (evStr in self.EXPECTED_PORT%s)):" % (port) ; mbuf += [tbuf]
+            tbuf="        emsg = \"%s:Cannot decode header (rd,[exp]):(%s,%s)\"%(" ; mbuf += [tbuf]
+            tbuf="thisFcn,msg,list(self.EXPECTED_PORT%s))" % (port)       ; mbuf += [tbuf]
+            tbuf="        return self.decodeErr(emsg)"                    ; mbuf += [tbuf]
+          tbuf="      evData = None"                                      ; mbuf += [tbuf]
+          tbuf="      evid = EVENT_IDS.get(evStr,-1)"                     ; mbuf += [tbuf]
+        tbuf="      if (evid >0):"                                        ; mbuf += [tbuf]
+        tbuf="        if (self.spe.count(evid)<=0):"                      ; mbuf += [tbuf]
+        tbuf="          print \"msg->event:\",msg"                        ; mbuf += [tbuf]
+        tbuf="        return evid, evData"                                ; mbuf += [tbuf]
+        tbuf="      emsg = \"%s: %s is not an event\" % (thisFcn,evStr)"  ; mbuf += [tbuf]
+        tbuf="      return self.decodeErr(emsg)"                          ; mbuf += [tbuf]
+        #
+        # one message per call, or several per wakeup: the events of a
+        # batch are queued under one lock
+        #
+        tbuf="    def port%sCallback(self,msg):"   % (port)               ; mbuf += [tbuf]
+        tbuf="      evid, evData = self.port%sDecode(msg)" % (port)       ; mbuf += [tbuf]
+        tbuf="      if (evid>0):"                                         ; mbuf += [tbuf]
+        tbuf="        self.sendEvent(evid,evData,True)"                   ; mbuf += [tbuf]
+        if (self.iniTransport):
           #
-          # build a list of ports and callbacks that can be input to the Subscribe method
+          # a local transport hands over every message of a wakeup,
+          # subscribed with SubscribeMany (see subscribe below)
           #
-          port = sortedCbo[ii].port
-          method = "Port_" + sortedCbo[ii].port + "_CB" 
-          retlist = retlist + [[port, method]]   # list of two-element lists	
-          first_f = True 
-        ii = ii + 1
-        
+          tbuf="    def port%sCallbackMany(self,msgs):" % (port)          ; mbuf += [tbuf]
+          tbuf="      events = []"                                        ; mbuf += [tbuf]
+          tbuf="      for msg in msgs:"                                   ; mbuf += [tbuf]
+          tbuf="        evid, evData = self.port%sDecode(msg)" % (port)   ; mbuf += [tbuf]
+          tbuf="        if (evid>0):"                                     ; mbuf += [tbuf]
+          tbuf="          events.append(self.registry.event(evid,evData))"; mbuf += [tbuf]
+          tbuf="      if (len(events)>0):"                                ; mbuf += [tbuf]
+          tbuf="        self.events.put_many(events)"                     ; mbuf += [tbuf]
+        #
+        # build a list of ports and callbacks that can be input to the Subscribe method
+        #
+        method = "Port_" + port + "_CB"
+        retlist = retlist + [[port, method]]   # list of two-element lists
+
       # end while
 
       cbo = retlist
@@ -2758,7 +2849,8 @@ class scb:
       # -------------- subscribe method ------------------
       #
       #   1. if port type is subscribe then subscribe 
-      #   2. call ThreadedGet/GeventGet with callback
+      #   2. call ThreadedGet/GeventGet with callback, a local transport
+      #      calls back with the batches of SubscribeMany
       #
       tbuf =      "    def subscribe(self):" ; mbuf += [tbuf] 
       if (len(cbo)==0):
@@ -2781,8 +2873,12 @@ class scb:
              if (pdo[ii].type=="subscribe"):
                tbuf="      print \"%s\","%(pdo[ii].name) ; mbuf += [tbuf]
                tbuf="      self.comm[%d].Subscribe(\"%s\")"%(kk,pdo[ii].events) ; mbuf += [tbuf]
-             tbuf="      self.comm[%d].GeventGet(0,[self.port%sCallback])"%(
-                 (kk,pdo[ii].port)) ; mbuf += [tbuf]
+             if (self.iniTransport):
+               tbuf="      self.comm[%d].SubscribeMany(None,self.port%sCallbackMany)"%(
+                   (kk,pdo[ii].port)) ; mbuf += [tbuf]
+             else:
+               tbuf="      self.comm[%d].GeventGet(0,[self.port%sCallback])"%(
+                   (kk,pdo[ii].port)) ; mbuf += [tbuf]
              jj = jj + 1
           kk = kk + 1
           ii = ii + 1
@@ -2910,6 +3006,19 @@ class scb:
       
     #end listTransitions  
 
+    #
+    #-------------------------------------------------------------
+    # commClass
+    #    purpose: the class the generated code instantiates per
+    #             comm object, the broker's CommObject or a local
+    #             transport ([OPTIONS] Transport) with the same interface
+    #
+    def commClass(self):
+      if (self.iniTransport):
+        return "scbTransport.%s" % (scbTransport.TRANSPORTS[self.iniTransport])
+      return "%s.CommObject" % (self.pio.import_name)
+    #end commClass
+
     #
     #-------------------------------------------------------------
     # 
@@ -2949,11 +3058,12 @@ class scb:
                           self.pdo[ii].event_id)      ; mbuf += [tbuf]                      
         ii = ii + 1     
       # end while
+      tbuf = "        self.pdo = IndexedList(self.pdo)"  ; mbuf += [tbuf]
 
       #    
       # NOTE: string elaborations all need quotes
       #
-      tbuf = "        self.comm = %s.CommObject(host=\'%s\',userid=\'%s\',password=\'%s\')" % (self.pio.import_name,
+      tbuf = "        self.comm = %s(host=\'%s\',userid=\'%s\',password=\'%s\')" % (self.commClass(),
                             self.pio.host,  self.pio.userid, self.pio.password)           ;  mbuf += [tbuf]
       tbuf = "        self.comm.ConfigureList(%s)" % (SCBO.NamedObject.combineLists(self.pco)) ;  mbuf += [tbuf]      
            
@@ -3002,6 +3112,7 @@ class scb:
                           self.pdo[ii].events)      ; mbuf += [tbuf]     
         ii = ii + 1 
       # end while
+      tbuf = "        self.pdo = IndexedList(self.pdo)"  ; mbuf += [tbuf]
       
       # NOTE 1: This is the comms object initialization call
       # NOTE 2: embedded string elaboration of parameters need quotes
@@ -3015,7 +3126,7 @@ class scb:
           ii = ii + 1
           continue
         tbuf = "        self.comm = self.comm +\
-    [%s.CommObject(host=\'%s\',port=\'%s\',sock_type=\'%s\')]" %  (self.pio.import_name,
+    [%s(host=\'%s\',port=\'%s\',sock_type=\'%s\')]" %  (self.commClass(),
                             self.pdo[ii].host, 
                             self.pdo[ii].port,
                             self.pdo[ii].type)   ;  mbuf += [tbuf]
@@ -3160,6 +3271,8 @@ class scb:
         
       if (not eflg):
         eflg, self.pio, self.pco, self.pdo = self.get_ini_params(cp,self.des_file)  
+        if (self.pdo != None):
+          self.pdo = SCBO.IndexedList(self.pdo)  # searched by name and events
          
       # enter code generation:
       
@@ -3591,6 +3704,11 @@ class scb:
             comma_f = False  
             event_data =0   
             phrase = xevent      
+            #
+            # the transition holds the interned event type of the id,
+            # param is the interface, which owns the registry
+            #
+            xevent = "param.registry.intern(%s)" % (phrase)
         
           buf3 = "    Transition(%s, %s, %s, %s, %s)" % (xstart,xend,xevent,xguard,xaction)
           if (self.iniPrint):
@@ -3624,6 +3742,10 @@ class scb:
           tbuf = "proxy = %s.%s()"%(rpc_client,rpc_client)          ; mbuf2 += [tbuf]
         if (self.pio != None):     
           tbuf = "import jsonpickle"                                ; mbuf2 += [tbuf]
+          tbuf = "import scbWire"                                   ; mbuf2 += [tbuf]
+          if (self.iniTransport):
+            tbuf = "import scbTransport"                            ; mbuf2 += [tbuf]
+            tbuf = "from StatechartThread import StatechartThread"  ; mbuf2 += [tbuf]
           pdo_f, pdo_info = SCBO.NamedObject.namedListMatch(list_of_lists=self.pdo,
                                                     name="format",
                                                     value ="YamlData")
@@ -3643,36 +3765,51 @@ class scb:
               tbuf = "import DynamicObject"                                ; mbuf2 += [tbuf] # yaml
               tbuf = "import Serializer"                                   ; mbuf2 += [tbuf] # yaml
           
+        tbuf = "from EventQueue import EventQueue"                     ; mbuf2 += [tbuf]
+        tbuf = "from scbObjects import IndexedList"                    ; mbuf2 += [tbuf]
+        tbuf = "from pystatecharts.transition import EventRegistry"    ; mbuf2 += [tbuf]
         tbuf = "class ExceptionString(Exception):"                     ; mbuf2 += [tbuf]
         tbuf = "    def __str__(self):"                                ; mbuf2 += [tbuf]
         tbuf = "        return repr(self.args[0])"                     ; mbuf2 += [tbuf]
+        if (self.pio != None):
+          mbuf2 += self.decodeTables(self.evo)
         tbuf = "class %s(object):" %(self.chart_name)                  ; mbuf2 += [tbuf]  
+        #
+        # the route of every event is fixed once the ports are configured,
+        # _buildRoutes (called from __init__) computes it once per event id:
+        #   route = (port_name, evStr, encoder, clist, plist, print_f)
+        #   port_name None is the local queue, encoder None falls back to
+        #   sendEventAsMsg (and its error reporting)
+        #
         tbuf = "    def sendEvent(self,event_id,event_data=None,local_f=False):" ; mbuf2 += [tbuf]
-        tbuf = "      err_f=False"                                           ; mbuf2 += [tbuf]
-        tbuf = "      m_f, evStr = EventObject.idToEvent(self.evo,event_id)" ; mbuf2 += [tbuf]
-        tbuf = "      if (not m_f):"                                         ; mbuf2 += [tbuf]   
+        tbuf = "      route = self.routes.get(event_id)"                     ; mbuf2 += [tbuf]
+        tbuf = "      if (route == None):"                                   ; mbuf2 += [tbuf]   
         tbuf = "        emsg = \'*** Error: sendEvent ***\\n\'"              ; mbuf2 += [tbuf]
         tbuf = "        emsg = emsg + \'%d: unrecognized event\'%(event_id)" ; mbuf2 += [tbuf]
-        tbuf = "        err_f=True"                                          ; mbuf2 += [tbuf]
-        tbuf = "      if (not err_f):"                                       ; mbuf2 += [tbuf]
-        tbuf = "        event_class = evStr[0:evStr.find('.')]"              ; mbuf2 += [tbuf]
-        # Does the the port 'events' field match the event class?
-        tbuf = "        port_f, port_info = PortDataObject.namedListMatch(list_of_lists=self.pdo,\
-name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
-        #
-        # extra status for debug
-        #
-        #tbuf = "        print \"port_f=\",port_f,\"event_class=\",event_class" ; mbuf2 += [tbuf]
-        
+        tbuf = "        return"                                              ; mbuf2 += [tbuf]
         # local_f prevents sendEvent loop of death via callback
-        tbuf = "        if (port_f and (not local_f)):"                 ; mbuf2 += [tbuf]      
-        tbuf = "          self.sendEventAsMsg(port_info.name,event_id,event_data)" ; mbuf2 += [tbuf]
-        tbuf = "        else:"                                          ; mbuf2 += [tbuf]
-        tbuf = "          self.lock.acquire()"                          ; mbuf2 += [tbuf]
-        tbuf = "          event = Event(event_id, event_data)"          ; mbuf2 += [tbuf]
-        tbuf = "          self.events.append(event)"                    ; mbuf2 += [tbuf]
-        tbuf = "          self.lock.release()"                          ; mbuf2 += [tbuf]
-       
+        tbuf = "      if (route[0] != None) and (not local_f):"              ; mbuf2 += [tbuf]
+        tbuf = "        self.sendRouted(route,event_id,event_data)"          ; mbuf2 += [tbuf]
+        tbuf = "      else:"                                                 ; mbuf2 += [tbuf]
+        tbuf = "        self.events.put(self.registry.event(event_id, event_data))" ; mbuf2 += [tbuf]
+
+        tbuf = "    def _buildRoutes(self):"                                 ; mbuf2 += [tbuf]
+        tbuf = "      self.routes = {}"                                      ; mbuf2 += [tbuf]
+        tbuf = "      for event_set in self.evo:"                            ; mbuf2 += [tbuf]
+        tbuf = "        for ii in range(len(event_set.ids)):"                ; mbuf2 += [tbuf]
+        tbuf = "          evStr = event_set.name + \'.\' + event_set.events[ii]" ; mbuf2 += [tbuf]
+        if (self.pio != None):
+          # Does the the port 'events' field match the event class?
+          tbuf = "          port_f, port_info = PortDataObject.namedListMatch(list_of_lists=self.pdo,\
+name=\'events\',value =event_set.name)"                                 ; mbuf2 += [tbuf]
+          tbuf = "          if (port_f):"                                      ; mbuf2 += [tbuf]
+          tbuf = "            route = self.portRoute(port_info.name,event_set.ids[ii],evStr)" ; mbuf2 += [tbuf]
+          tbuf = "          else:"                                             ; mbuf2 += [tbuf]
+          tbuf = "            route = (None,evStr,None,None,None,True)"        ; mbuf2 += [tbuf]
+        else:
+          tbuf = "          route = (None,evStr,None,None,None,True)"          ; mbuf2 += [tbuf]
+        tbuf = "          self.routes[event_set.ids[ii]] = route"            ; mbuf2 += [tbuf]
+
         tbuf = "    def shutdown(self):"                               ; mbuf2 += [tbuf]
         tbuf = "        if (self.txtlog != None): "                    ; mbuf2 += [tbuf]
         tbuf = "          self.txtlog.info(\'shutting down logger\')" ;mbuf2 += [tbuf]
@@ -3709,7 +3846,7 @@ name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
           tbuf = "       err_f,clist,plist=PortObject.getPortOutParams("           ; mbuf2 += [tbuf]
           tbuf = "self.pco,self.pdo,port_name)"                                    ; mbuf2 += [tbuf]
           tbuf = "       if (not err_f):"                                          ; mbuf2 += [tbuf]
-          tbuf = "          m_f, evStr = EventObject.idToEvent(self.evo,event_id)" ; mbuf2 += [tbuf]
+          tbuf = "          m_f, evStr = self.evx.idToEvent(event_id)" ; mbuf2 += [tbuf]
           tbuf = "          if (not m_f):"                                         ; mbuf2 += [tbuf]
           tbuf = "            emsg=\'unrecognized event=%d\'%(event_id)"           ; mbuf2 += [tbuf]
           tbuf = "            self.PrintErr(caller,emsg)"                          ; mbuf2 += [tbuf]
@@ -3756,6 +3893,16 @@ name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
             tbuf="              dataStr = self.serializer.toSerial(event_data)" ; mbuf2 += [tbuf]
             tbuf="              evStr = evStr+\':\'+dataStr"                ; mbuf2 += [tbuf]
             tbuf="            err_f = self.comm[clist[0]].Put(evStr)"       ; mbuf2 += [tbuf]  
+          if (RMQ):
+            tbuf="          elif (plist.event_id==\'BinaryData\'):"         ; mbuf2 += [tbuf]
+          else:
+            tbuf="          elif (plist[0].format==\'BinaryData\'):"        ; mbuf2 += [tbuf]
+          tbuf = "            err_f, msg, evStr = self.encodeBinary(event_id,evStr,event_data)" ; mbuf2 += [tbuf]
+          tbuf = "            if (not err_f):"                              ; mbuf2 += [tbuf]
+          if (RMQ):
+            tbuf="              err_f = self.comm.Put(msg,plist.port,clist.msg_tag)" ; mbuf2 += [tbuf]
+          else:
+            tbuf="              err_f = self.comm[clist[0]].Put(msg)"       ; mbuf2 += [tbuf]
           tbuf = "          else:"                                          ; mbuf2 += [tbuf]
           tbuf = "            emsg = \"no conversion.%s,%s: (rd,[exp]):(%s,%s)\" %(" ; mbuf2 += [tbuf] 
           tbuf = "port_name,evStr,plist[0].format,"                         ; mbuf2 += [tbuf] 
@@ -3767,6 +3914,86 @@ name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
           tbuf = "         self.PrintInfo(caller,lmsg,event_id)"            ; mbuf2 += [tbuf]
           tbuf = "       return err_f"                                      ; mbuf2 += [tbuf]   
         
+          tbuf = "    def decodeErr(self,emsg):"                            ; mbuf2 += [tbuf]
+          tbuf = "       if (self.txtlog!=None):"                           ; mbuf2 += [tbuf]
+          tbuf = "         self.txtlog.error(emsg)"                         ; mbuf2 += [tbuf]
+          tbuf = "       else:"                                             ; mbuf2 += [tbuf]
+          tbuf = "         print emsg"                                      ; mbuf2 += [tbuf]
+          tbuf = "       return -1, None"                                   ; mbuf2 += [tbuf]
+
+          tbuf = "    def portRoute(self,port_name,event_id,evStr):"        ; mbuf2 += [tbuf]
+          tbuf = "       encoder = None"                                    ; mbuf2 += [tbuf]
+          tbuf = "       err_f,clist,plist=PortObject.getPortOutParams("    ; mbuf2 += [tbuf]
+          tbuf = "self.pco,self.pdo,port_name)"                             ; mbuf2 += [tbuf]
+          tbuf = "       if (not err_f):"                                   ; mbuf2 += [tbuf]
+          if (RMQ):
+            tbuf="          fmt = plist.event_id"                           ; mbuf2 += [tbuf]
+          else:
+            tbuf="          fmt = plist[0].format"                          ; mbuf2 += [tbuf]
+          tbuf = "          if (fmt==\'AnyEvent\') or (fmt==evStr):"        ; mbuf2 += [tbuf]
+          tbuf = "            encoder = self.encodeEvent"                   ; mbuf2 += [tbuf]
+          tbuf = "          elif (fmt==\'JsonData\'):"                      ; mbuf2 += [tbuf]
+          tbuf = "            encoder = self.encodeJson"                    ; mbuf2 += [tbuf]
+          if (not RMQ):
+            tbuf="          elif (fmt==\'YamlData\'):"                      ; mbuf2 += [tbuf]
+            tbuf="            encoder = self.encodeYaml"                    ; mbuf2 += [tbuf]
+          tbuf = "          elif (fmt==\'BinaryData\'):"                    ; mbuf2 += [tbuf]
+          tbuf = "            encoder = self.encodeBinary"                  ; mbuf2 += [tbuf]
+          tbuf = "       print_f = (self.spe.count(event_id)<=0)"           ; mbuf2 += [tbuf]
+          tbuf = "       return (port_name,evStr,encoder,clist,plist,print_f)" ; mbuf2 += [tbuf]
+
+          tbuf = "    def sendRouted(self,route,event_id,event_data):"      ; mbuf2 += [tbuf]
+          tbuf = "       port_name,evStr,encoder,clist,plist,print_f = route" ; mbuf2 += [tbuf]
+          tbuf = "       if (encoder == None):"                             ; mbuf2 += [tbuf]
+          tbuf = "         return self.sendEventAsMsg(port_name,event_id,event_data)" ; mbuf2 += [tbuf]
+          #
+          # encoders return the error flag, the message and its printable form
+          #
+          tbuf = "       err_f, msg, txt = encoder(event_id,evStr,event_data)" ; mbuf2 += [tbuf]
+          tbuf = "       if (not err_f):"                                   ; mbuf2 += [tbuf]
+          if (RMQ):
+            tbuf="         err_f = self.comm.Put(msg,plist.port,clist.msg_tag)" ; mbuf2 += [tbuf]
+          else:
+            tbuf="         err_f = self.comm[clist[0]].Put(msg)"            ; mbuf2 += [tbuf]
+          tbuf = "       if (not err_f) and print_f:"                       ; mbuf2 += [tbuf]
+          tbuf = "         lmsg=\'(port,msg)=(%s,%s)\'%(port_name,txt)"     ; mbuf2 += [tbuf]
+          tbuf = "         self.PrintInfo(\'sendEventAsMsg\',lmsg)"         ; mbuf2 += [tbuf]
+          tbuf = "       return err_f"                                      ; mbuf2 += [tbuf]
+
+          tbuf = "    def encodeEvent(self,event_id,evStr,event_data):"     ; mbuf2 += [tbuf]
+          tbuf = "       return False, evStr, evStr"                        ; mbuf2 += [tbuf]
+
+          tbuf = "    def encodeBinary(self,event_id,evStr,event_data):"    ; mbuf2 += [tbuf]
+          tbuf = "       try:"                                              ; mbuf2 += [tbuf]
+          tbuf = "         msg = scbWire.encode(event_id,event_data)"       ; mbuf2 += [tbuf]
+          tbuf = "       except Exception as eobj:"                         ; mbuf2 += [tbuf]
+          tbuf = "         emsg = str(ExceptionString(eobj))"               ; mbuf2 += [tbuf]
+          tbuf = "         self.PrintErr(\'sendEventAsMsg\',\'Exception:\'+emsg)" ; mbuf2 += [tbuf]
+          tbuf = "         return True, None, evStr"                        ; mbuf2 += [tbuf]
+          tbuf = "       return False, msg, evStr"                          ; mbuf2 += [tbuf]
+
+          tbuf = "    def encodeJson(self,event_id,evStr,event_data):"      ; mbuf2 += [tbuf]
+          tbuf = "       if (event_data==None):"                            ; mbuf2 += [tbuf]
+          tbuf = "         return False, evStr, evStr"                      ; mbuf2 += [tbuf]
+          tbuf = "       try:"                                              ; mbuf2 += [tbuf]
+          tbuf = "         dataStr = jsonpickle.encode(event_data)"         ; mbuf2 += [tbuf]
+          tbuf = "       except Exception as eobj:"                         ; mbuf2 += [tbuf]
+          tbuf = "         emsg = str(ExceptionString(eobj))"               ; mbuf2 += [tbuf]
+          tbuf = "         self.PrintErr(\'sendEventAsMsg\',\'Exception:\'+emsg)" ; mbuf2 += [tbuf]
+          tbuf = "         return True, None, evStr"                        ; mbuf2 += [tbuf]
+          tbuf = "       msg = evStr+\':\'+dataStr"                         ; mbuf2 += [tbuf]
+          tbuf = "       return False, msg, msg"                            ; mbuf2 += [tbuf]
+
+          if (not RMQ):
+            tbuf="    def encodeYaml(self,event_id,evStr,event_data):"      ; mbuf2 += [tbuf]
+            tbuf="       if (event_data==None):"                            ; mbuf2 += [tbuf]
+            tbuf="         return False, evStr, evStr"                      ; mbuf2 += [tbuf]
+            tbuf="       if (getattr(self,\'serializer\',None)==None):"     ; mbuf2 += [tbuf]
+            tbuf="         self.serial_type = \"yaml\""                   ; mbuf2 += [tbuf]
+            tbuf="         self.serializer = Serializer.serializers[\"yaml\"]()" ; mbuf2 += [tbuf]
+            tbuf="       msg = evStr+\':\'+self.serializer.toSerial(event_data)" ; mbuf2 += [tbuf]
+            tbuf="       return False, msg, msg"                            ; mbuf2 += [tbuf]
+
           tbuf = "    def getMsgSendEvent(self,port_name):"                 ; mbuf2 += [tbuf]
           tbuf = "       err_f, event_f = PortObject.getMsgSendEvent(self,\
     port_name, self.evo[0],self.pco, self.pdo)"                             ; mbuf2 += [tbuf]
@@ -3818,6 +4045,8 @@ name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
                               self.evo[ii].events,
                               self.evo[ii].ids)         ; mbuf3 = mbuf3 + [tbuf]                       
             ii = ii +1  
+        tbuf =     "        self.evo = IndexedList(self.evo)"        ; mbuf3 = mbuf3 + [tbuf]
+        tbuf =     "        self.evx = EventObject.compile(self.evo)" ; mbuf3 = mbuf3 + [tbuf]
         
         # -------------- suppressed printing events -----------------
          
@@ -3854,14 +4083,23 @@ name=\'events\',value =event_class)"                         ; mbuf2 += [tbuf]
        # -------------- statechart and thread are dependent on event object -----------------
         
         mbuf4 = [] 
-        tbuf = "        self.events = list()"                 ; mbuf4 += [tbuf]
-        tbuf = "        self.lock = Lock()"                   ; mbuf4 += [tbuf]
+        #
+        # blocking queue between sendEvent and the statechart thread,
+        # a QueueSize in the design file bounds it (backpressure)
+        #
+        tbuf = "        self.events = EventQueue(maxlen=%d)" % (self.iniQueueSize) ; mbuf4 += [tbuf]
+        tbuf = "        self.registry = EventRegistry()"      ; mbuf4 += [tbuf]
         tbuf = "        self.txtlog = None"                   ; mbuf4 += [tbuf]
         for event_set in self.evo:
           tbuf="        self.%s = %s" %(event_set.name,event_set.name); mbuf4 += [tbuf]
+        tbuf = "        self._buildRoutes()"                  ; mbuf4 += [tbuf]
         tbuf = "        self.statechart = %sStatechart(self)" % (self.chart_name) ; mbuf4 += [tbuf]
         tbuf = "        self.statechart.start()"              ; mbuf4 += [tbuf]
-        if (RMQ):
+        if (RMQ) or self.iniTransport:
+          #
+          # a local transport delivers from its own listener threads,
+          # as rabbitmq does, the statechart runs in its own thread
+          #
           tbuf="        self.thread = StatechartThread(self)" ; mbuf4 += [tbuf]
           tbuf="        self.thread.start()"                  ; mbuf4 += [tbuf]
         else:
@@ -3966,7 +4204,12 @@ if __name__ == "__main__":
     #       zeromq is one object per channel -> a list of objects 
     #
     
-    if (RMQ):
+    if (scbobj.iniTransport):
+      if (scbobj.pio != None):
+        print "Subscribing to %s transport" % (scbobj.iniTransport)
+        sc_handle.subscribe()
+      # end if ports
+    elif (RMQ):
       if (scbobj.pio != None):
         print "Subscribing to rabbitmq server"
         sc_handle.subscribe()
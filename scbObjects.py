@@ -17,12 +17,26 @@
     indexListMatch                      - uses key to return index and list from list_of_lists
     namedListMatch          		- uses key to return list from list_of_lists     
     combineLists            		- debug utility  
+
+ class IndexedList(list)                - list of named objects, indexed searches
+   functions:
+    indexMatch                          - indexListMatch shaped results, exact matching
+    namedMatch                          - namedListMatch shaped results, exact matching
+    reindex                             - drops the indexes after the objects changed
     
  class EventObject(NamedObject):
    functions:
      idToEvent                          - converts event id to event name
      EventToId                          - converts name to id
      updateList                         - updates values returned by combineLists
+     compile                            - returns an EventIndex of a list of event objects
+
+ class EventIndex                       - O(1) id <-> "class.event" lookups, built once
+   functions:
+     idToEvent                          - same result as EventObject.idToEvent
+     EventToId                          - same result as EventObject.EventToId
+     classesOf                          - classes declaring an event name
+     hasEvent                           - True if "class.event" is declared
  
  class XitionsObject(NamedObject)       - statechart transition object
  
@@ -55,23 +69,26 @@ class NamedObject():
        # search needs to be named part of class for object else .<value> is unrecognized
        #
        # unique_f finds non-uniqueness
+       #
+       # an IndexedList is searched on its indexes, exact or list member
+       # matches only (no substrings of a string attribute, see IndexedList)
     
+       if isinstance(list_of_lists, IndexedList):
+         return list_of_lists.indexMatch(name, value, name2, value2, unique_f)
   
        index = []                       # return empty indices
        list_data = []                   # return empty list
        ii = 0
        for theList in list_of_lists:
       
-         cmd0 = "theList.%s == value" % (name)
-         cmd1 = "isInlist(theList.%s,value)" % name
+         attr = getattr(theList, name)
                                    # if name is valid then 
                                    # match name against value
                                    # match name (as list) against value                          
-         if (eval(cmd0) or eval(cmd1)):                            
+         if ((attr == value) or isInlist(attr,value)):                            
            if (name2 != None):
-              cmd2 = "theList.%s == value2" % name2
-              cmd3 = "isInlist(theList.%s,value2)" % name2
-              if (eval(cmd2) or eval(cmd3)):
+              attr2 = getattr(theList, name2)
+              if ((attr2 == value2) or isInlist(attr2,value2)):
                  if (unique_f):
                    index = index + [ii]
                    list_data = list_data + [theList]   # save list of lists if non-unique
@@ -107,22 +124,26 @@ class NamedObject():
        # search needs to be named part of class for object else .<value> is unrecognized
        #
        # unique_f finds non-uniqueness ('None' is same as False)
+       #
+       # an IndexedList is searched on its indexes, exact or list member
+       # matches only (no substrings of a string attribute, see IndexedList)
  
+       if isinstance(list_of_lists, IndexedList):
+         return list_of_lists.namedMatch(name, value, name2, value2, unique_f)
+
        match_f = False
        list_data = []                   # initialize
     
        for theList in list_of_lists:
       
-         cmd0 = "theList.%s == value" % (name)
-         cmd1 = "isInlist(theList.%s,value)" % name
+         attr = getattr(theList, name)
                                    # if name is valid then 
                                    # match name against value
                                    # match name (as list) against value                          
-         if (eval(cmd0) or eval(cmd1)):                            
+         if ((attr == value) or isInlist(attr,value)):                            
            if (name2 != None):
-              cmd2 = "theList.%s == value2" % name2
-              cmd3 = "isInlist(theList.%s,value2)" % name2
-              if (eval(cmd2) or eval(cmd3)):
+              attr2 = getattr(theList, name2)
+              if ((attr2 == value2) or isInlist(attr2,value2)):
                  match_f = True
                  if (unique_f):
                    list_data = list_data + [theList]   # save list of lists if non-unique
@@ -159,6 +180,122 @@ class NamedObject():
     
   # end combineLists 
 
+#---------------------------------------------   
+#---------------------------------------------  
+#
+# list of named objects with hash indexes on their attributes
+# - an index is built the first time an attribute is searched, it maps
+#   the attribute value, and every member of a list or tuple value, to
+#   the positions of the objects
+# - matching is exact or list membership, which differs from the list
+#   scan of NamedObject.indexListMatch/namedListMatch:
+#     a string attribute does not match its substrings (the scan's
+#     isInlist does, "port10" matches "port1")
+#     an object without the attribute does not match (the scan raises
+#     AttributeError)
+#     an unhashable value or list member does not match
+# - changing the list drops the indexes, call reindex() after changing
+#   the objects in it
+#
+class IndexedList(list):
+
+  _missing = object()
+
+  def __init__(self, items=()):
+    list.__init__(self, items)
+    self.indexes = {}
+  #end __init__
+
+  def reindex(self):
+    self.indexes = {}
+  #end reindex
+
+  def attributeIndex(self, name):
+    index = self.indexes.get(name)
+    if (index == None):
+      index = {}
+      for ii in range(len(self)):
+        attr = getattr(self[ii], name, IndexedList._missing)
+        if (attr is IndexedList._missing):
+          continue
+        keys = [attr]
+        if isinstance(attr, (list, tuple)):
+          keys = list(attr)
+        for key in keys:
+          try:
+            positions = index.setdefault(key, [])
+          except TypeError:                  # unhashable, not indexed
+            continue
+          if (len(positions) == 0) or (positions[-1] != ii):
+            positions.append(ii)
+      self.indexes[name] = index
+    return index
+  #end attributeIndex
+
+  def positions(self, name, value, name2=None, value2=None):
+    try:
+      found = self.attributeIndex(name).get(value, [])
+    except TypeError:                        # unhashable value
+      return []
+    if (name2 != None) and found:
+      try:
+        found2 = self.attributeIndex(name2).get(value2, [])
+      except TypeError:
+        return []
+      found2 = set(found2)
+      found = [ii for ii in found if ii in found2]
+    return found
+  #end positions
+
+  def indexMatch(self, name, value, name2=None, value2=None, unique_f=False):
+    #
+    # result shaped as NamedObject.indexListMatch, matched as above
+    #
+    found = self.positions(name, value, name2, value2)
+    if (len(found) == 0):
+      return [], []
+    if (unique_f):
+      return list(found), [self[ii] for ii in found]
+    return [found[0]], self[found[0]]
+  #end indexMatch
+
+  def namedMatch(self, name, value, name2=None, value2=None, unique_f=None):
+    #
+    # result shaped as NamedObject.namedListMatch, matched as above
+    #
+    found = self.positions(name, value, name2, value2)
+    if (len(found) == 0):
+      return False, []
+    if (unique_f):
+      return True, [self[ii] for ii in found]
+    return True, self[found[0]]
+  #end namedMatch
+
+  #
+  # changes to the list drop the indexes
+  #
+  def _changed(method):
+    def changed(self, *args):
+      self.indexes = {}
+      return method(self, *args)
+    changed.__name__ = method.__name__
+    return changed
+
+  append      = _changed(list.append)
+  extend      = _changed(list.extend)
+  insert      = _changed(list.insert)
+  remove      = _changed(list.remove)
+  pop         = _changed(list.pop)
+  sort        = _changed(list.sort)
+  reverse     = _changed(list.reverse)
+  __setitem__ = _changed(list.__setitem__)
+  __delitem__ = _changed(list.__delitem__)
+  __iadd__    = _changed(list.__iadd__)
+  __setslice__ = _changed(list.__setslice__)
+  __delslice__ = _changed(list.__delslice__)
+  del _changed
+#end class IndexedList
+
 #---------------------------------------------   
 #---------------------------------------------  
 
@@ -233,8 +370,83 @@ class EventObject(NamedObject):
              match_f = False
              print "EventToId: ", eobj
        return ridx
+
+    #
+    # the event ids are final once scb.unique_events has run,
+    # the index is built then and replaces the list scans
+    #
+    @staticmethod
+    def compile(list_of_lists):
+       return EventIndex(list_of_lists)
 # end class EventObject  
 
+#---------------------------------------------  
+#---------------------------------------------     
+#
+# dict and array backed index of the event objects
+#
+class EventIndex(object):
+    def __init__(self, list_of_lists):
+       self.ids     = {}               # "class.event" -> id
+       self.names   = set()            # "class.event"
+       self.classes = {}               # event -> [classes]
+       self.first   = 0                # lowest id, offset of the arrays
+       self.full    = []               # id - first -> "class.event" or None
+       self.pairs   = []               # id - first -> (class, event) or None
+       all_ids = []
+       for event_list in list_of_lists:
+         all_ids = all_ids + [int(id) for id in event_list.ids]
+       if (len(all_ids) > 0):
+         self.first = min(all_ids)
+         size = max(all_ids) - self.first + 1
+         self.full = [None] * size
+         self.pairs = [None] * size
+       for event_list in list_of_lists:
+         for idx in range(len(event_list.events)):
+           event_name = event_list.events[idx]
+           event_full = event_list.name + "." + event_name
+           self.names.add(event_full)
+           self.classes.setdefault(event_name, []).append(event_list.name)
+           if (idx < len(event_list.ids)):  # no ids before unique_events
+             id = int(event_list.ids[idx])
+             self.ids[event_full] = id
+             self.full[id - self.first] = event_full
+             self.pairs[id - self.first] = (event_list.name, event_name)
+    #end __init__
+
+    def hasEvent(self, event_full):
+       return event_full in self.names
+    # end hasEvent
+
+    def lookup(self, id):
+       #
+       # returns (class, event) or None
+       #
+       idx = id - self.first
+       if (idx < 0) or (idx >= len(self.pairs)):
+         return None
+       return self.pairs[idx]
+    # end lookup
+
+    def idToEvent(self, id):
+       idx = id - self.first
+       if (idx < 0) or (idx >= len(self.full)) or (self.full[idx] == None):
+         return False, ""
+       return True, self.full[idx]
+    # end idToEvent
+
+    def EventToId(self, event_name):
+       id = self.ids.get(event_name)
+       if (id == None):
+         id = self.ids.get(event_name.strip(), -1)
+       return id
+    # end EventToId
+
+    def classesOf(self, event_name):
+       return self.classes.get(event_name, [])
+    # end classesOf
+# end class EventIndex
+
 #---------------------------------------------  
 #---------------------------------------------     
 
@@ -306,7 +518,7 @@ class CommonPortObject(NamedObject):
   #---------------------------------------------
   @staticmethod  
   def getPortEventValidIDs():
-    return ['AnyEvent','JsonData','YamlData']    # these params tell how to pack/unpack data for socket
+    return ['AnyEvent','JsonData','YamlData','BinaryData'] # these params tell how to pack/unpack data for socket
 
   #---------------------------------------------
   @staticmethod
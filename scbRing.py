@@ -0,0 +1,283 @@
+"""
+ scbRing
+
+ Design:
+
+ The purpose of this file is same host fan-out of event messages between
+ statechart processes without a broker hop. A ring is a file in /dev/shm
+ (the temp directory where there is none) mapped by every process with
+ mmap; python 2 has no multiprocessing.shared_memory.
+  - single producer, multiple consumers: one writer per ring and process
+    (RingWriter is shared by the transports of a process), any number of
+    readers, every reader sees every message (fanout)
+  - the header holds the absolute write position, records carry a
+    sequence number:
+      ring header   magic, capacity, write position, write sequence
+      record        sequence (64 bit), length (32 bit), payload, padded
+                    to 8 bytes; a record that does not fit before the end
+                    of the ring is preceded by a wrap marker
+  - the writer copies a record first and publishes the write position
+    after it, readers never lock and never block the writer
+  - a reader that falls more than a ring behind is overrun: it detects
+    this from the write position (and the gap in the sequence numbers),
+    counts the lost messages in dropped and resumes at the write position
+  - readers poll: a short spin for low latency, then sleeps
+
+ ---------------------------------------------
+
+ class RingError(Exception)
+ class RingWriter:
+  functions:
+    put, put_many           - append messages
+ class RingReader:
+  functions:
+    read                    - the messages available now
+    get_batch               - waits for messages, EventQueue compatible
+ functions:
+    ringPath                - the ring file of an endpoint name
+    writer                  - the shared RingWriter of a ring file
+
+"""
+
+import os
+import re
+import mmap
+import time
+import struct
+import tempfile
+import threading
+
+MAGIC = 'SCBRING1'
+HEADER = struct.Struct('<8sQQQ')     # magic, capacity, write position, sequence
+POSITION = struct.Struct('<QQ')      # write position, sequence (published together)
+POSITION_OFFSET = 16
+RECORD = struct.Struct('<QI4x')      # sequence, length
+WRAP = 0xffffffff                    # record length of the wrap marker
+CAPACITY = 1 << 20                   # default ring data bytes
+SPIN = 200                           # polls before a reader sleeps
+SLEEP = 0.0005                       # reader sleep between polls
+
+#-----------------------------------------------------------------
+# RingError
+#
+class RingError(Exception):
+  def __str__(self):
+    return repr(self.args[0])
+#end class RingError
+#-----------------------------------------------------------------
+def ringPath(name, directory=None):
+  if (directory == None):
+    directory = '/dev/shm'
+    if not os.path.isdir(directory):
+      directory = tempfile.gettempdir()
+  return os.path.join(directory, "scb-%s.ring" % re.sub(r'[^\w.-]', '_', name))
+# end ringPath
+#-----------------------------------------------------------------
+def _map(path, capacity):
+  #
+  # opens the ring, the first process creates and initialises it,
+  # returns (mmap, capacity of the existing ring)
+  #
+  size = HEADER.size + capacity
+  try:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0666)
+    created = True
+  except OSError:
+    fd = os.open(path, os.O_RDWR)
+    created = False
+  try:
+    if created:
+      os.ftruncate(fd, size)
+      ring = mmap.mmap(fd, size)
+      HEADER.pack_into(ring, 0, '\0' * 8, capacity, 0, 0)
+      ring[0:8] = MAGIC                 # last, marks the ring ready
+      return ring, capacity
+    deadline = time.time() + 1.0        # creator may still be initialising
+    while True:
+      if (os.fstat(fd).st_size >= HEADER.size):
+        head = os.read(fd, HEADER.size)
+        os.lseek(fd, 0, os.SEEK_SET)
+        if (head[0:8] == MAGIC):
+          capacity = HEADER.unpack(head)[1]
+          return mmap.mmap(fd, HEADER.size + capacity), capacity
+      if (time.time() > deadline):
+        raise RingError("%s is not a ring" % path)
+      time.sleep(0.001)
+  finally:
+    os.close(fd)
+# end _map
+#-----------------------------------------------------------------
+#
+# RingWriter
+#
+class RingWriter(object):
+
+  def __init__(self, path, capacity=CAPACITY):
+    self.path = path
+    self.ring, self.capacity = _map(path, capacity)
+    self.max_msg = self.capacity // 4 - RECORD.size
+    self.position, self.sequence = POSITION.unpack_from(self.ring, POSITION_OFFSET)
+    self.lock = threading.Lock()       # threads of the one producer process
+  # end __init__
+  #-----------------------------------------------------------------
+  def _append(self, msg):
+    #
+    # copies one record, then publishes the position
+    #
+    length = len(msg)
+    if (length > self.max_msg):
+      raise RingError("message of %d bytes, ring limit is %d" % (length, self.max_msg))
+    need = RECORD.size + ((length + 7) & ~7)
+    offset = self.position % self.capacity
+    room = self.capacity - offset
+    if (room < need):
+      if (room >= RECORD.size):
+        RECORD.pack_into(self.ring, HEADER.size + offset, self.sequence, WRAP)
+      self.position += room
+      offset = 0
+    self.sequence += 1
+    start = HEADER.size + offset
+    RECORD.pack_into(self.ring, start, self.sequence, length)
+    start += RECORD.size
+    self.ring[start:start + length] = msg
+    self.position += need
+    POSITION.pack_into(self.ring, POSITION_OFFSET, self.position, self.sequence)
+  # end _append
+  #-----------------------------------------------------------------
+  def put_many(self, msgs):
+    self.lock.acquire()
+    try:
+      for msg in msgs:
+        self._append(msg)
+    finally:
+      self.lock.release()
+    return True
+  # end put_many
+
+  def put(self, msg):
+    return self.put_many((msg,))
+  # end put
+
+  def close(self):
+    self.ring.close()
+  # end close
+
+#end class RingWriter
+#-----------------------------------------------------------------
+_writers = {}                        # ring path -> RingWriter of this process
+_writers_lock = threading.Lock()
+
+def writer(path, capacity=CAPACITY):
+  _writers_lock.acquire()
+  try:
+    ring = _writers.get(path)
+    if (ring == None):
+      ring = RingWriter(path, capacity)
+      _writers[path] = ring
+    return ring
+  finally:
+    _writers_lock.release()
+# end writer
+#-----------------------------------------------------------------
+#
+# RingReader
+#           purpose: one consumer cursor, starts at the current
+#                    write position (messages published from now on)
+#
+class RingReader(object):
+
+  def __init__(self, path, capacity=CAPACITY):
+    self.path = path
+    self.ring, self.capacity = _map(path, capacity)
+    self.max_msg = self.capacity // 4 - RECORD.size
+    #
+    # the writer may be copying up to two records (a wrap and the
+    # record) past the published position, a record further back than
+    # that is safe to read
+    #
+    self.margin = 2 * (self.max_msg + RECORD.size)
+    self.position, self.sequence = POSITION.unpack_from(self.ring, POSITION_OFFSET)
+    self.dropped = 0                   # messages lost to overruns
+    self.closed = False
+  # end __init__
+  #-----------------------------------------------------------------
+  def _overrun(self):
+    position, sequence = POSITION.unpack_from(self.ring, POSITION_OFFSET)
+    self.dropped += sequence - self.sequence
+    self.position, self.sequence = position, sequence
+  # end _overrun
+  #-----------------------------------------------------------------
+  def read(self, max_items=None):
+    #
+    # returns the messages published since the last read (up to max_items)
+    #
+    ring = self.ring
+    capacity = self.capacity
+    msgs = []
+    position = POSITION.unpack_from(ring, POSITION_OFFSET)[0]
+    if (position + self.margin - self.position > capacity):
+      self._overrun()
+      return msgs
+    while (self.position < position):
+      if (max_items != None) and (len(msgs) >= max_items):
+        break
+      offset = self.position % capacity
+      room = capacity - offset
+      if (room < RECORD.size):
+        self.position += room
+        continue
+      start = HEADER.size + offset
+      sequence, length = RECORD.unpack_from(ring, start)
+      if (length == WRAP):
+        self.position += room
+        continue
+      if (length > self.max_msg):      # record overwritten under us
+        self._overrun()
+        return msgs
+      msg = ring[start + RECORD.size:start + RECORD.size + length]
+      #
+      # still valid if the writer has not come round to it while copying
+      #
+      if (POSITION.unpack_from(ring, POSITION_OFFSET)[0] + self.margin
+          - self.position > capacity):
+        self._overrun()
+        return msgs
+      if (sequence != self.sequence + 1):
+        self.dropped += sequence - self.sequence - 1
+      self.sequence = sequence
+      self.position += RECORD.size + ((length + 7) & ~7)
+      msgs.append(msg)
+    return msgs
+  # end read
+  #-----------------------------------------------------------------
+  def get_batch(self, max_items=None, timeout=None):
+    #
+    # waits until at least one message is published, the timeout
+    # expires or the reader is closed
+    #
+    deadline = None
+    if (timeout != None):
+      deadline = time.time() + timeout
+    polls = 0
+    while not self.closed:
+      msgs = self.read(max_items)
+      if msgs:
+        return msgs
+      polls += 1
+      if (polls > SPIN):
+        if (deadline != None) and (time.time() >= deadline):
+          break
+        time.sleep(SLEEP)
+    return []
+  # end get_batch
+
+  def __len__(self):
+    return POSITION.unpack_from(self.ring, POSITION_OFFSET)[1] - self.sequence
+  # end __len__
+
+  def close(self):
+    self.closed = True
+  # end close
+
+#end class RingReader
+#-----------------------------------------------------------------
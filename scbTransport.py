@@ -0,0 +1,546 @@
+"""
+ scbTransport
+
+ Design:
+
+ The purpose of this file is to run generated statecharts without a
+ message broker: co-located charts, tests and benchmarks on one box.
+ A Transport has the Put/Get/Subscribe/Configure interface the generated
+ code uses on pyrabbitmq.CommObject and on the zeromq CommObject, so the
+ generator only changes the class it instantiates ([OPTIONS] Transport).
+  - endpoints are named: a queue (rabbitmq shape, ConfigureList binds
+    exchanges to queues) or host:port (zeromq shape, one object per port)
+  - rabbitmq shape callbacks receive Message objects (body, channel,
+    delivery_tag), zeromq shape callbacks receive the string
+  - a listener thread per subscription drains its endpoint in batches,
+    a callback sees one message, a "many" callback sees a whole batch
+  - acks are accepted and ignored, a local endpoint does not redeliver
+
+ InProcTransport    - endpoints are EventQueues shared in the process,
+                      messages are passed by reference
+ UnixSocketTransport - endpoints are AF_UNIX stream sockets, messages are
+                      framed (4 byte length prefix), PutMany sends all
+                      its frames with one sendall and the receiver parses
+                      every frame of a read before handing them over
+ ShmRingTransport   - fan-out between the processes of one host: a shared
+                      memory ring (scbRing) per exchange or port, every
+                      subscriber reads every message
+
+ ---------------------------------------------
+
+ class Message                      - rabbitmq shaped message
+ class Transport:
+  functions:
+    Configure, ConfigureList        - binds an exchange to a queue
+    Put, PutMany                    - sends to an exchange (or own endpoint)
+    Get                             - non blocking receive of one message
+    Subscribe, SubscribeMany        - listener thread calling back
+    Consume                         - SubscribeMany with backlog flow control
+    GeventGet                       - zeromq shaped Subscribe
+    Unsubscribe, Close
+ class InProcTransport(Transport)
+ class UnixSocketTransport(Transport)
+ class ShmRingTransport(Transport)
+
+"""
+
+import os
+import re
+import time
+import errno
+import socket
+import struct
+import tempfile
+import threading
+import scbRing
+from Worker import Worker
+from EventQueue import EventQueue
+
+FRAME = struct.Struct('!I')          # length prefix of a unix socket frame
+
+#-----------------------------------------------------------------
+# Message
+#          purpose: what a rabbitmq callback expects of a delivery
+#
+class Message(object):
+
+  __slots__ = ('body', 'channel', 'delivery_tag')
+
+  def __init__(self, body, channel=None, delivery_tag=0):
+    self.body = body
+    self.channel = channel
+    self.delivery_tag = delivery_tag
+  # end __init__
+
+#end class Message
+#-----------------------------------------------------------------
+#
+# Transport
+#
+class Transport(object):
+
+  def __init__(self, host='localhost', port=None, sock_type=None,
+               userid=None, password=None, batch=256):
+    self.error = False
+    self.host = host
+    self.port = port
+    self.sock_type = sock_type
+    self.name = None                   # own endpoint, zeromq shape
+    if (port != None):
+      self.name = "%s:%s" % (host, port)
+    self.channel_id = id(self)         # stands in for the channel of acks
+    self.batch = batch                 # messages per listener wakeup
+    self.bindings = {}                 # exchange -> [queue, ...]
+    self.listeners = []                # [Worker, ...]
+    self.topics = None                 # zeromq subscribe filter
+    self.interface = None
+    self.tag = 0
+  # end __init__
+  #-----------------------------------------------------------------
+  # implementation, overridden
+  #
+  def _send(self, name, msgs):
+    raise NotImplementedError
+  # end _send
+
+  def _endpoint(self, name):
+    #
+    # returns the receive side of an endpoint, an object with
+    # get_batch(max_items, timeout) and close()
+    #
+    raise NotImplementedError
+  # end _endpoint
+  #-----------------------------------------------------------------
+  def Configure(self, config):
+    #
+    # config: [<channel>, <exchange>, <type>, <queue>, <routing_key>]
+    #
+    queues = self.bindings.setdefault(config[1], [])
+    if (config[3] != None) and (not config[3] in queues):
+      queues.append(config[3])
+    return False
+  # end Configure
+
+  def ConfigureList(self, configSet):
+    for config in configSet:
+      self.Configure(config)
+    return False
+  # end ConfigureList
+  #-----------------------------------------------------------------
+  def _targets(self, exchange):
+    if (exchange == None):
+      if (self.name == None):
+        return []
+      return [self.name]
+    return self.bindings.get(exchange, [])
+  # end _targets
+  #-----------------------------------------------------------------
+  def Put(self, msg_in, exchange=None, routing_key=None):
+    return self.PutMany([msg_in], exchange, routing_key)
+  # end Put
+
+  def PutMany(self, msgs, exchange=None, routing_key=None):
+    targets = self._targets(exchange)
+    if (len(targets) == 0):
+      print "Put(), no endpoint for exchange: %s" % (exchange)
+      return True
+    err_f = False
+    for name in targets:
+      err_f = self._send(name, msgs) or err_f
+    return err_f
+  # end PutMany
+  #-----------------------------------------------------------------
+  def Get(self, queue=None):
+    #
+    # returns err_f, msg_f, msg like pyrabbitmq.CommObject.Get
+    #
+    if (queue == None):
+      queue = self.name
+    msgs = self._endpoint(queue).get_batch(1, 0)
+    if (len(msgs) == 0):
+      return False, False, None
+    return False, True, msgs[0]
+  # end Get
+  #-----------------------------------------------------------------
+  def _wrap(self, msgs):
+    #
+    # rabbitmq shaped callbacks read body, channel and delivery_tag
+    #
+    wrapped = []
+    for body in msgs:
+      self.tag += 1
+      wrapped.append(Message(body, self, self.tag))
+    return wrapped
+  # end _wrap
+  #-----------------------------------------------------------------
+  def _listen(self, name, callback, many, wrap, backlog=None,
+              high_water=0, low_water=0, batch=None):
+    endpoint = self._endpoint(name)
+    if (batch == None):
+      batch = self.batch
+    worker = None
+
+    def run():
+      while not worker.stopping():
+        msgs = endpoint.get_batch(batch, 0.1)
+        if (len(msgs) == 0):
+          continue
+        if (self.topics != None):
+          msgs = [msg for msg in msgs if msg.startswith(self.topics)]
+        if wrap:
+          msgs = self._wrap(msgs)
+        if (backlog != None) and (high_water > 0) and (len(backlog) >= high_water):
+          while (len(backlog) > low_water) and (not worker.stopping()):
+            backlog.wait_below(low_water + 1, 0.1)
+        if many:
+          callback(msgs)
+        else:
+          for msg in msgs:
+            callback(msg)
+
+    worker = Worker(name="Transport_%s" % name, target=run)
+    worker.daemon = True
+    worker.start()
+    self.listeners.append(worker)
+    return worker, worker.token
+  # end _listen
+  #-----------------------------------------------------------------
+  def Subscribe(self, queue=None, callback=None):
+    if (callback == None):
+      #
+      # zeromq shape, Subscribe(events) sets the subscribe filter
+      #
+      if (queue != None) and (queue != "None"):
+        self.topics = tuple(re.split(r'[\s,]+', queue.strip()))
+      return None
+    return self._listen(queue, callback, False, True)
+  # end Subscribe
+
+  def SubscribeMany(self, queue=None, callback=None):
+    if (queue == None):
+      return self._listen(self.name, callback, True, False)
+    return self._listen(queue, callback, True, True)
+  # end SubscribeMany
+
+  def Consume(self, queue, sink, prefetch=64, batch=None, backlog=None,
+              high_water=0, low_water=None, ack=True):
+    #
+    # same flow control as pyrabbitmq.Consumer: batches of up to batch
+    # (default prefetch) messages, held while the backlog is at or above
+    # high water, until it is below low water
+    #
+    if (batch == None):
+      batch = prefetch
+    if (low_water == None):
+      low_water = high_water // 2
+    worker, token = self._listen(queue, sink, True, True, backlog,
+                                 high_water, low_water, batch)
+    return worker
+  # end Consume
+
+  def GeventGet(self, wait_sec, callbacks):
+    #
+    # zeromq shape, one listener on the own endpoint
+    #
+    return self._listen(self.name, callbacks[0], False, False)
+  # end GeventGet
+  #-----------------------------------------------------------------
+  def Ack(self, ch_obj, delivery_tag):
+    pass
+  # end Ack
+
+  def AckMany(self, ch_obj, delivery_tag):
+    pass
+  # end AckMany
+
+  def Sc_if(self, interface):
+    self.interface = interface
+  # end Sc_if
+
+  def Dbg_if(self, scbobj):
+    pass
+  # end Dbg_if
+  #-----------------------------------------------------------------
+  def Unsubscribe(self, thread_object, event_object=None):
+    thread_object.shutdown(1.0)
+    if thread_object in self.listeners:
+      self.listeners.remove(thread_object)
+  # end Unsubscribe
+
+  def Close(self):
+    for worker in self.listeners:
+      worker.stop()
+    for worker in self.listeners:
+      worker.shutdown(1.0)
+    self.listeners = []
+  # end Close
+  CloseAll = Close
+
+#end class Transport
+#-----------------------------------------------------------------
+#
+# InProcTransport
+#           purpose: endpoints are queues shared by the transports
+#                    of one process
+#
+_hub = {}                            # endpoint name -> EventQueue
+_hub_lock = threading.Lock()
+
+def _hubQueue(name):
+  queue = _hub.get(name)
+  if (queue == None):
+    _hub_lock.acquire()
+    try:
+      queue = _hub.get(name)
+      if (queue == None):
+        queue = EventQueue()
+        _hub[name] = queue
+    finally:
+      _hub_lock.release()
+  return queue
+# end _hubQueue
+
+class InProcTransport(Transport):
+
+  def _send(self, name, msgs):
+    if (len(msgs) == 1):
+      return not _hubQueue(name).put(msgs[0])
+    return not _hubQueue(name).put_many(msgs)
+  # end _send
+
+  def _endpoint(self, name):
+    return _hubQueue(name)
+  # end _endpoint
+
+#end class InProcTransport
+#-----------------------------------------------------------------
+#
+# UnixReceiver
+#           purpose: the listening side of a unix socket endpoint,
+#                    readers parse the frames into an EventQueue
+#
+class UnixReceiver(object):
+
+  def __init__(self, path, chunk=65536):
+    self.path = path
+    self.chunk = chunk
+    self.queue = EventQueue()
+    if os.path.exists(path):          # stale socket of an earlier run
+      os.unlink(path)
+    self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.server.bind(path)
+    self.server.listen(16)
+    self.server.settimeout(0.2)
+    self.workers = []
+    self.acceptor = Worker(name="UnixAccept_%s" % path, target=self._accept)
+    self.acceptor.daemon = True
+    self.acceptor.start()
+  # end __init__
+  #-----------------------------------------------------------------
+  def _accept(self):
+    while not self.acceptor.stopping():
+      try:
+        conn, addr = self.server.accept()
+      except socket.timeout:
+        continue
+      except socket.error:
+        break
+      conn.settimeout(0.2)
+      worker = Worker(name="UnixRead_%s" % self.path, target=self._read,
+                      args=(conn,), token=self.acceptor.token)
+      worker.daemon = True
+      worker.start()
+      self.workers.append(worker)
+  # end _accept
+  #-----------------------------------------------------------------
+  def _read(self, conn):
+    pending = ''
+    stopping = self.acceptor.stopping
+    try:
+      while not stopping():
+        try:
+          data = conn.recv(self.chunk)
+        except socket.timeout:
+          continue
+        if not data:                  # sender closed
+          break
+        if pending:
+          data = pending + data
+        msgs = []
+        offset = 0
+        end = len(data)
+        while (end - offset >= FRAME.size):
+          length = FRAME.unpack_from(data, offset)[0]
+          start = offset + FRAME.size
+          if (end - start < length):
+            break
+          msgs.append(data[start:start + length])
+          offset = start + length
+        pending = data[offset:]
+        if msgs:
+          self.queue.put_many(msgs)
+    finally:
+      conn.close()
+  # end _read
+  #-----------------------------------------------------------------
+  def get_batch(self, max_items=None, timeout=None):
+    return self.queue.get_batch(max_items, timeout)
+  # end get_batch
+
+  def __len__(self):
+    return len(self.queue)
+  # end __len__
+
+  def close(self):
+    self.acceptor.stop()
+    self.server.close()
+    self.queue.close()
+    for worker in [self.acceptor] + self.workers:   # within their timeout
+      worker.shutdown(1.0)
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+  # end close
+
+#end class UnixReceiver
+#-----------------------------------------------------------------
+#
+# UnixSocketTransport
+#
+class UnixSocketTransport(Transport):
+
+  def __init__(self, host='localhost', port=None, sock_type=None,
+               userid=None, password=None, batch=256, directory=None):
+    Transport.__init__(self, host, port, sock_type, userid, password, batch)
+    if (directory == None):
+      directory = tempfile.gettempdir()
+    self.directory = directory
+    self.senders = {}                  # endpoint name -> connected socket
+    self.receivers = {}                # endpoint name -> UnixReceiver
+    self.lock = threading.Lock()       # one writer per socket
+  # end __init__
+  #-----------------------------------------------------------------
+  def path(self, name):
+    return os.path.join(self.directory,
+                        "scb-%s.sock" % re.sub(r'[^\w.-]', '_', name))
+  # end path
+  #-----------------------------------------------------------------
+  def _connect(self, name):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(self.path(name))
+    self.senders[name] = sock
+    return sock
+  # end _connect
+
+  def _send(self, name, msgs):
+    data = ''.join([FRAME.pack(len(msg)) + msg for msg in msgs])
+    self.lock.acquire()
+    try:
+      for attempt in (0, 1):           # once more on a stale connection
+        try:
+          sock = self.senders.get(name)
+          if (sock == None):
+            sock = self._connect(name)
+          sock.sendall(data)
+          return False
+        except socket.error as eobj:
+          sock = self.senders.pop(name, None)
+          if (sock != None):
+            sock.close()
+          if (attempt == 1) or not (eobj.errno in (errno.EPIPE, errno.ECONNRESET)):
+            print "Put(), %s: %s" % (self.path(name), eobj)
+            return True
+    finally:
+      self.lock.release()
+  # end _send
+  #-----------------------------------------------------------------
+  def _endpoint(self, name):
+    receiver = self.receivers.get(name)
+    if (receiver == None):
+      receiver = UnixReceiver(self.path(name))
+      self.receivers[name] = receiver
+    return receiver
+  # end _endpoint
+  #-----------------------------------------------------------------
+  def Close(self):
+    Transport.Close(self)
+    for receiver in self.receivers.values():
+      receiver.close()
+    self.receivers = {}
+    for sock in self.senders.values():
+      sock.close()
+    self.senders = {}
+  # end Close
+  CloseAll = Close
+
+#end class UnixSocketTransport
+#-----------------------------------------------------------------
+#
+# ShmRingTransport
+#           purpose: rings are named by exchange (rabbitmq shape) or by
+#                    host:port (zeromq shape); a subscription to a queue
+#                    reads the ring of the exchange the queue is bound to
+#
+class ShmRingTransport(Transport):
+
+  def __init__(self, host='localhost', port=None, sock_type=None,
+               userid=None, password=None, batch=256, directory=None,
+               capacity=scbRing.CAPACITY):
+    Transport.__init__(self, host, port, sock_type, userid, password, batch)
+    self.directory = directory
+    self.capacity = capacity
+    self.readers = {}                  # endpoint name -> RingReader
+  # end __init__
+  #-----------------------------------------------------------------
+  def _targets(self, exchange):
+    if (exchange == None):
+      exchange = self.name
+    if (exchange == None):
+      return []
+    return [exchange]
+  # end _targets
+
+  def _send(self, name, msgs):
+    try:
+      scbRing.writer(scbRing.ringPath(name, self.directory),
+                     self.capacity).put_many(msgs)
+    except (scbRing.RingError, EnvironmentError) as eobj:
+      print "Put(), %s: %s" % (name, eobj)
+      return True
+    return False
+  # end _send
+  #-----------------------------------------------------------------
+  def _endpoint(self, name):
+    reader = self.readers.get(name)
+    if (reader == None):
+      ring = name
+      for exchange, queues in self.bindings.items():
+        if name in queues:
+          ring = exchange
+          break
+      reader = scbRing.RingReader(scbRing.ringPath(ring, self.directory),
+                                  self.capacity)
+      self.readers[name] = reader
+    return reader
+  # end _endpoint
+  #-----------------------------------------------------------------
+  def Dropped(self):
+    #
+    # messages the readers of this transport lost to ring overruns
+    #
+    return sum([reader.dropped for reader in self.readers.values()])
+  # end Dropped
+
+  def Close(self):
+    Transport.Close(self)
+    for reader in self.readers.values():
+      reader.close()
+    self.readers = {}
+  # end Close
+  CloseAll = Close
+
+#end class ShmRingTransport
+#-----------------------------------------------------------------
+TRANSPORTS = {'inproc' : 'InProcTransport',    # [OPTIONS] Transport values
+              'unix'   : 'UnixSocketTransport',
+              'shm'    : 'ShmRingTransport'}
+#-----------------------------------------------------------------
@@ -17,12 +17,14 @@
      findMissing                        - returns functions present but not replaced
  
  class ExceptionString(Exception)       - returns string from exception
+
+ class peThread                         - periodic event, on the shared TimerWheel
 			 
 """
 
 import re                # regular expressions
-import KThread           # killable thread
 import time
+import TimerWheel        # timed events
 #
 #------------------------------------------------------------------------------
 # ExceptionString
@@ -215,57 +217,49 @@ class funcFromFile:
 #end class funcFromFile
 #-----------------------------------------------------------------
 #
-class peThread(KThread.KThread):
-
-  def __init__(self,interface,event_id,interval,maxcnt=None): 
-      KThread.KThread.__init__(self)   # the thread  
+class peThread(object):
+  #
+  # periodic event, kept for compatibility: the events are now timers
+  # on the shared TimerWheel, one thread for all of them and no drift
+  #
+  def __init__(self,interface,event_id,interval,maxcnt=None,wheel=None): 
       self.interface = interface       # the statechart
-      self.running   = False           # thread loop control
       self.event_id  = event_id        # the item of iterest
       self.interval  = interval        # period between sending events
       self.maxcnt    = maxcnt          # max number of events
-      self.counter   = 0               # counter to max
-      self.pause     = False           # allows pause without shutdown
+      self.wheel     = wheel           # None is the shared wheel
+      self.timer     = None
   # end __init__
   #-----------------------------------------------------------------
-  def run(self):                      # call .start() NOT .run()           
-      interface = self.interface
-      self.running = True         
-      while self.running: 
-        #
-        # might want to break up sleep into smaller 
-        # chunks to accomodate faster reaction to 
-        # suspend and resume
-        #
-        if (self.interval > 0):
-          time.sleep(self.interval)
-
-        if (self.pause):
-           continue
-          
-        interface.sendEvent(self.event_id)
-              
-        if not (self.interval > 0):
-           self.pause=True 
-        else:
-           if (self.maxcnt != None):
-             self.counter = self.counter + 1
-             if (self.counter >= self.maxcnt):
-               self.pause=True  
-  #end run
+  def start(self):
+      if (self.wheel == None):
+        self.wheel = TimerWheel.defaultWheel()
+      if not (self.interval > 0):      # once, straight away
+        self.timer = self.wheel.schedule(0,self.sendEvent,self.event_id)
+      else:
+        self.timer = self.wheel.schedule(self.interval,self.sendEvent,
+                                         self.event_id,period=self.interval,
+                                         count=self.maxcnt)
+  #end start
+  #-----------------------------------------------------------------
+  def sendEvent(self,event_id,event_data):
+      self.interface.sendEvent(event_id)
+  # end sendEvent
   #-----------------------------------------------------------------
   def suspend(self):
-     self.pause = True
+     if (self.timer != None):
+       self.timer.paused = True
   # end suspend
   #-----------------------------------------------------------------
   def resume(self):
-     self.pause = False
+     if (self.timer != None):
+       self.timer.paused = False
   # end resume
   #-----------------------------------------------------------------
   def shutdown(self):   
       print "periodic event thread shutting down"    
-      self.running = False 
-      self.kill()            # unexplained program exit, use pause
+      if (self.timer != None):
+        self.wheel.cancel(self.timer)
   #end shutdown
       
 #end class peThread 
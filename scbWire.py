@@ -0,0 +1,152 @@
+"""
+ scbWire
+
+ Design:
+
+ The purpose of this file is a compact binary encoding of events for the
+ 'BinaryData' port format. The text formats (AnyEvent, JsonData, YamlData)
+ send "<event_class.event>:<data>" and the receiver parses the name and
+ decodes the data with jsonpickle or yaml; at high message rates that
+ parsing is most of the cost of a port.
+  - a message is a fixed header followed by the payload:
+      event id   unsigned 32 bit
+      flags      unsigned 16 bit, the payload encoding (low byte)
+      timestamp  double, seconds since the epoch when encoded
+      length     unsigned 32 bit, payload bytes
+    in network byte order, HEADER_SIZE bytes
+  - the payload is marshal for the built-in types (None, numbers, strings,
+    lists, tuples, dicts, sets), str as is, cPickle for anything else
+  - unpickling runs code chosen by the sender, decode refuses pickled
+    payloads unless allow_pickle is set (the WirePickle option of the
+    design file), for ports whose peers are trusted
+  - decoding reads the header in place (struct unpack_from) and the
+    payload through a buffer, the message is not sliced or copied
+  - messages may be concatenated, decodeFrames walks a buffer of them
+
+ ---------------------------------------------
+
+ class WireError(Exception)
+ functions:
+    encode                  - event id and data to a message string
+    encodeInto              - same, into a bytearray at an offset
+    decode                  - message (str, buffer, bytearray) at an offset
+                              to (event_id, data, timestamp, next offset),
+                              pickled data only with allow_pickle
+    decodeHeader            - the header only
+    decodeFrames            - list of the messages of a buffer
+
+"""
+
+import time
+import struct
+import marshal
+import cPickle
+import cStringIO
+
+WIRE_FORMAT = 'BinaryData'               # port format name
+
+HEADER = struct.Struct('!IHdI')          # id, flags, timestamp, length
+HEADER_SIZE = HEADER.size
+
+PAYLOAD_NONE    = 0                      # no event data
+PAYLOAD_RAW     = 1                      # str, sent as is
+PAYLOAD_MARSHAL = 2                      # built-in types
+PAYLOAD_PICKLE  = 3                      # any picklable object
+PAYLOAD_MASK    = 0x00ff
+
+_MARSHAL_TYPES = (bool, int, long, float, complex, unicode,
+                  list, tuple, dict, set, frozenset)
+
+#-----------------------------------------------------------------
+# WireError
+#
+class WireError(Exception):
+  def __str__(self):
+    return repr(self.args[0])
+#end class WireError
+#-----------------------------------------------------------------
+#
+# payload
+#           purpose: returns (flags, payload string) for the event data
+#
+def payload(data):
+  if (data is None):
+    return PAYLOAD_NONE, ''
+  if (type(data) is str):
+    return PAYLOAD_RAW, data
+  if isinstance(data, _MARSHAL_TYPES):
+    try:
+      return PAYLOAD_MARSHAL, marshal.dumps(data)
+    except ValueError:                   # e.g. a list holding an object
+      pass
+  return PAYLOAD_PICKLE, cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+# end payload
+#-----------------------------------------------------------------
+def encode(event_id, data=None, timestamp=None):
+  if (timestamp == None):
+    timestamp = time.time()
+  flags, body = payload(data)
+  return HEADER.pack(event_id, flags, timestamp, len(body)) + body
+# end encode
+#-----------------------------------------------------------------
+def encodeInto(buf, offset, event_id, data=None, timestamp=None):
+  #
+  # buf is a bytearray, grown as needed, returns the next offset
+  #
+  if (timestamp == None):
+    timestamp = time.time()
+  flags, body = payload(data)
+  end = offset + HEADER_SIZE + len(body)
+  if (len(buf) < end):
+    buf.extend('\0' * (end - len(buf)))
+  HEADER.pack_into(buf, offset, event_id, flags, timestamp, len(body))
+  buf[offset + HEADER_SIZE:end] = body
+  return end
+# end encodeInto
+#-----------------------------------------------------------------
+def decodeHeader(buf, offset=0):
+  #
+  # returns (event_id, flags, timestamp, length)
+  #
+  if (len(buf) - offset < HEADER_SIZE):
+    raise WireError("short header: %d bytes" % (len(buf) - offset))
+  return HEADER.unpack_from(buf, offset)
+# end decodeHeader
+#-----------------------------------------------------------------
+def decode(buf, offset=0, allow_pickle=False):
+  #
+  # returns (event_id, data, timestamp, next offset)
+  #
+  event_id, flags, timestamp, length = decodeHeader(buf, offset)
+  start = offset + HEADER_SIZE
+  end = start + length
+  if (len(buf) < end):
+    raise WireError("short payload: %d of %d bytes" % (len(buf) - start, length))
+  kind = flags & PAYLOAD_MASK
+  if (kind == PAYLOAD_NONE):
+    data = None
+  elif (kind == PAYLOAD_RAW):
+    data = str(buffer(buf, start, length))
+  elif (kind == PAYLOAD_MARSHAL):
+    data = marshal.loads(buffer(buf, start, length))
+  elif (kind == PAYLOAD_PICKLE):
+    if (not allow_pickle):
+      raise WireError("event %d: pickled payload refused" % event_id)
+    data = cPickle.load(cStringIO.StringIO(buffer(buf, start, length)))
+  else:
+    raise WireError("unknown payload encoding %d" % kind)
+  return event_id, data, timestamp, end
+# end decode
+#-----------------------------------------------------------------
+def decodeFrames(buf, allow_pickle=False):
+  #
+  # returns [(event_id, data, timestamp), ...] for concatenated messages
+  #
+  frames = []
+  offset = 0
+  while (offset < len(buf)):
+    event_id, data, timestamp, offset = decode(buf, offset, allow_pickle)
+    frames.append((event_id, data, timestamp))
+  return frames
+# end decodeFrames
+#-----------------------------------------------------------------
@@ -0,0 +1,958 @@
+"""
+ unittests
+
+ Design:
+
+ The purpose of this file is to test the top level modules (the event
+ queue, the timers, the threads and the transports) the way
+ pystatecharts/unittests.py tests the statechart package.
+  - no broker, the tests use the local stand-ins of the modules
+  - threads are bounded, a test that would block forever fails on a
+    timeout instead
+
+ run from this directory: python unittests.py
+
+ ---------------------------------------------
+
+ class EventQueueTest              - EventQueue
+ class TimerWheelTest              - TimerWheel, StateTimers
+ class WorkerTest                  - Worker, StopToken
+ class WireTest                    - scbWire
+ class BrokerTestCase              - CommObject configured on a LocalBroker
+ class ConsumerTest                - pyrabbitmq Consumer
+ class PublishTest                 - pyrabbitmq BufferedPublisher, ConfigureAck
+ class ChannelPoolTest             - pyrabbitmq ChannelPool
+ class TransportTests              - round trips of a scbTransport class
+ class InProcTransportTest         - InProcTransport
+ class UnixSocketTransportTest     - UnixSocketTransport, UnixReceiver
+ class ShmRingTransportTest        - ShmRingTransport
+ class RingTest                    - scbRing
+ class IndexedListTest             - scbObjects IndexedList
+
+"""
+
+import time
+import uuid
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from EventQueue import EventQueue
+from TimerWheel import TimerWheel
+from TimerWheel import StateTimers
+from Worker import Worker
+from Worker import StopToken
+import scbWire
+from pyrabbitmq import CommObject
+from pyrabbitmq import LocalBroker
+from pyrabbitmq import BufferedPublisher
+import scbTransport
+import scbRing
+from scbObjects import NamedObject
+from scbObjects import IndexedList
+from pystatecharts.states import Statechart
+from pystatecharts.states import State
+from pystatecharts.states import Transition
+from pystatecharts.pseudostates import StartState
+from pystatecharts.transition import Event
+
+#-----------------------------------------------------------------
+# helpers
+#
+def startThread(target, *args):
+  thread = threading.Thread(target=target, args=args)
+  thread.daemon = True
+  thread.start()
+  return thread
+# end startThread
+#-----------------------------------------------------------------
+def waitFor(predicate, timeout=1.0):
+  deadline = time.time() + timeout
+  while (not predicate()) and (time.time() < deadline):
+    time.sleep(0.005)
+  return predicate()
+# end waitFor
+#-----------------------------------------------------------------
+#
+# EventQueueTest
+#
+class EventQueueTest(unittest.TestCase):
+
+  def testPutBlocksAtMaxlen(self):
+    queue = EventQueue(maxlen=2)
+    self.assertTrue(queue.put(1))
+    self.assertTrue(queue.put(2))
+    self.assertFalse(queue.put(3, block=False))
+    self.assertFalse(queue.put(3, timeout=0.05))
+    self.assertEquals(queue.refused, 2)
+
+    done = []
+    thread = startThread(lambda: done.append(queue.put(3)))
+    time.sleep(0.05)
+    self.assertEquals(done, [])              # still waiting for room
+    self.assertEquals(queue.get_batch(1), [1])
+    thread.join(1.0)
+    self.assertEquals(done, [True])
+    self.assertEquals(queue.get_batch(), [2, 3])
+  # end testPutBlocksAtMaxlen
+
+  def testPutManyBlocksAtMaxlen(self):
+    queue = EventQueue(maxlen=3)
+    self.assertTrue(queue.put_many([1, 2]))
+    self.assertFalse(queue.put_many([3, 4], timeout=0.05))
+    self.assertEquals(queue.refused, 2)
+    self.assertEquals(len(queue), 2)         # all or nothing
+
+    done = []
+    thread = startThread(lambda: done.append(queue.put_many([3, 4])))
+    time.sleep(0.05)
+    self.assertEquals(done, [])
+    self.assertEquals(queue.get_batch(1), [1])
+    thread.join(1.0)
+    self.assertEquals(done, [True])
+    self.assertEquals(queue.get_batch(), [2, 3, 4])
+  # end testPutManyBlocksAtMaxlen
+
+  def testGetBatchTimeout(self):
+    queue = EventQueue(batch=2)
+    start = time.time()
+    self.assertEquals(queue.get_batch(timeout=0.05), [])
+    self.assertTrue(time.time() - start >= 0.04)
+
+    queue.put_many([1, 2, 3])
+    self.assertEquals(queue.get_batch(), [1, 2])
+    self.assertEquals(queue.get_batch(timeout=0.05), [3])
+  # end testGetBatchTimeout
+
+  def testWaitBelow(self):
+    queue = EventQueue()
+    queue.put_many([1, 2, 3])
+    self.assertFalse(queue.wait_below(3, timeout=0.05))
+    self.assertTrue(queue.wait_below(4, timeout=0.05))
+
+    done = []
+    thread = startThread(lambda: done.append(queue.wait_below(2)))
+    time.sleep(0.05)
+    self.assertEquals(done, [])
+    queue.get_batch(2)
+    thread.join(1.0)
+    self.assertEquals(done, [True])
+  # end testWaitBelow
+
+  def testCloseWakesWaiters(self):
+    queue = EventQueue(maxlen=1)
+    queue.put(1)
+    got = []
+    put = []
+    empty = EventQueue()
+    getter = startThread(lambda: got.append(empty.get_batch()))
+    putter = startThread(lambda: put.append(queue.put(2)))
+    time.sleep(0.05)
+    self.assertEquals((got, put), ([], []))
+
+    empty.close()
+    queue.close()
+    getter.join(1.0)
+    putter.join(1.0)
+    self.assertEquals(got, [[]])
+    self.assertEquals(put, [False])
+    self.assertFalse(queue.put(3))           # closed refuses
+    self.assertEquals(queue.get_batch(), [1])  # but drains
+  # end testCloseWakesWaiters
+
+#end class EventQueueTest
+#-----------------------------------------------------------------
+#
+# TimerWheelTest
+#
+class TimerWheelTest(unittest.TestCase):
+
+  def setUp(self):
+    self.wheel = TimerWheel(tick=0.01, slots=16, levels=3)
+    self.fired = []
+  # end setUp
+
+  def sink(self, event_id, event_data):
+    self.fired.append((event_id, event_data))
+  # end sink
+
+  def at(self, ticks):
+    #
+    # time of a tick, advance() is given half ticks to stay clear of
+    # the rounding of the tick boundaries
+    #
+    return self.wheel.origin + ticks * self.wheel.tick_len
+  # end at
+
+  def testOneShot(self):
+    wheel = self.wheel
+    timer = wheel.schedule(0, self.sink, 1, "data", deadline=self.at(5.5))
+    self.assertTrue(timer.active())
+    self.assertEquals(wheel.advance(self.at(5.9)), 0)     # never early
+    self.assertEquals(wheel.advance(self.at(6.5)), 1)
+    self.assertEquals(self.fired, [(1, "data")])
+    self.assertFalse(timer.active())
+    self.assertEquals(len(wheel), 0)
+  # end testOneShot
+
+  def testCascade(self):
+    wheel = self.wheel                       # 16 ticks per level 0 turn
+    wheel.schedule(0, self.sink, 1, deadline=self.at(300))
+    self.assertEquals(wheel.advance(self.at(299.5)), 0)
+    self.assertEquals(wheel.advance(self.at(300.5)), 1)
+  # end testCascade
+
+  def testPeriodicDoesNotDrift(self):
+    wheel = self.wheel
+    timer = wheel.schedule(0, self.sink, 2, period=0.05, count=3,
+                           deadline=self.at(10))
+    fired = 0
+    for tick in range(10, 40, 5):            # 10 15 20 ...
+      fired += wheel.advance(self.at(tick + 0.5))
+    self.assertEquals(fired, 3)              # count is respected
+    self.assertFalse(timer.active())
+    self.assertAlmostEquals(timer.deadline, self.at(20), 6)
+  # end testPeriodicDoesNotDrift
+
+  def testCancel(self):
+    wheel = self.wheel
+    timer = wheel.schedule(0, self.sink, 1, deadline=self.at(5))
+    wheel.schedule(0, self.sink, 2, deadline=self.at(5), owner="A")
+    wheel.schedule(0, self.sink, 3, deadline=self.at(200), owner="A")
+    self.assertTrue(wheel.cancel(timer))
+    self.assertFalse(wheel.cancel(timer))
+    self.assertEquals(wheel.cancel_owner("A"), 2)
+    self.assertEquals(wheel.cancel_owner("A"), 0)
+    self.assertEquals(wheel.advance(self.at(300)), 0)
+    self.assertEquals(len(wheel), 0)
+  # end testCancel
+
+  def testStateTimers(self):
+    chart = Statechart(None)
+    start = StartState(chart)
+    A = State(chart, None, None, None)
+    B = State(chart, None, None, None)
+    Transition(start, A, None, None, None)
+    Transition(A, B, Event(1), None, None)
+    chart.start()
+
+    timers = StateTimers(self.wheel, chart.runtime)
+    timers.schedule(A, 0.05, self.sink, 7)
+    timers.schedule(B, 0.05, self.sink, 8)
+    chart.dispatch(Event(1))                  # leaves A
+    self.assertEquals(len(self.wheel), 1)
+    self.wheel.advance(time.time() + 1.0)
+    self.assertEquals(self.fired, [(8, None)])
+  # end testStateTimers
+
+  def testThread(self):
+    wheel = self.wheel
+    done = threading.Event()
+    wheel.start()
+    try:
+      wheel.schedule(0.02, lambda event_id, event_data: done.set(), 1)
+      self.assertTrue(done.wait(1.0) or done.is_set())
+    finally:
+      self.assertTrue(wheel.shutdown(1.0))
+  # end testThread
+
+#end class TimerWheelTest
+#-----------------------------------------------------------------
+#
+# WorkerTest
+#
+class WorkerTest(unittest.TestCase):
+
+  def testCooperativeStop(self):
+    queue = EventQueue()
+    got = []
+    received = threading.Event()
+    worker = None
+
+    def run():
+      while not worker.stopping():
+        got.extend(queue.get_batch())
+        if got:
+          received.set()
+
+    worker = Worker(name="WorkerTest", target=run, wake=queue.close)
+    worker.daemon = True
+    worker.start()
+    queue.put(1)
+    self.assertTrue(received.wait(1.0) or received.is_set())
+    start = time.time()
+    self.assertTrue(worker.shutdown(1.0))    # the wake unblocks get_batch
+    self.assertTrue(time.time() - start < 0.5)
+    self.assertEquals(got, [1])
+  # end testCooperativeStop
+
+  def testSharedToken(self):
+    token = StopToken()
+    workers = [Worker(target=token.wait, token=token) for ii in range(3)]
+    for worker in workers:
+      worker.daemon = True
+      worker.start()
+    workers[0].kill()                        # stops the token of all
+    for worker in workers:
+      worker.join(1.0)
+      self.assertFalse(worker.is_alive())
+    self.assertTrue(token.stopped())
+  # end testSharedToken
+
+  def testBoundedShutdown(self):
+    release = threading.Event()
+    worker = Worker(target=release.wait)      # ignores its token
+    worker.daemon = True
+    worker.start()
+    start = time.time()
+    self.assertFalse(worker.shutdown(0.05))   # reported, not waited on
+    self.assertTrue(time.time() - start < 0.5)
+    self.assertTrue(worker.stopping())
+    release.set()
+    worker.join(1.0)
+    self.assertTrue(worker.shutdown(0.05))
+  # end testBoundedShutdown
+
+#end class WorkerTest
+#-----------------------------------------------------------------
+#
+# WireTest
+#
+class Payload(object):                   # only pickle can encode it
+
+  def __init__(self, value):
+    self.value = value
+  # end __init__
+#end class Payload
+
+class WireTest(unittest.TestCase):
+
+  def testRoundTrip(self):
+    for data in [None, "raw\n", 7, 2.5, u"text", [1, "a"], {"k": (1, 2)}]:
+      msg = scbWire.encode(3, data, 100.0)
+      event_id, decoded, stamp, end = scbWire.decode(msg)
+      self.assertEquals((event_id, decoded, stamp, end),
+                        (3, data, 100.0, len(msg)))
+    msg = scbWire.encode(3, "raw")
+    self.assertEquals(scbWire.decode(buffer(msg))[1], "raw")
+    self.assertEquals(scbWire.decode(bytearray(msg))[1], "raw")
+  # end testRoundTrip
+
+  def testPickleRefused(self):
+    msg = scbWire.encode(4, Payload(9))
+    flags = scbWire.decodeHeader(msg)[1]
+    self.assertEquals(flags & scbWire.PAYLOAD_MASK, scbWire.PAYLOAD_PICKLE)
+    self.assertRaises(scbWire.WireError, scbWire.decode, msg)
+    self.assertRaises(scbWire.WireError, scbWire.decodeFrames, msg)
+    self.assertEquals(scbWire.decode(msg, 0, True)[1].value, 9)
+  # end testPickleRefused
+
+  def testShortMessages(self):
+    msg = scbWire.encode(5, "payload")
+    self.assertRaises(scbWire.WireError, scbWire.decode,
+                      msg[:scbWire.HEADER_SIZE - 1])
+    self.assertRaises(scbWire.WireError, scbWire.decode, msg[:-1])
+    self.assertRaises(scbWire.WireError, scbWire.decodeFrames, msg + msg[:3])
+  # end testShortMessages
+
+  def testFrames(self):
+    buf = bytearray()
+    offset = scbWire.encodeInto(buf, 0, 1, None, 1.0)
+    self.assertEquals(offset, scbWire.HEADER_SIZE)
+    offset = scbWire.encodeInto(buf, offset, 2, [1, 2], 2.0)
+    offset = scbWire.encodeInto(buf, offset, 3, "x", 3.0)
+    self.assertEquals(offset, len(buf))      # grown as needed
+    self.assertEquals(scbWire.decodeFrames(buf),
+                      [(1, None, 1.0), (2, [1, 2], 2.0), (3, "x", 3.0)])
+    self.assertEquals(str(buf[scbWire.HEADER_SIZE:]),
+                      scbWire.encode(2, [1, 2], 2.0) + scbWire.encode(3, "x", 3.0))
+  # end testFrames
+
+#end class WireTest
+#-----------------------------------------------------------------
+#
+# BrokerTestCase
+#           the acks of the configured channel are recorded in self.acks
+#
+class BrokerTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.broker = LocalBroker()
+    self.comm = CommObject(connect=lambda: self.broker)
+    self.assertFalse(self.comm.Configure([1, 'x', 'direct', 'q', 'k']))
+    self.channel = self.comm.chanMap[1]
+    self.acks = []
+    basic_ack = self.channel.basic_ack
+    def ack(delivery_tag, multiple=False):
+      self.acks.append((delivery_tag, multiple))
+      basic_ack(delivery_tag, multiple)
+    self.channel.basic_ack = ack
+  # end setUp
+
+  def publish(self, count):
+    self.assertFalse(self.comm.PutMany([str(ii) for ii in range(count)], 'x'))
+  # end publish
+
+  def queued(self):
+    return list(self.broker.queues['q'])
+  # end queued
+
+#end class BrokerTestCase
+#-----------------------------------------------------------------
+#
+# ConsumerTest
+#
+class ConsumerTest(BrokerTestCase):
+
+  def setUp(self):
+    BrokerTestCase.setUp(self)
+    self.batches = []
+    self.consumer = None
+  # end setUp
+
+  def tearDown(self):
+    if (self.consumer != None):
+      self.assertTrue(self.consumer.shutdown(1.0))
+  # end tearDown
+
+  def sink(self, msgs):
+    self.batches.append([msg.body for msg in msgs])
+  # end sink
+
+  def testPrefetch(self):
+    self.publish(10)
+    self.consumer = self.comm.Consume('q', self.sink, prefetch=4, ack=False)
+    self.assertTrue(waitFor(lambda: self.consumer.delivered == 4))
+    time.sleep(0.1)                          # nothing acked, nothing pushed
+    self.assertEquals(self.channel.prefetch, 4)
+    self.assertEquals(self.consumer.delivered, 4)
+    self.assertEquals(len(self.broker.queues['q']), 6)
+    self.comm.AckMany(self.channel, self.channel.last_tag)
+    self.assertTrue(waitFor(lambda: self.consumer.delivered == 8))
+    self.assertEquals(self.batches, [['0', '1', '2', '3'], ['4', '5', '6', '7']])
+  # end testPrefetch
+
+  def testBatchAck(self):
+    self.publish(10)
+    self.consumer = self.comm.Consume('q', self.sink, prefetch=8, batch=4)
+    self.assertTrue(waitFor(lambda: self.consumer.delivered == 10))
+    self.assertEquals([len(batch) for batch in self.batches], [4, 4, 2])
+    self.assertEquals(sum(self.batches, []), [str(ii) for ii in range(10)])
+    self.assertEquals(self.acks, [(4, True), (8, True), (10, True)])
+    self.assertEquals(self.channel.unacked, {})
+  # end testBatchAck
+
+  def testHighWater(self):
+    backlog = EventQueue()
+    def sink(msgs):
+      backlog.put_many([msg.body for msg in msgs])
+    self.publish(10)
+    self.consumer = self.comm.Consume('q', sink, prefetch=2, backlog=backlog,
+                                      high_water=4, low_water=2)
+    self.assertTrue(waitFor(lambda: self.consumer.paused == 1))
+    time.sleep(0.1)                          # held, the broker keeps the rest
+    self.assertEquals(self.consumer.delivered, 4)
+    self.assertEquals(len(backlog), 4)
+    self.assertEquals(len(self.broker.queues['q']), 4)
+    self.assertEquals(backlog.get_batch(2), ['0', '1'])
+    self.assertTrue(waitFor(lambda: self.consumer.paused == 2))
+    self.assertEquals(self.consumer.delivered, 6)
+    self.assertEquals(self.acks, [(2, True), (4, True), (6, True)])
+  # end testHighWater
+
+  def testSubscribe(self):
+    got = []
+    def callback(msg):
+      got.append(msg.body)
+      self.comm.Ack(msg.channel, msg.delivery_tag)
+    self.comm.ConfigureAck(every=2, interval=0.05)  # also the wait timeout
+    thread, event = self.comm.Subscribe('q', callback)
+    self.publish(3)
+    self.assertTrue(waitFor(lambda: len(got) == 3))
+    self.assertTrue(waitFor(lambda: len(self.acks) == 2))  # the last one is due
+    self.comm.Unsubscribe(thread, event)
+    thread.join(1.0)
+    self.assertFalse(thread.is_alive())
+    self.assertEquals(got, ['0', '1', '2'])
+    self.assertEquals(self.acks, [(2, True), (3, True)])
+  # end testSubscribe
+
+#end class ConsumerTest
+#-----------------------------------------------------------------
+#
+# PublishTest
+#
+class PublishTest(BrokerTestCase):
+
+  def testFlushOnSize(self):
+    publisher = BufferedPublisher(self.comm, size=3, deadline=0)
+    for ii in range(5):
+      self.assertFalse(publisher.Put(str(ii), 'x'))
+    self.assertEquals(self.queued(), ['0', '1', '2'])
+    self.assertFalse(publisher.Close())
+    self.assertEquals(self.queued(), ['0', '1', '2', '3', '4'])
+  # end testFlushOnSize
+
+  def testFlushOnDeadline(self):
+    wheel = TimerWheel(tick=0.01)            # advanced by hand
+    publisher = BufferedPublisher(self.comm, size=10, deadline=0.05, wheel=wheel)
+    publisher.Put('0', 'x')
+    publisher.Put('1', 'x')
+    self.assertEquals(len(wheel), 1)         # one timer for the buffer
+    wheel.advance(time.time())
+    self.assertEquals(self.queued(), [])
+    self.assertEquals(wheel.advance(time.time() + 0.1), 1)
+    self.assertEquals(self.queued(), ['0', '1'])
+    self.assertEquals(publisher.timer, None)
+    publisher.Put('2', 'x')
+    self.assertFalse(publisher.Flush())      # cancels the deadline
+    self.assertEquals(len(wheel), 0)
+    self.assertEquals(self.queued(), ['0', '1', '2'])
+  # end testFlushOnDeadline
+
+  def testAckEvery(self):
+    self.comm.ConfigureAck(every=3)
+    self.publish(7)
+    for ii in range(7):
+      self.assertEquals(self.comm.Get('q'), (False, True, str(ii)))
+    self.assertEquals(self.acks, [(3, True), (6, True)])
+    self.comm.FlushAcks()
+    self.assertEquals(self.acks, [(3, True), (6, True), (7, True)])
+    self.assertEquals(self.channel.unacked, {})
+  # end testAckEvery
+
+  def testAckInterval(self):
+    self.comm.ConfigureAck(every=100, interval=0.05)
+    self.publish(3)
+    self.comm.Get('q')
+    self.comm.Get('q')
+    self.comm.FlushAcks(due_only=True)       # not due yet
+    self.assertEquals(self.acks, [])
+    time.sleep(0.06)
+    self.comm.FlushAcks(due_only=True)
+    self.assertEquals(self.acks, [(2, True)])
+    self.comm.Get('q')                       # a new interval
+    self.assertEquals(self.acks, [(2, True)])
+    time.sleep(0.06)
+    self.publish(1)
+    self.comm.Get('q')                       # acked on the interval
+    self.assertEquals(self.acks, [(2, True), (4, True)])
+  # end testAckInterval
+
+#end class PublishTest
+#-----------------------------------------------------------------
+#
+# ChannelPoolTest
+#
+class ChannelPoolTest(BrokerTestCase):
+
+  def setUp(self):
+    BrokerTestCase.setUp(self)
+    self.connects = 0
+    self.comm.ConfigurePool(connections=2, connect=self.connect)
+  # end setUp
+
+  def connect(self):
+    self.connects += 1
+    return self.broker
+  # end connect
+
+  def testPerThread(self):
+    channels = self.broker.channels          # the configured one
+    def put(ii):
+      self.assertFalse(self.comm.Put(str(ii), 'x'))
+      self.assertFalse(self.comm.Put(str(ii), 'x'))  # on the same channel
+    threads = [startThread(put, ii) for ii in range(4)]
+    for thread in threads:
+      thread.join(1.0)
+    self.assertEquals(self.connects, 2)      # shared round robin
+    self.assertEquals(self.broker.channels - channels, 4)
+    self.assertEquals(len(self.queued()), 8)
+    self.assertEquals(self.acks, [])         # the configured channel is unused
+  # end testPerThread
+
+  def testRetry(self):
+    pool = self.comm.pool
+    self.assertFalse(self.comm.Put('0', 'x'))
+    def broken(msg, exchange='', routing_key=''):
+      raise IOError("connection reset")
+    pool.local.channel.basic_publish = broken
+    self.assertFalse(self.comm.PutMany(['1', '2'], 'x'))  # retried whole
+    self.assertEquals(pool.reconnects, 1)
+    self.assertEquals(self.connects, 2)
+    self.assertEquals(self.queued(), ['0', '1', '2'])
+    self.assertFalse(self.comm.Put('3', 'x'))              # the new channel
+    self.assertEquals(self.connects, 2)
+  # end testRetry
+
+  def testRetryFails(self):
+    pool = self.comm.pool
+    def connect():
+      self.connects += 1
+      raise IOError("connection refused")
+    pool.connect = connect
+    self.assertTrue(self.comm.Put('0', 'x'))
+    self.assertEquals(self.connects, 2)      # the put and its retry
+    self.assertEquals(self.queued(), [])
+  # end testRetryFails
+
+  def testSharedBrokenSlot(self):
+    self.comm.ConfigurePool(connections=1, connect=self.connect)
+    pool = self.comm.pool
+    self.assertFalse(self.comm.Put('0', 'x'))              # connects the slot
+    def broken():
+      raise IOError("connection reset")
+    self.broker.channel = broken             # the shared connection failed
+    def reconnect():
+      del self.broker.channel                # a new connection works
+      return self.connect()
+    pool.connect = reconnect
+    results = []
+    def put():
+      results.append(self.comm.Put('1', 'x'))  # first use of the slot
+    startThread(put).join(1.0)
+    self.assertEquals(results, [False])      # reconnected and retried
+    self.assertEquals(pool.reconnects, 1)
+    self.assertEquals(self.connects, 2)
+    self.assertEquals(self.queued(), ['0', '1'])
+  # end testSharedBrokenSlot
+
+#end class ChannelPoolTest
+#-----------------------------------------------------------------
+#
+# TransportTests
+#           the tests of a transport class, run by the test case of the
+#           class; the endpoint names are unique per test
+#
+class TransportTests(object):
+
+  def setUp(self):
+    self.prefix = uuid.uuid4().hex[:8]
+    self.transports = []
+    self.got = []
+  # end setUp
+
+  def tearDown(self):
+    for transport in self.transports:
+      transport.Close()
+  # end tearDown
+
+  def make(self, port=None):
+    transport = self.transport(port)
+    self.transports.append(transport)
+    return transport
+  # end make
+
+  def configured(self):
+    transport = self.make()
+    transport.Configure([1, 'x' + self.prefix, 'direct', 'q' + self.prefix, 'k'])
+    return transport, 'x' + self.prefix, 'q' + self.prefix
+  # end configured
+
+  def collect(self, msg):
+    self.got.append(msg)
+  # end collect
+
+  def wait(self, count):
+    self.assertTrue(waitFor(lambda: len(self.got) >= count))
+    time.sleep(0.02)                         # and no more
+    self.assertEquals(len(self.got), count)
+  # end wait
+
+  def testSubscribe(self):
+    transport, exchange, queue = self.configured()
+    worker, token = transport.Subscribe(queue, self.collect)
+    self.assertFalse(transport.Put('one', exchange))
+    self.assertFalse(transport.PutMany(['two', 'three'], exchange))
+    self.wait(3)
+    self.assertEquals([msg.body for msg in self.got], ['one', 'two', 'three'])
+    self.assertEquals([msg.delivery_tag for msg in self.got], [1, 2, 3])
+    self.assertTrue(self.got[0].channel is transport)
+    transport.Unsubscribe(worker, token)
+    self.assertFalse(worker.is_alive())
+  # end testSubscribe
+
+  def testSubscribeMany(self):
+    transport, exchange, queue = self.configured()
+    transport.SubscribeMany(queue, self.collect)
+    self.assertFalse(transport.PutMany([str(ii) for ii in range(5)], exchange))
+    self.assertTrue(waitFor(lambda: sum(map(len, self.got)) == 5))
+    self.assertEquals([msg.body for msg in sum(self.got, [])],
+                      [str(ii) for ii in range(5)])
+  # end testSubscribeMany
+
+  def testGet(self):
+    transport, exchange, queue = self.configured()
+    self.assertEquals(transport.Get(queue), (False, False, None))  # opens it
+    self.assertFalse(transport.PutMany(['one', 'two'], exchange))
+    self.assertTrue(waitFor(lambda: len(transport._endpoint(queue)) == 2))
+    self.assertEquals(transport.Get(queue), (False, True, 'one'))
+    self.assertEquals(transport.Get(queue), (False, True, 'two'))
+  # end testGet
+
+  def testUnbound(self):
+    transport, exchange, queue = self.configured()
+    self.assertTrue(transport.Put('one', 'unbound' + self.prefix))
+  # end testUnbound
+
+  def testGeventGet(self):
+    receiver = self.make(self.prefix)
+    sender = self.make(self.prefix)          # the same host:port
+    receiver.GeventGet(0, [self.collect])
+    self.assertFalse(sender.Put('one'))
+    self.assertFalse(sender.PutMany(['two', 'three']))
+    self.wait(3)
+    self.assertEquals(self.got, ['one', 'two', 'three'])
+  # end testGeventGet
+
+  def testSubscribeManyOwn(self):
+    receiver = self.make(self.prefix)
+    sender = self.make(self.prefix)
+    receiver.SubscribeMany(None, self.collect)
+    self.assertFalse(sender.PutMany(['one', 'two']))
+    self.assertTrue(waitFor(lambda: sum(map(len, self.got)) == 2))
+    self.assertEquals(sum(self.got, []), ['one', 'two'])
+  # end testSubscribeManyOwn
+
+  def testTopics(self):
+    receiver = self.make(self.prefix)
+    sender = self.make(self.prefix)
+    self.assertEquals(receiver.Subscribe(" ev1, ev2 "), None)
+    self.assertEquals(receiver.topics, ('ev1', 'ev2'))
+    receiver.GeventGet(0, [self.collect])
+    self.assertFalse(sender.PutMany(['ev1 a', 'ev3 b', 'ev2 c', 'x ev1']))
+    self.wait(2)
+    self.assertEquals(self.got, ['ev1 a', 'ev2 c'])
+  # end testTopics
+
+#end class TransportTests
+#-----------------------------------------------------------------
+#
+# InProcTransportTest
+#
+class InProcTransportTest(TransportTests, unittest.TestCase):
+
+  def transport(self, port):
+    return scbTransport.InProcTransport(port=port)
+  # end transport
+
+#end class InProcTransportTest
+#-----------------------------------------------------------------
+#
+# UnixSocketTransportTest
+#
+class UnixSocketTransportTest(TransportTests, unittest.TestCase):
+
+  def setUp(self):
+    TransportTests.setUp(self)
+    self.directory = tempfile.mkdtemp()
+  # end setUp
+
+  def tearDown(self):
+    TransportTests.tearDown(self)
+    shutil.rmtree(self.directory)
+  # end tearDown
+
+  def transport(self, port):
+    return scbTransport.UnixSocketTransport(port=port, directory=self.directory)
+  # end transport
+
+  def testSplitFrame(self):
+    path = "%s/split.sock" % self.directory
+    receiver = scbTransport.UnixReceiver(path)
+    try:
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      sock.connect(path)
+      frames = ''.join([scbTransport.FRAME.pack(len(msg)) + msg
+                        for msg in ['hello', 'world']])
+      for piece in [frames[:2], frames[2:6], frames[6:12], frames[12:]]:
+        sock.sendall(piece)                  # one recv per piece
+        time.sleep(0.02)
+      msgs = []
+      waitFor(lambda: msgs.extend(receiver.get_batch(None, 0)) or len(msgs) == 2)
+      self.assertEquals(msgs, ['hello', 'world'])
+      sock.close()
+    finally:
+      receiver.close()
+  # end testSplitFrame
+
+#end class UnixSocketTransportTest
+#-----------------------------------------------------------------
+#
+# ShmRingTransportTest
+#
+class ShmRingTransportTest(TransportTests, unittest.TestCase):
+
+  def setUp(self):
+    TransportTests.setUp(self)
+    self.directory = tempfile.mkdtemp()
+  # end setUp
+
+  def tearDown(self):
+    TransportTests.tearDown(self)
+    shutil.rmtree(self.directory)
+  # end tearDown
+
+  def transport(self, port):
+    return scbTransport.ShmRingTransport(port=port, directory=self.directory,
+                                         capacity=4096)
+  # end transport
+
+  def testUnbound(self):
+    transport, exchange, queue = self.configured()
+    reader = transport._endpoint('unbound' + self.prefix)  # a ring per exchange
+    self.assertFalse(transport.Put('one', 'unbound' + self.prefix))
+    self.assertEquals(reader.read(), ['one'])
+    self.assertEquals(transport.Dropped(), 0)
+  # end testUnbound
+
+#end class ShmRingTransportTest
+#-----------------------------------------------------------------
+#
+# RingTest
+#           capacity 1024: messages up to 240 bytes, a reader more than
+#           512 bytes behind the writer is overrun
+#
+class RingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = scbRing.ringPath('test', self.directory)
+    self.writer = scbRing.RingWriter(self.path, 1024)
+  # end setUp
+
+  def tearDown(self):
+    self.writer.close()
+    shutil.rmtree(self.directory)
+  # end tearDown
+
+  def testFanOut(self):
+    readers = [scbRing.RingReader(self.path) for ii in range(3)]
+    self.assertEquals(readers[0].capacity, 1024)   # of the existing ring
+    self.writer.put_many(['a', 'b', 'c'])
+    late = scbRing.RingReader(self.path)           # from now on
+    self.writer.put('d')
+    self.assertEquals(len(readers[0]), 4)
+    for reader in readers:
+      self.assertEquals(reader.read(), ['a', 'b', 'c', 'd'])
+      self.assertEquals(len(reader), 0)
+    self.assertEquals(late.read(), ['d'])
+    self.assertEquals(readers[0].get_batch(None, 0.01), [])
+  # end testFanOut
+
+  def testSequence(self):
+    reader = scbRing.RingReader(self.path)
+    self.writer.put_many(['a', 'bb', 'ccc'])
+    self.assertEquals(reader.read(2), ['a', 'bb'])
+    self.assertEquals(reader.sequence, 2)
+    self.assertEquals(reader.read(), ['ccc'])
+    self.assertEquals((reader.sequence, self.writer.sequence), (3, 3))
+    offset = scbRing.HEADER.size
+    self.assertEquals(scbRing.RECORD.unpack_from(self.writer.ring, offset), (1, 1))
+    offset += scbRing.RECORD.size + 8              # padded to 8 bytes
+    self.assertEquals(scbRing.RECORD.unpack_from(self.writer.ring, offset), (2, 2))
+    self.assertRaises(scbRing.RingError, self.writer.put, 'x' * 241)
+  # end testSequence
+
+  def testOverrun(self):
+    reader = scbRing.RingReader(self.path)
+    self.writer.put_many(['%08d' % ii for ii in range(40)])  # 960 bytes
+    self.assertEquals(reader.read(), [])
+    self.assertEquals(reader.dropped, 40)
+    self.writer.put('x')                           # resumed at the writer
+    self.assertEquals(reader.read(), ['x'])
+    self.assertEquals(reader.dropped, 40)
+  # end testOverrun
+
+  def testWraparound(self):
+    reader = scbRing.RingReader(self.path)
+    sent = []
+    got = []
+    for ii in range(200):                          # sizes 1 to 40 bytes
+      msgs = ['%d' % ii + 'x' * (ii % 40)] * 3
+      self.writer.put_many(msgs)
+      sent.extend(msgs)
+      got.extend(reader.read())
+    self.assertTrue(self.writer.position > 10 * 1024)
+    self.assertEquals(got, sent)
+    self.assertEquals(reader.dropped, 0)
+    self.writer.put('x' * 240)                     # the largest record
+    self.assertEquals(reader.read(), ['x' * 240])
+  # end testWraparound
+
+  def testWrapBoundary(self):
+    reader = scbRing.RingReader(self.path)
+    for count in (21, 21):                         # 1008 bytes, 16 left
+      self.writer.put_many(['x' * 8] * count)
+      self.assertEquals(len(reader.read()), count)
+    self.writer.put('y')                           # after a wrap marker
+    self.assertEquals(self.writer.position, 1024 + 24)
+    self.assertEquals(reader.read(), ['y'])
+    for count in (15, 16):                         # 992 bytes, 8 left
+      self.writer.put_many(['x' * 16] * count)
+      self.assertEquals(len(reader.read()), count)
+    self.assertEquals(self.writer.position, 2 * 1024 - 8)
+    self.writer.put('z')                           # no room for a marker
+    self.assertEquals(self.writer.position, 2 * 1024 + 24)
+    self.assertEquals(reader.read(), ['z'])
+    self.assertEquals(reader.dropped, 0)
+  # end testWrapBoundary
+
+#end class RingTest
+#-----------------------------------------------------------------
+#
+# IndexedListTest
+#
+class Named(object):
+
+  def __init__(self, name, events=()):
+    self.name = name
+    self.events = events
+  # end __init__
+#end class Named
+
+class IndexedListTest(unittest.TestCase):
+
+  def setUp(self):
+    self.items = [Named("port1", ["a", "b"]), Named("port10", ("b",)),
+                  Named("port2", ["c"])]
+    self.indexed = IndexedList(self.items)
+  # end setUp
+
+  def testSameShapes(self):
+    for args in [("name", "port10"), ("events", "b"), ("events", "x"),
+                 ("events", "b", "name", "port10")]:
+      for unique_f in (False, True):
+        self.assertEquals(
+          NamedObject.indexListMatch(self.indexed, *args, unique_f=unique_f),
+          NamedObject.indexListMatch(self.items, *args, unique_f=unique_f))
+        self.assertEquals(
+          NamedObject.namedListMatch(self.indexed, *args, unique_f=unique_f),
+          NamedObject.namedListMatch(self.items, *args, unique_f=unique_f))
+  # end testSameShapes
+
+  def testExactMatching(self):
+    self.assertEquals(NamedObject.indexListMatch(self.items, "name", "ort1")[0], [0])
+    self.assertEquals(self.indexed.indexMatch("name", "ort1"), ([], []))
+    self.indexed.append(object())            # no name
+    self.assertRaises(AttributeError, NamedObject.namedListMatch,
+                      list(self.indexed), "name", "port3")
+    self.assertEquals(self.indexed.namedMatch("name", "port3"), (False, []))
+  # end testExactMatching
+
+  def testReindex(self):
+    self.assertEquals(self.indexed.indexMatch("name", "port2")[0], [2])
+    self.items[2].name = "port3"
+    self.assertEquals(self.indexed.indexMatch("name", "port3"), ([], []))
+    self.indexed.reindex()
+    self.assertEquals(self.indexed.indexMatch("name", "port3")[0], [2])
+    del self.indexed[0]                      # drops the indexes
+    self.assertEquals(self.indexed.indexMatch("name", "port3")[0], [1])
+  # end testReindex
+
+#end class IndexedListTest
+#-----------------------------------------------------------------
+if __name__ == "__main__":
+  unittest.main()